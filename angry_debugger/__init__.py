@@ -28,15 +28,161 @@ import logging
 import threading
 import traceback
 import sys
-import time
 import inspect
 import functools
 from logging import NullHandler
 
+from .levels import (
+    LEVEL_TIME_IT,
+    LEVEL_ARGS,
+    LEVEL_RETURN,
+    LEVEL_CALL_FROM,
+    LEVEL_CALL_TO,
+    LEVEL_ANGRY,
+    LEVEL_MEMORY,
+    LEVEL_CPU,
+    HIGHEST_LEVEL,
+    get_level as _get_level
+)
+from .runs import (
+    start_logging_run,
+    end_logging_run,
+    logging_run,
+    RunRetention,
+    set_run_retention,
+    clear_run_retention,
+    RedundantCall,
+    set_redundant_call_detection,
+    emit as _emit,
+    push_call as _push_call,
+    pop_call as _pop_call,
+    current_run as _current_run
+)
 from .utils import (
     caller_name,
     get_line_and_file,
-    func_arg_string
+    format_exception,
+    time_ns,
+    perf_counter_ns,
+    thread_time_ns
+)
+from . import stats as _stats
+from . import memory as _memory
+from . import replay as _replay
+from . import lines as _lines
+from . import control as _control
+from .records import (
+    LOGGING_TEMPLATE,
+    CallRecord,
+    SpanRecord
+)
+from .memory import set_memory_sampling
+from .stats import (
+    FunctionStats,
+    get_stats,
+    get_function_stats,
+    reset_function_stats
+)
+from .handlers import (
+    NDJSONFormatter,
+    NDJSONHandler,
+    RingBufferHandler
+)
+from .chrome_trace import ChromeTraceHandler
+from .trace_store import (
+    TraceStore,
+    TraceStoreHandler
+)
+from .columnar import (
+    ColumnarHandler,
+    ColumnarTrace,
+    export_trace_store,
+    load_columns,
+    percentiles_by_callsite,
+    throughput,
+    concurrency
+)
+from .top import (
+    publish_stats,
+    unpublish_stats
+)
+from .locks import (
+    LockStats,
+    InstrumentedLock,
+    InstrumentedSemaphore,
+    watch_lock,
+    instrument_locks,
+    uninstrument_locks,
+    get_lock_stats,
+    reset_lock_stats,
+    format_lock_stats
+)
+from .replay import (
+    CaptureReader,
+    replay_capture,
+    flush_captures,
+    close_captures
+)
+from .watch import (
+    watch,
+    WatchedAttribute,
+    WatchStats,
+    get_watch_stats,
+    reset_watch_stats
+)
+from .spans import (
+    Span,
+    SpanTree
+)
+from .lines import (
+    LineStats,
+    get_line_stats,
+    reset_line_stats,
+    format_line_stats
+)
+from .memo import (
+    MemoStats,
+    get_memo_stats,
+    reset_memo_stats,
+    format_memo_report
+)
+from .control import (
+    CallSite,
+    get_callsites,
+    set_callsite_enabled,
+    set_callsite_threshold,
+    set_memo_analysis,
+    start_control,
+    stop_control
+)
+from .gc_pauses import (
+    GCStats,
+    track_gc_pauses,
+    untrack_gc_pauses,
+    get_gc_stats,
+    reset_gc_stats,
+    format_gc_report
+)
+from .io_wait import (
+    IOWait,
+    IOStats,
+    instrument_io,
+    uninstrument_io,
+    get_io_stats,
+    reset_io_stats,
+    format_io_report
+)
+from .sampler import (
+    Sampler,
+    start_sampling,
+    stop_sampling,
+    get_sampler,
+    format_sample_report
+)
+from .diff import (
+    TraceDiff,
+    load_recording,
+    diff_recordings
 )
 
 logger = logging.getLogger(__name__)
@@ -44,56 +190,8 @@ logger.addHandler(NullHandler())
 
 PY3 = sys.version_info[0] > 2
 
-LOGGING_TEMPLATE = '''\
-[{debug_type}] \
-{thread_name}\
-[{thread_id}]
-                          src: {calling_obj} [{calling_filename}:{calling_line_no}]
-                          dst: {called_obj} [{called_filename}:{called_line_no}]
-                          {msg}'''
-
-LEVEL_TIME_IT = 128
-LEVEL_ARGS = 256
-LEVEL_RETURN = 512
-LEVEL_CALL_FROM = 1024
-LEVEL_CALL_TO = 2048
-LEVEL_ANGRY = 3968
-
-logging.addLevelName(LEVEL_TIME_IT, 'TIME_IT')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_ARGS, 'TIME_IT | ARGS')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_ARGS | LEVEL_RETURN, 'TIME_IT | ARGS | RETURN')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_ARGS | LEVEL_RETURN | LEVEL_CALL_FROM, 'TIME_IT | ARGS | RETURN | CALL_FROM')
-logging.addLevelName(LEVEL_ANGRY, 'ANGRY')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_ARGS | LEVEL_RETURN | LEVEL_CALL_TO, 'TIME_IT | ARGS | RETURN | CALL_TO')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_ARGS | LEVEL_CALL_FROM, 'TIME_IT | ARGS | CALL_FROM')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_ARGS | LEVEL_CALL_FROM | LEVEL_CALL_TO, 'TIME_IT | ARGS | CALL_FROM | CALL_TO')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_ARGS | LEVEL_CALL_TO, 'TIME_IT | ARGS | CALL_TO')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_RETURN, 'TIME_IT | RETURN')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_RETURN | LEVEL_CALL_FROM, 'TIME_IT | RETURN | CALL_FROM')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_RETURN | LEVEL_CALL_FROM | LEVEL_CALL_TO, 'TIME_IT | RETURN | CALL_FROM | CALL_TO')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_RETURN | LEVEL_CALL_TO, 'TIME_IT | RETURN | CALL_TO')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_CALL_FROM, 'TIME_IT | CALL_FROM')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_CALL_FROM | LEVEL_CALL_TO, 'TIME_IT | CALL_FROM | CALL_TO')
-logging.addLevelName(LEVEL_TIME_IT | LEVEL_CALL_TO, 'TIME_IT | CALL_TO')
-logging.addLevelName(LEVEL_ARGS, 'ARGS')
-logging.addLevelName(LEVEL_ARGS | LEVEL_RETURN, 'ARGS | RETURN')
-logging.addLevelName(LEVEL_ARGS | LEVEL_RETURN | LEVEL_CALL_FROM, 'ARGS | RETURN | CALL_FROM')
-logging.addLevelName(LEVEL_ARGS | LEVEL_RETURN | LEVEL_CALL_FROM | LEVEL_CALL_TO, 'ARGS | RETURN | CALL_FROM | CALL_TO')
-logging.addLevelName(LEVEL_ARGS | LEVEL_RETURN | LEVEL_CALL_TO, 'ARGS | RETURN | CALL_TO')
-logging.addLevelName(LEVEL_ARGS | LEVEL_CALL_FROM, 'ARGS | CALL_FROM')
-logging.addLevelName(LEVEL_ARGS | LEVEL_CALL_FROM | LEVEL_CALL_TO, 'ARGS | CALL_FROM | CALL_TO')
-logging.addLevelName(LEVEL_ARGS | LEVEL_CALL_TO, 'ARGS | CALL_TO')
-logging.addLevelName(LEVEL_RETURN, 'RETURN')
-logging.addLevelName(LEVEL_RETURN | LEVEL_CALL_FROM, 'RETURN | CALL_FROM')
-logging.addLevelName(LEVEL_RETURN | LEVEL_CALL_FROM | LEVEL_CALL_TO, 'RETURN | CALL_FROM | CALL_TO')
-logging.addLevelName(LEVEL_RETURN | LEVEL_CALL_TO, 'RETURN | CALL_TO')
-logging.addLevelName(LEVEL_CALL_FROM, 'CALL_FROM')
-logging.addLevelName(LEVEL_CALL_FROM | LEVEL_CALL_TO, 'CALL_FROM | CALL_TO')
-logging.addLevelName(LEVEL_CALL_TO, 'CALL_TO')
-
-
-def _get_func_name(func):
-    func_location = caller_name(2)
+def _get_func_name(func, start=2):
+    func_location = caller_name(start)
     func_name = func.__name__
     func_module = func.__module__
 
@@ -105,37 +203,6 @@ def _get_func_name(func):
     return func_name, func_location, func_module, real_func_name
 
 
-def _get_duration(start, stop):
-    divider = 1.0
-    suffix = 'sec'
-    suffixes = [
-        'ms',
-        'us',
-        'ns',
-        'ps',
-        'fs',
-        'as',
-        'zs',
-        'ys'
-    ]
-
-    duration = 0
-    while suffixes:
-        duration = round((stop - start) * divider, 3)
-        if int(duration) > 0:
-            break
-
-        divider *= 1000.0
-        suffix = suffixes.pop(0)
-
-    if duration == 0:
-        duration = '                          duration: to fast to measure\n'
-    else:
-        duration = '                          duration: {0:.3f} {1}\n'.format(duration, suffix)
-
-    return duration
-
-
 def _run_func(
         lgr,
         func_name,
@@ -145,28 +212,65 @@ def _run_func(
         called_filename,
         called_line_no,
         obj_type,
+        site,
         func,
         *args,
         **kwargs
 ):
-    lgr_level = int(lgr.getEffectiveLevel())
+    enabled, threshold_ns, memo = site.plan
+
+    if not enabled:
+        return func(*args, **kwargs)
+
+    lgr_level = _get_level(lgr)
+
+    # every one of the flags is a single bit
+    if not lgr_level & HIGHEST_LEVEL:
+        # nothing gets logged, the call is only timed if the statistics are
+        # being published or the arguments are being analysed
+        if _stats._publisher is None:
+            if memo is None:
+                return func(*args, **kwargs)
+
+            stats = None
+        else:
+            stats = get_stats(real_func_name + obj_type)
+
+        start = perf_counter_ns()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            if stats is not None:
+                stats.add(perf_counter_ns() - start, True)
+            raise
+
+        duration_ns = perf_counter_ns() - start
+
+        if stats is not None:
+            stats.add(duration_ns)
+
+        if memo is not None:
+            memo.add(args, kwargs, duration_ns)
+
+        return result
 
     log_time_it = lgr_level | LEVEL_TIME_IT == lgr_level
     log_args = lgr_level | LEVEL_ARGS == lgr_level
     log_return = lgr_level | LEVEL_RETURN == lgr_level
     log_call_from = lgr_level | LEVEL_CALL_FROM == lgr_level
     log_call_to = lgr_level | LEVEL_CALL_TO == lgr_level
+    log_memory = lgr_level | LEVEL_MEMORY == lgr_level
+    log_cpu = lgr_level | LEVEL_CPU == lgr_level
 
-    if True not in (
-        log_time_it,
-        log_args,
-        log_return,
-        log_call_from,
-        log_call_to
-    ):
-        return func(*args, **kwargs)
+    if threshold_ns is None:
+        threshold_ns = _slow_call_threshold_ns
+
+    # only calls that take longer than the threshold get logged. Nothing
+    # that walks the stack or formats anything is done until the call has
+    # returned and it is known that it was slow.
+    deferred = threshold_ns is not None
 
-    if log_call_from:
+    if log_call_from and not deferred:
         calling_filename, calling_line_no = get_line_and_file(3)
         calling_obj = caller_name()
     else:
@@ -179,11 +283,7 @@ def _run_func(
         called_line_no = 'NOT LOGGED'
 
     thread = threading.current_thread()
-
-    if log_args:
-        arg_string = func_arg_string(func, args, kwargs)
-    else:
-        arg_string = ''
+    run = _current_run()
 
     if 'self' in kwargs:
         obj = kwargs['self']
@@ -212,45 +312,406 @@ def _run_func(
     else:
         called_obj = f_name
 
-    msg = 'function called: {0}{1}\n'.format(f_name, arg_string)
-
-    msg = LOGGING_TEMPLATE.format(
-        debug_type=logging.getLevelName(lgr_level),
-        thread_name=thread.getName(),
-        thread_id=thread.ident,
-        calling_obj=calling_obj,
-        calling_filename=calling_filename,
-        calling_line_no=calling_line_no,
-        called_obj=called_obj + obj_type,
-        called_filename=called_filename,
-        called_line_no=called_line_no,
-        msg=msg
+    record = CallRecord(
+        lgr_level,
+        thread,
+        calling_obj,
+        calling_filename,
+        calling_line_no,
+        called_obj + obj_type,
+        called_filename,
+        called_line_no,
+        f_name,
+        '',
+        time_ns(),
+        log_time_it,
+        run.run_id if run is not None else 0,
+        log_cpu
     )
+    stats = get_stats(real_func_name + obj_type)
 
-    if log_time_it:
-        start = time.time()
-        result = func(*args, **kwargs)
-        stop = time.time()
+    # the arguments and the return value are only formatted if the record
+    # gets written out, a run that is dropped or a call that was fast
+    # enough never formats them
+    if log_args:
+        record.set_args(func, args, kwargs)
 
-        msg += _get_duration(start, stop)
+    if log_memory:
+        memory_token = _memory.start()
+    else:
+        memory_token = None
 
+    if log_cpu:
+        cpu_start = thread_time_ns()
     else:
+        cpu_start = None
+
+    stack = _push_call(record)
+    if stack:
+        record.parent_id = stack[-1].span_id
+        record.depth = len(stack)
+
+    start = perf_counter_ns()
+    try:
         result = func(*args, **kwargs)
+    except BaseException:
+        stop = perf_counter_ns()
+        cpu_stop = thread_time_ns() if cpu_start is not None else None
+        stack = _pop_call(record)
+        record.exc_info = sys.exc_info()
+        _finish_call(record, stack, stats, stop - start, cpu_start, cpu_stop, memory_token)
+
+        if run is not None and run.fingerprints is not None:
+            run.add_call(real_func_name + obj_type, args, kwargs, stop - start)
+
+        if deferred:
+            if stop - start < threshold_ns:
+                raise
+
+            # the caller is still on the stack so this is the same depth
+            # it would have been before the call was made
+            if log_call_from:
+                record.calling_filename, record.calling_line_no = get_line_and_file(3)
+                record.calling_obj = caller_name()
+
+        _emit(lgr, lgr_level, record)
+        raise
+
+    stop = perf_counter_ns()
+    cpu_stop = thread_time_ns() if cpu_start is not None else None
+    stack = _pop_call(record)
+    _finish_call(record, stack, stats, stop - start, cpu_start, cpu_stop, memory_token)
+
+    if memo is not None:
+        memo.add(args, kwargs, stop - start)
+
+    if run is not None and run.fingerprints is not None:
+        run.add_call(real_func_name + obj_type, args, kwargs, stop - start)
+
+    if deferred:
+        if stop - start < threshold_ns:
+            return result
+
+        if log_call_from:
+            record.calling_filename, record.calling_line_no = get_line_and_file(3)
+            record.calling_obj = caller_name()
 
     if log_return:
-        msg += '                          {0} => {1}\n'.format(f_name, repr(result))
+        record.set_result(result)
 
-    if thread in _logging_runs:
-        _logging_runs[thread] += [[lgr, lgr_level, msg + '\n']]
-    elif _logging_runs:
-        _unknown_logging.append([lgr, lgr_level, msg + '\n'])
-    else:
-        lgr.log(lgr_level, msg + '\n')
+    _emit(lgr, lgr_level, record)
 
     return result
 
 
-def log_it(obj):
+_slow_call_threshold_ns = None
+
+
+def set_slow_call_threshold(threshold_ms):
+    """
+    Only log the calls that take at least `threshold_ms` milliseconds,
+    `None` turns it off. `log_it(threshold_ms=...)` overrides this for a
+    single function.
+
+    Every call is still timed and counted in the statistics. The caller,
+    the arguments and the return value are only looked at once the call has
+    returned and turned out to be slow, so the arguments are the objects as
+    they are when the call returns.
+    """
+    global _slow_call_threshold_ns
+
+    if threshold_ms is None:
+        _slow_call_threshold_ns = None
+    else:
+        _slow_call_threshold_ns = int(threshold_ms * 1000000)
+
+
+def _finish_call(record, stack, stats, duration_ns, cpu_start, cpu_stop, memory_token):
+    record.duration_ns = duration_ns
+
+    if stack:
+        # the call that made this one is what is left on top of the stack
+        stack[-1].child_ns += duration_ns
+
+    if cpu_stop is not None:
+        record.cpu_ns = cpu_stop - cpu_start
+        stats.add_cpu(record.cpu_ns, duration_ns)
+
+    if memory_token is not None:
+        record.blocks, record.peak_bytes = _memory.stop(memory_token)
+        stats.add_memory(record.blocks, record.peak_bytes)
+
+    if record.gc_count:
+        stats.add_gc(record.gc_ns, record.gc_count)
+
+    if record.io_count:
+        stats.add_io(record.io_ns, record.io_count, record.io_bytes)
+
+    stats.add(duration_ns, record.exc_info is not None)
+
+
+# a span does something if any one of these is set
+_SPAN_LEVELS = LEVEL_ANGRY | LEVEL_MEMORY | LEVEL_CPU
+
+
+_module_loggers = {}
+
+
+def _module_logger(glbs):
+    lgr = glbs.get('logger', None)
+
+    if not isinstance(lgr, logging.Logger):
+        lgr = glbs.get('LOGGER', None)
+
+    if isinstance(lgr, logging.Logger):
+        return lgr
+
+    # getLogger takes the logging lock, this gets looked up every time a
+    # span is entered.
+    name = glbs.get('__name__', None)
+    try:
+        return _module_loggers[name]
+    except KeyError:
+        lgr = _module_loggers[name] = logging.getLogger(name)
+        return lgr
+
+
+def _frame_name(frame):
+    module = frame.f_globals.get('__name__', '<string>')
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+
+    if name in ('<module>', '__main__'):
+        return module
+
+    return module + '.' + name.replace('.<locals>', '')
+
+
+def _start_span(lgr, lgr_level, name, frame, line_no, called_filename, called_line_no):
+    log_time_it = lgr_level | LEVEL_TIME_IT == lgr_level
+    log_call_to = lgr_level | LEVEL_CALL_TO == lgr_level
+    log_memory = lgr_level | LEVEL_MEMORY == lgr_level
+    log_cpu = lgr_level | LEVEL_CPU == lgr_level
+
+    if not log_call_to:
+        called_filename = 'NOT LOGGED'
+        called_line_no = 'NOT LOGGED'
+
+    thread = threading.current_thread()
+    run = _current_run()
+
+    # where the span is used from only gets filled in when the record is
+    # going to be logged, the frame is kept around until then.
+    record = SpanRecord(
+        lgr_level,
+        thread,
+        'NOT LOGGED',
+        'NOT LOGGED',
+        'NOT LOGGED',
+        name + ' (span)',
+        called_filename,
+        called_line_no,
+        name,
+        '',
+        time_ns(),
+        log_time_it,
+        run.run_id if run is not None else 0,
+        log_cpu
+    )
+    stats = get_stats(name + ' (span)')
+
+    if log_memory:
+        memory_token = _memory.start()
+    else:
+        memory_token = None
+
+    if log_cpu:
+        cpu_start = thread_time_ns()
+    else:
+        cpu_start = None
+
+    stack = _push_call(record)
+    if stack:
+        record.parent_id = stack[-1].span_id
+        record.depth = len(stack)
+
+    return (
+        lgr,
+        record,
+        stats,
+        frame,
+        line_no,
+        cpu_start,
+        memory_token,
+        perf_counter_ns()
+    )
+
+
+def _count_span(name):
+    # none of the flags are set, the span is only counted while the
+    # statistics are being published
+    if _stats._publisher is None:
+        return None
+
+    return get_stats(name + ' (span)'), perf_counter_ns()
+
+
+def _stop_span(state, exc_info):
+    stop = perf_counter_ns()
+
+    if len(state) == 2:
+        stats, start = state
+        stats.add(stop - start, exc_info[0] is not None)
+        return
+
+    lgr, record, stats, frame, line_no, cpu_start, memory_token, start = state
+    cpu_stop = thread_time_ns() if cpu_start is not None else None
+
+    stack = _pop_call(record)
+
+    if exc_info[0] is not None:
+        record.exc_info = exc_info
+
+    _finish_call(record, stack, stats, stop - start, cpu_start, cpu_stop, memory_token)
+
+    if (
+        _slow_call_threshold_ns is not None and
+        stop - start < _slow_call_threshold_ns
+    ):
+        return
+
+    if record.level | LEVEL_CALL_FROM == record.level:
+        record.calling_obj = _frame_name(frame)
+        record.calling_filename = frame.f_code.co_filename
+        record.calling_line_no = line_no
+
+    _emit(lgr, record.level, record)
+
+
+class span(object):
+    """
+    Times a block of code inside of a function.
+
+        def parse(data):
+            with angry_debugger.span('tokenize'):
+                tokens = tokenize(data)
+
+            with angry_debugger.span('build'):
+                return build(tokens)
+
+    It can also be used as a decorator
+
+        @angry_debugger.span('parse')
+        def parse(data):
+            ...
+
+    The record is the same as the one for a decorated call, it nests under
+    the decorated call or span it is made in, it is a part of the logging
+    run and it is counted in the statistics as `"<name> (span)"`. src is
+    the function the `with` statement is in, dst is the `with` statement
+    itself. For the decorator src is the caller and dst the function.
+
+    The level of the logger is looked at when the block is entered, if none
+    of the `LEVEL_*` flags are set the block is only timed while the
+    statistics are being published (`publish_stats`). The logger is
+    `logger` or `LOGGER` from the module the span is used in or the logger
+    named after the module, `logger` can be passed to use a different one.
+
+    A span object used as a context manager should not be shared between
+    threads, create it in the `with` statement.
+    """
+
+    def __init__(self, name, logger=None):
+        self.name = name
+        self._lgr = logger
+        self._states = []
+
+    def __enter__(self):
+        # noinspection PyProtectedMember
+        frame = sys._getframe(1)
+
+        if self._lgr is None:
+            lgr = _module_logger(frame.f_globals)
+        else:
+            lgr = self._lgr
+
+        lgr_level = _get_level(lgr)
+
+        if lgr_level & _SPAN_LEVELS:
+            line_no = frame.f_lineno
+            self._states.append(
+                _start_span(
+                    lgr,
+                    lgr_level,
+                    self.name,
+                    frame,
+                    line_no,
+                    frame.f_code.co_filename,
+                    line_no
+                )
+            )
+        else:
+            self._states.append(_count_span(self.name))
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        state = self._states.pop()
+
+        if state is not None:
+            _stop_span(state, (exc_type, exc_val, exc_tb))
+
+        return False
+
+    def __call__(self, func):
+        name = self.name
+
+        if self._lgr is None:
+            lgr = _module_logger(func.__globals__)
+        else:
+            lgr = self._lgr
+
+        called_filename = func.__code__.co_filename
+        called_line_no = func.__code__.co_firstlineno
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            lgr_level = _get_level(lgr)
+
+            if lgr_level & _SPAN_LEVELS:
+                # noinspection PyProtectedMember
+                frame = sys._getframe(1)
+                state = _start_span(
+                    lgr,
+                    lgr_level,
+                    name,
+                    frame,
+                    frame.f_lineno,
+                    called_filename,
+                    called_line_no
+                )
+            else:
+                state = _count_span(name)
+
+                if state is None:
+                    return func(*args, **kwargs)
+
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                _stop_span(state, sys.exc_info())
+                raise
+
+            _stop_span(state, (None, None, None))
+            return result
+
+        return wrapper
+
+
+_NOTHING = object()
+
+
+def log_it(obj=_NOTHING, **options):
     """
     OK so this is the skinny on how this works.
 
@@ -308,6 +769,27 @@ def log_it(obj):
     you will have a log entry when the data gets accessed or changed.
 
 
+    options can be passed to log_it by calling it with keyword arguments and using what it returns as the decorator.
+
+    @log_it(capture='some_function.capture', capture_limit=10000)
+    def some_function(data):
+        pass
+
+    capture: path to a file every call to the function gets captured to. The arguments are pickled before the call
+    and the return value or exception after it. The file can be replayed with `replay_capture` or
+    `python -m angry_debugger replay`. This works no matter what the logging level is set to. functions and
+    methods only.
+    capture_limit: stop capturing after this many calls.
+    threshold_ms: only log the calls that take at least this many milliseconds. The call is always timed but the
+    caller, the arguments and the return value are only collected once the call turns out to be slow.
+    `set_slow_call_threshold` does the same for every decorated function.
+    lines: time every line of the function. Only the function itself is traced, the hits and the time of each line
+    are added up over the calls and `format_line_stats` shows them next to the source. The lines are only timed
+    when LEVEL_TIME_IT is set. functions and methods only.
+    memo: measure how often the function is called with the same arguments and how much time `functools.lru_cache`
+    would save, see `format_memo_report`. This works no matter what the logging level is set to.
+
+
     No I am sure at some point or another you have had to deal ith the logging mess when running a multi
     threaded application. It is a daunting task to sift through the log having to piece together a log that makes sense.
 
@@ -317,6 +799,9 @@ def log_it(obj):
     and call `end_logging_run` when finished it is going to spit out anl logging done by using log_it in the order
     in which each step through your application was taken. it keeps everything all nice and neat and easy to understand.
     it also times how long it took for the complete run to take. This is nice for determining a bottleneck.
+    at the end of the run the decorated calls are shown as a tree in the order they were made with the total time
+    and the self time (total time minus the time spent in the decorated calls it made) of each one.
+    `end_logging_run` returns that tree as a `SpanTree`.
 
 
     This library uses the logging module which is a standard library included with Python. This is important if you
@@ -347,6 +832,10 @@ def log_it(obj):
     LEVEL_CALL_FROM: file and lone number information where the call was made from
     LEVEL_CALL_TO: file and line number information where the call was made to.
     LEVEL_ANGRY: all of the above
+    LEVEL_MEMORY: net number of allocated blocks for a call and, for a sample of the calls, the peak traced memory.
+    This one is not a part of LEVEL_ANGRY, use `LEVEL_ANGRY | LEVEL_MEMORY` to get everything.
+    LEVEL_CPU: CPU time used by the thread during a call next to the wall time and the share of the call that was
+    spent off of the CPU. A logging run reports the same for the whole run. This is not a part of LEVEL_ANGRY either.
 
     I created the logging levels so they can be combined by means of "bitwise or" `|`. So if you want to log the
     returned data and the passed arguments you would use  `LEVEL_ARGS | LEVEL_RETURN` `LEVEL_ANGRY` is the same as doing
@@ -387,9 +876,28 @@ def log_it(obj):
 
     """
 
-    called_filename, called_line_no = get_line_and_file()
+    if obj is _NOTHING:
+        # the decorator has to be named log_it and it has to call _log_it
+        # directly. The names and line numbers are pulled from the stack and
+        # this keeps the stack the same as when log_it is used without any
+        # options.
+        def log_it(o):
+            return _log_it(o, options)
+
+        return log_it
+
+    return _log_it(obj, options)
+
+
+def _log_it(obj, options):
+    called_filename, called_line_no = get_line_and_file(3)
     called_line_no += 1
 
+    if options.get('threshold_ms', None) is None:
+        threshold_ns = None
+    else:
+        threshold_ns = int(options['threshold_ms'] * 1000000)
+
     if isinstance(obj, property):
         fset = obj.fset
         fget = obj.fget
@@ -427,6 +935,13 @@ def log_it(obj):
 
                 self._lgr = lgr
 
+                self._site = _control.callsite(
+                    real_func_name + ' (deleter)',
+                    threshold_ns,
+                    options.get('memo', False),
+                    getattr(fdel_object, '__code__', None)
+                )
+
             def __call__(self, *args, **kwargs):
                 return _run_func(
                     self._lgr,
@@ -437,6 +952,7 @@ def log_it(obj):
                     called_filename,
                     called_line_no,
                     ' (deleter)',
+                    self._site,
                     self._fdel_object,
                     *args,
                     **kwargs
@@ -463,6 +979,13 @@ def log_it(obj):
                 if not isinstance(self._lgr, logging.Logger):
                     self._lgr = logging.getLogger(fset_object.__module__)
 
+                self._site = _control.callsite(
+                    real_func_name + ' (setter)',
+                    threshold_ns,
+                    options.get('memo', False),
+                    getattr(fset_object, '__code__', None)
+                )
+
             def __call__(self, *args, **kwargs):
 
                 return _run_func(
@@ -474,6 +997,7 @@ def log_it(obj):
                     called_filename,
                     called_line_no,
                     ' (setter)',
+                    self._site,
                     self._fset_object,
                     *args,
                     **kwargs
@@ -500,6 +1024,13 @@ def log_it(obj):
                 if not isinstance(self._lgr, logging.Logger):
                     self._lgr = logging.getLogger(fget_object.__module__)
 
+                self._site = _control.callsite(
+                    real_func_name + ' (getter)',
+                    threshold_ns,
+                    options.get('memo', False),
+                    getattr(fget_object, '__code__', None)
+                )
+
             def __call__(self, *args, **kwargs):
                 return _run_func(
                     self._lgr,
@@ -510,20 +1041,21 @@ def log_it(obj):
                     called_filename,
                     called_line_no,
                     ' (getter)',
+                    self._site,
                     self._fget_object,
                     *args,
                     **kwargs
                 )
 
         if fdel is not None:
-            func_name, func_location, func_module, real_func_name = _get_func_name(fdel)
+            func_name, func_location, func_module, real_func_name = _get_func_name(fdel, 3)
             return property(fget=fget, fset=fset, fdel=FDelWrapper(fdel), doc=doc)
 
         if fset is not None:
-            func_name, func_location, func_module, real_func_name = _get_func_name(fset)
+            func_name, func_location, func_module, real_func_name = _get_func_name(fset, 3)
             return property(fget=fget, fset=FSetWrapper(fset), fdel=fdel, doc=doc)
 
-        func_name, func_location, func_module, real_func_name = _get_func_name(fget)
+        func_name, func_location, func_module, real_func_name = _get_func_name(fget, 3)
         return property(FGetWrapper(fget), fset, doc=doc)
 
     elif inspect.isfunction(obj) or inspect.ismethod(obj):
@@ -538,29 +1070,91 @@ def log_it(obj):
         if not isinstance(lgr, logging.Logger):
             lgr = logging.getLogger(obj.__module__)
 
-        func_name, func_location, func_module, real_func_name = _get_func_name(obj)
+        func_name, func_location, func_module, real_func_name = _get_func_name(obj, 3)
+        site = _control.callsite(
+            real_func_name,
+            threshold_ns,
+            options.get('memo', False),
+            obj.__code__
+        )
 
-        def wrapper(*args, **kwargs):
+        if options.get('capture') or options.get('lines'):
+            if options.get('capture'):
+                capture = _replay.capture_writer(
+                    options['capture'],
+                    obj.__module__ + ':' + getattr(obj, '__qualname__', obj.__name__),
+                    options.get('capture_limit', None)
+                )
+            else:
+                capture = None
 
-            return _run_func(
-                lgr,
-                func_name,
-                func_location,
-                func_module,
-                real_func_name,
-                called_filename,
-                called_line_no,
-                '',
-                obj,
-                *args,
-                **kwargs
-            )
+            if options.get('lines'):
+                line_timer = _lines.LineTimer(real_func_name, obj, lgr)
+            else:
+                line_timer = None
+
+            def wrapper(*args, **kwargs):
+                if capture is not None:
+                    call_id = capture.before(args, kwargs)
+
+                if line_timer is not None:
+                    token = line_timer.start()
+
+                try:
+                    result = _run_func(
+                        lgr,
+                        func_name,
+                        func_location,
+                        func_module,
+                        real_func_name,
+                        called_filename,
+                        called_line_no,
+                        '',
+                        site,
+                        obj,
+                        *args,
+                        **kwargs
+                    )
+                except BaseException:
+                    if line_timer is not None:
+                        line_timer.stop(token)
+
+                    if capture is not None:
+                        capture.after(call_id, exc_info=sys.exc_info())
+                    raise
+
+                if line_timer is not None:
+                    line_timer.stop(token)
+
+                if capture is not None:
+                    capture.after(call_id, result)
+
+                return result
+
+        else:
+            def wrapper(*args, **kwargs):
+
+                return _run_func(
+                    lgr,
+                    func_name,
+                    func_location,
+                    func_module,
+                    real_func_name,
+                    called_filename,
+                    called_line_no,
+                    '',
+                    site,
+                    obj,
+                    *args,
+                    **kwargs
+                )
 
         wrapper = functools.update_wrapper(wrapper, obj)
         return wrapper
 
     elif inspect.isclass(obj):
-        func_name, func_location, func_module, real_func_name = _get_func_name(obj)
+        func_name, func_location, func_module, real_func_name = _get_func_name(obj, 3)
+        site = _control.callsite(real_func_name, threshold_ns, options.get('memo', False))
 
         if func_name:
             class_name = func_name + '.' + obj.__name__
@@ -577,6 +1171,7 @@ def log_it(obj):
                 called_filename,
                 called_line_no,
                 '',
+                site,
                 obj,
                 *args,
                 **kwargs
@@ -585,7 +1180,7 @@ def log_it(obj):
         return functools.update_wrapper(wrapper, obj)
     else:
         # noinspection PyProtectedMember
-        frame = sys._getframe().f_back
+        frame = sys._getframe(2)
         source = inspect.findsource(frame)[0]
         called_line_no -= 1
 
@@ -599,7 +1194,7 @@ def log_it(obj):
 
         symbol = source[called_line_no].split('=')[0].strip()
 
-        func_name = caller_name(1)
+        func_name = caller_name(2)
 
         if func_name:
             symbol_name = func_name + '.' + symbol
@@ -609,7 +1204,7 @@ def log_it(obj):
             symbol_name = symbol
 
         def get_wrapper(*_, **__):
-            lgr_level = int(lgr.getEffectiveLevel())
+            lgr_level = _get_level(lgr)
 
             log_call_from = lgr_level | LEVEL_CALL_FROM == lgr_level
             log_call_to = lgr_level | LEVEL_CALL_TO == lgr_level
@@ -651,17 +1246,12 @@ def log_it(obj):
                 msg=msg
             )
 
-            if thread in _logging_runs:
-                _logging_runs[thread] += [[lgr, lgr_level, msg + '\n']]
-            elif _logging_runs:
-                _unknown_logging.append([lgr, lgr_level, msg + '\n'])
-            else:
-                lgr.log(lgr_level, msg + '\n')
+            _emit(lgr, lgr_level, msg + '\n')
 
             return obj[0]
 
         def set_wrapper(self, value):
-            lgr_level = int(lgr.getEffectiveLevel())
+            lgr_level = _get_level(lgr)
 
             log_call_from = lgr_level | LEVEL_CALL_FROM == lgr_level
             log_call_to = lgr_level | LEVEL_CALL_TO == lgr_level
@@ -703,12 +1293,7 @@ def log_it(obj):
                 msg=msg
             )
 
-            if thread in _logging_runs:
-                _logging_runs[thread] += [[lgr, lgr_level, msg + '\n']]
-            elif _logging_runs:
-                _unknown_logging.append([lgr, lgr_level, msg + '\n'])
-            else:
-                lgr.log(lgr_level, msg + '\n')
+            _emit(lgr, lgr_level, msg + '\n')
 
             obj[0] = value
 
@@ -717,120 +1302,20 @@ def log_it(obj):
         return property(get_wrapper, set_wrapper)
 
 
-_logging_runs = {}
-_unknown_logging = []
-_logging_run_lock = threading.Lock()
-_logging_run_times = {}
-
-
-STAR_TEMPLATE = '*' * 20 + ' {0} Logging Run {1} ' + ('*' * 20) + '\n'
-
-
-def start_logging_run():
-    thread = threading.current_thread()
-
-    with _logging_run_lock:
-        for lgr, level, msg in _unknown_logging[:]:
-            _unknown_logging.remove([lgr, level, msg])
-            lgr.log(level, msg)
-
-        if thread in _logging_runs and _logging_runs[thread]:
-            started = False
-            lgr = None
-            level = None
-
-            for lgr, level, msg in _logging_runs[thread]:
-                if not started:
-                    started = True
-                    lgr.log(level, STAR_TEMPLATE.format('Start', thread.getName()))
-
-                lgr.log(level, msg)
-
-            start = _logging_run_times[thread]
-            stop = time.time()
-
-            msg = _get_duration(start, stop)
-            msg += STAR_TEMPLATE.format('Stop', thread.getName())
-
-            lgr.log(level, msg)
-
-        start = time.time()
-        _logging_run_times[thread] = start
-        _logging_runs[thread] = []
-
-
-def end_logging_run():
-    thread = threading.current_thread()
-    with _logging_run_lock:
-        for lgr, level, msg in _unknown_logging[:]:
-            _unknown_logging.remove([lgr, level, msg])
-            lgr.log(level, msg)
-
-        if thread in _logging_runs:
-            if _logging_runs[thread]:
-                started = False
-                lgr = None
-                level = None
-
-                for lgr, level, msg in _logging_runs[thread]:
-                    if not started:
-                        started = True
-                        lgr.log(level, STAR_TEMPLATE.format('Start', thread.getName()))
-                    lgr.log(level, msg)
-
-                start = _logging_run_times[thread]
-                stop = time.time()
-                msg = _get_duration(start, stop)
-                msg += STAR_TEMPLATE.format('Stop', thread.getName())
-
-                lgr.log(level, msg)
-
-            del _logging_run_times[thread]
-            del _logging_runs[thread]
-
-
-def logging_run(func):
-    def wrapper(*args, **kwargs):
-        start_logging_run()
-        result = func(*args, **kwargs)
-        end_logging_run()
-        return result
-
-    return wrapper
-
-
 # This is rather odd to see.
 # I am using sys.excepthook to alter the displayed traceback data.
 # The reason why I am doing this is to remove any lines that are generated
-# from any of the code in this file. It adds a lot of complexity to the
-# output traceback when any lines generated from this file do not really need
-# to be displayed.
+# from any of the code in this package. It adds a lot of complexity to the
+# output traceback when any lines generated from this package do not really
+# need to be displayed. The frames are filtered before anything is formatted.
 
 def trace_back_hook(tb_type, tb_value, tb):
-    tb = "".join(
-        traceback.format_exception(
-            tb_type,
-            tb_value,
-            tb,
-        )
-    )
     if tb_type == DeprecationWarning:
-        sys.stderr.write(tb)
+        tb = traceback.format_exception(tb_type, tb_value, tb)
     else:
-        new_tb = []
-        skip = False
-        for line in tb.split('\n'):
-            if line.strip().startswith('File'):
-                if __file__ in line:
-                    skip = True
-                else:
-                    skip = False
-            if skip:
-                continue
-
-            new_tb += [line]
+        tb = format_exception(tb_type, tb_value, tb)
 
-        sys.stderr.write('\n'.join(new_tb))
+    sys.stderr.write(''.join(tb))
 
 
 _old_except_hook = sys.excepthook
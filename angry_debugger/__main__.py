@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: command line tools
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import sys
+import argparse
+
+from . import trace_store
+from . import top
+from . import replay
+from . import diff
+from . import control
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m angry_debugger')
+    subparsers = parser.add_subparsers()
+
+    trace_store.add_query_parser(subparsers)
+    top.add_top_parser(subparsers)
+    replay.add_replay_parser(subparsers)
+    diff.add_diff_parser(subparsers)
+    control.add_ctl_parser(subparsers)
+
+    args = parser.parse_args(argv)
+
+    if not hasattr(args, 'command'):
+        parser.print_help()
+        return 2
+
+    return args.command(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
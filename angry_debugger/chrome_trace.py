@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: Chrome Trace Event Format output
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import os
+import io
+import sys
+import json
+import logging
+
+from .records import CallRecord
+from .runs import RunRecord
+from .locks import LockRecord
+
+
+def _us(value_ns):
+    return value_ns / 1000.0
+
+
+def _args(**kwargs):
+    # "NOT LOGGED" and empty values are left out, the viewers show every
+    # arg there is and they only get in the way.
+    return dict(
+        (key, value) for key, value in kwargs.items()
+        if value not in (None, '', 'NOT LOGGED')
+    )
+
+
+def call_event(record, pid):
+    return dict(
+        name=record.called_obj,
+        cat='log_it',
+        ph='X',
+        ts=_us(record.timestamp_ns),
+        dur=_us(record.duration_ns or 0),
+        pid=pid,
+        tid=record.thread_id,
+        args=_args(
+            src=record.calling_obj,
+            src_file=record.calling_filename,
+            src_line=record.calling_line_no,
+            dst_file=record.called_filename,
+            dst_line=record.called_line_no,
+            args=record.arg_string,
+            result=record.result,
+            exception=record.exception,
+            run_id=record.run_id or None,
+            span_id=record.span_id,
+            parent_id=record.parent_id or None,
+            self_ns=record.self_ns,
+            cpu_ns=record.cpu_ns,
+            blocks=record.blocks,
+            peak_bytes=record.peak_bytes,
+            gc_ns=record.gc_ns or None,
+            io_ns=record.io_ns or None,
+            io_bytes=record.io_bytes or None
+        )
+    )
+
+
+def run_event(record, pid):
+    return dict(
+        name='logging run {0}'.format(record.run_id),
+        cat='logging_run',
+        ph='X',
+        ts=_us(record.start_ns),
+        dur=_us(record.stop_ns - record.start_ns),
+        pid=pid,
+        tid=record.thread_id,
+        args=dict(run_id=record.run_id)
+    )
+
+
+def lock_event(record, pid):
+    return dict(
+        name='lock ' + record.name,
+        cat='lock',
+        ph='X',
+        ts=_us(record.timestamp_ns - record.hold_ns),
+        dur=_us(record.hold_ns),
+        pid=pid,
+        tid=record.thread_id,
+        args=_args(
+            holder=record.holder,
+            wait_ns=record.wait_ns if record.contended else None
+        )
+    )
+
+
+class ChromeTraceHandler(logging.Handler):
+    """
+    Writes records as Chrome Trace Event Format JSON so they can be loaded
+    into Perfetto (https://ui.perfetto.dev) or chrome://tracing.
+
+    handler = angry_debugger.ChromeTraceHandler('trace.json')
+    logging.getLogger().addHandler(handler)
+
+    Every decorated call is a complete ("X") event on the thread that made
+    it, every logging run is one as well so the calls made during a run sit
+    under it. Lock records are written as the time the lock was held. Any
+    other message is an instant event.
+
+    Events are written as they come in using the JSON array format, nothing
+    is held in memory. The closing bracket is written when the handler is
+    closed, both viewers will load the file without it if the process never
+    got that far.
+    """
+
+    def __init__(self, filename):
+        logging.Handler.__init__(self)
+        self.filename = os.path.abspath(filename)
+        self.pid = os.getpid()
+        self._stream = None
+        self._threads = set()
+
+    def _open(self):
+        self._stream = io.open(self.filename, 'w', encoding='utf-8')
+        self._stream.write(u'[\n')
+        self._write_event(
+            dict(
+                name='process_name',
+                ph='M',
+                pid=self.pid,
+                args=dict(name=os.path.basename(sys.argv[0]) or 'python')
+            ),
+            first=True
+        )
+
+    def _write_event(self, event, first=False):
+        data = json.dumps(event, separators=(',', ':'), default=str)
+
+        if first:
+            self._stream.write(data)
+        else:
+            self._stream.write(u',\n' + data)
+
+    def _thread(self, thread_id, thread_name):
+        # the viewers show the thread id unless the thread is given a name
+        if thread_id in self._threads:
+            return
+
+        self._threads.add(thread_id)
+        self._write_event(
+            dict(
+                name='thread_name',
+                ph='M',
+                pid=self.pid,
+                tid=thread_id,
+                args=dict(name=thread_name)
+            )
+        )
+
+    def emit(self, record):
+        try:
+            msg = record.msg
+
+            if isinstance(msg, CallRecord):
+                event = call_event(msg, self.pid)
+            elif isinstance(msg, RunRecord):
+                if msg.kind != 'stop':
+                    return
+
+                event = run_event(msg, self.pid)
+            elif isinstance(msg, LockRecord):
+                event = lock_event(msg, self.pid)
+            else:
+                msg = None
+                event = dict(
+                    name=record.getMessage().strip().split('\n', 1)[0],
+                    cat='log',
+                    ph='i',
+                    s='t',
+                    ts=record.created * 1000000.0,
+                    pid=self.pid,
+                    tid=record.thread,
+                    args=dict(msg=record.getMessage().strip())
+                )
+
+            self.acquire()
+            try:
+                if self._stream is None:
+                    self._open()
+
+                if msg is None:
+                    self._thread(record.thread, record.threadName)
+                else:
+                    self._thread(msg.thread_id, msg.thread_name)
+
+                self._write_event(event)
+            finally:
+                self.release()
+
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._stream is not None:
+                self._stream.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self._stream is not None:
+                self._stream.write(u'\n]\n')
+                self._stream.close()
+                self._stream = None
+        finally:
+            self.release()
+
+        logging.Handler.close(self)
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: columnar export of the records for NumPy
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import os
+import sys
+import json
+import array
+import struct
+import logging
+
+from .records import CallRecord
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# A columnar export is a directory with one .npy file for every column and
+# a string table. The .npy files are written without NumPy, NumPy is only
+# needed to load them. Every file has a fixed size header that gets
+# rewritten with the number of rows after the rows have been written, so
+# the files can be loaded while they are still being written to.
+#
+# start_ns.npy   int64  wall clock time the call was made
+# stop_ns.npy    int64  start_ns + the duration (the same as start_ns when
+#                       the call was not timed)
+# thread.npy     int32  index into "threads" of the string table
+# callsite.npy   int32  index into "callsites" of the string table
+# span_id.npy    int64  span id of the call
+# parent_id.npy  int64  span id of the decorated call that made it, 0 if none
+# run_id.npy     int32  logging run id, 0 if none
+# error.npy      int8   1 if the call raised an exception
+# strings.json   {"callsites": [...], "threads": [[ident, name], ...]}
+
+COLUMNS = (
+    ('start_ns', 'q', '<i8'),
+    ('stop_ns', 'q', '<i8'),
+    ('thread', 'i', '<i4'),
+    ('callsite', 'i', '<i4'),
+    ('span_id', 'q', '<i8'),
+    ('parent_id', 'q', '<i8'),
+    ('run_id', 'i', '<i4'),
+    ('error', 'b', '|i1')
+)
+
+STRINGS_FILE = 'strings.json'
+
+_NPY_MAGIC = b'\x93NUMPY\x01\x00'
+_NPY_HEADER_SIZE = 128
+
+
+def _npy_header(descr, rows):
+    header = "{{'descr': '{0}', 'fortran_order': False, 'shape': ({1},), }}".format(
+        descr,
+        rows
+    )
+    # the header is padded with spaces to a fixed size so it can be
+    # rewritten in place, it has to end with a newline
+    size = _NPY_HEADER_SIZE - len(_NPY_MAGIC) - 2
+    header = header.ljust(size - 1) + '\n'
+
+    return _NPY_MAGIC + struct.pack('<H', size) + header.encode('latin1')
+
+
+class ColumnarWriter(object):
+    """
+    Writes call records to a columnar export.
+
+    The rows are held in `array.array` buffers and written out by `flush`.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.rows = 0
+        self.callsites = []
+        self.threads = []
+        self._callsite_ids = {}
+        self._thread_ids = {}
+        self._strings_changed = True
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        self._buffers = []
+        self._files = []
+
+        for name, typecode, descr in COLUMNS:
+            f = open(os.path.join(self.directory, name + '.npy'), 'wb')
+            f.write(_npy_header(descr, 0))
+            f.flush()
+            self._files.append((f, descr))
+            self._buffers.append(array.array(typecode))
+
+        # an empty export can be loaded as soon as the writer is made
+        self.flush()
+
+    def _callsite_id(self, name):
+        try:
+            return self._callsite_ids[name]
+        except KeyError:
+            callsite_id = self._callsite_ids[name] = len(self.callsites)
+            self.callsites.append(name)
+            self._strings_changed = True
+            return callsite_id
+
+    def _thread_id(self, ident, name):
+        try:
+            return self._thread_ids[ident]
+        except KeyError:
+            thread_id = self._thread_ids[ident] = len(self.threads)
+            self.threads.append([ident, name])
+            self._strings_changed = True
+            return thread_id
+
+    def write(self, record):
+        start_ns = record.timestamp_ns
+        buffers = self._buffers
+
+        buffers[0].append(start_ns)
+        buffers[1].append(start_ns + (record.duration_ns or 0))
+        buffers[2].append(self._thread_id(record.thread_id, record.thread_name))
+        buffers[3].append(self._callsite_id(record.called_obj))
+        buffers[4].append(record.span_id)
+        buffers[5].append(record.parent_id or 0)
+        buffers[6].append(record.run_id or 0)
+        buffers[7].append(record.exc_info is not None)
+
+    def __len__(self):
+        return self.rows + len(self._buffers[0])
+
+    def flush(self):
+        pending = len(self._buffers[0])
+
+        if self._strings_changed:
+            # the string table is written first so every id a reader can
+            # see is in it
+            path = os.path.join(self.directory, STRINGS_FILE)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(dict(callsites=self.callsites, threads=self.threads), f)
+
+            if os.path.exists(path):
+                os.remove(path)
+
+            os.rename(path + '.tmp', path)
+            self._strings_changed = False
+
+        if not pending:
+            return
+
+        self.rows += pending
+
+        for (f, descr), buf in zip(self._files, self._buffers):
+            if sys.byteorder == 'big' and buf.itemsize > 1:
+                buf.byteswap()
+
+            f.seek(0, os.SEEK_END)
+            f.write(buf.tostring() if not hasattr(buf, 'tobytes') else buf.tobytes())
+            f.flush()
+
+            # the rows have to be in the file before the header says so
+            f.seek(0)
+            f.write(_npy_header(descr, self.rows))
+            f.flush()
+
+            del buf[:]
+
+    def close(self):
+        self.flush()
+
+        for f, _ in self._files:
+            f.close()
+
+        self._files = []
+
+
+class ColumnarHandler(logging.Handler):
+    """
+    Logging handler that writes the records made by `log_it` to a columnar
+    export that can be loaded with `load_columns`. Any other record is
+    ignored.
+
+    handler = angry_debugger.ColumnarHandler('trace_columns')
+    logging.getLogger().addHandler(handler)
+
+    Only a few numbers are kept for each record, nothing gets formatted.
+    The rows are written out every `flush_every` records.
+    """
+
+    def __init__(self, directory, flush_every=65536):
+        logging.Handler.__init__(self)
+        self._writer = ColumnarWriter(directory)
+        self._flush_every = flush_every
+
+    def emit(self, record):
+        if not isinstance(record.msg, CallRecord):
+            return
+
+        try:
+            self._writer.write(record.msg)
+
+            if len(self._writer._buffers[0]) >= self._flush_every:
+                self._writer.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._writer.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            self._writer.close()
+        finally:
+            self.release()
+
+        logging.Handler.close(self)
+
+
+def export_trace_store(path, directory):
+    """
+    Converts a trace store to a columnar export. The index of a trace store
+    does not have the span ids so `span_id` and `parent_id` are all 0.
+    Returns the number of rows.
+    """
+    from .trace_store import TraceStore
+
+    writer = ColumnarWriter(directory)
+    buffers = writer._buffers
+
+    with TraceStore(path) as store:
+        for entry in store.entries():
+            buffers[0].append(entry.timestamp_ns)
+            buffers[1].append(entry.timestamp_ns + entry.duration_ns)
+            buffers[2].append(writer._thread_id(entry.thread_id, ''))
+            buffers[3].append(
+                writer._callsite_id(store.func_names.get(entry.func_id, ''))
+            )
+            buffers[4].append(0)
+            buffers[5].append(0)
+            buffers[6].append(entry.run_id)
+            # the error flag is not in the index either
+            buffers[7].append(0)
+
+            if len(buffers[0]) >= 65536:
+                writer.flush()
+
+    writer.close()
+    return writer.rows
+
+
+def _need_numpy():
+    if numpy is None:
+        raise RuntimeError('loading a columnar export needs NumPy')
+
+
+class ColumnarTrace(object):
+    """
+    A loaded columnar export. Every column is a NumPy array of the same
+    length, `callsites` and `threads` are the string table.
+    """
+
+    def __init__(self, columns, callsites, threads):
+        self.columns = columns
+        self.callsites = callsites
+        self.threads = threads
+
+        for name, value in columns.items():
+            setattr(self, name, value)
+
+    def __len__(self):
+        return len(self.start_ns)
+
+    @property
+    def duration_ns(self):
+        return self.stop_ns - self.start_ns
+
+    def callsite_id(self, name):
+        return self.callsites.index(name)
+
+    def select(self, mask):
+        """
+        A trace with only the rows where `mask` is true.
+        """
+        return ColumnarTrace(
+            dict((name, value[mask]) for name, value in self.columns.items()),
+            self.callsites,
+            self.threads
+        )
+
+    def save_npz(self, path, compressed=False):
+        """
+        Writes the trace to a single .npz file, `load_columns` loads it.
+        """
+        strings = json.dumps(dict(callsites=self.callsites, threads=self.threads))
+        save = numpy.savez_compressed if compressed else numpy.savez
+        save(path, strings=numpy.array(strings), **self.columns)
+
+
+def load_columns(path, mmap=True):
+    """
+    Loads a columnar export directory or a .npz written by
+    `ColumnarTrace.save_npz`. The .npy files are memory mapped unless
+    `mmap` is `False` so only the parts that get used are read from the
+    disk.
+    """
+    _need_numpy()
+
+    if os.path.isdir(path):
+        with open(os.path.join(path, STRINGS_FILE)) as f:
+            strings = json.load(f)
+
+        columns = dict(
+            (
+                name,
+                numpy.load(
+                    os.path.join(path, name + '.npy'),
+                    mmap_mode='r' if mmap else None
+                )
+            )
+            for name, _, _ in COLUMNS
+        )
+    else:
+        with numpy.load(path) as data:
+            strings = json.loads(str(data['strings']))
+            columns = dict((name, data[name]) for name, _, _ in COLUMNS)
+
+    # a writer that is still running may have added rows to some of the
+    # columns after the others were loaded
+    rows = min(len(value) for value in columns.values())
+    columns = dict((name, value[:rows]) for name, value in columns.items())
+
+    return ColumnarTrace(columns, strings['callsites'], strings['threads'])
+
+
+def percentiles_by_callsite(trace, percents=(50, 90, 99)):
+    """
+    The number of calls and the duration percentiles of every callsite,
+    `{name: (calls, [percentile_ns, ...])}`. The percentiles are the nearest
+    rank, everything is done with one sort of the whole trace.
+    """
+    _need_numpy()
+
+    if not len(trace):
+        return {}
+
+    duration = trace.duration_ns
+    callsite = numpy.asarray(trace.callsite)
+
+    order = numpy.lexsort((duration, callsite))
+    sorted_sites = callsite[order]
+    sorted_duration = duration[order]
+
+    starts = numpy.flatnonzero(
+        numpy.concatenate(([True], sorted_sites[1:] != sorted_sites[:-1]))
+    )
+    counts = numpy.diff(numpy.concatenate((starts, [len(sorted_sites)])))
+
+    values = []
+    for percent in percents:
+        rank = numpy.ceil(percent / 100.0 * counts).astype(numpy.int64) - 1
+        values.append(sorted_duration[starts + numpy.clip(rank, 0, counts - 1)])
+
+    res = {}
+    for i, start in enumerate(starts):
+        res[trace.callsites[sorted_sites[start]]] = (
+            int(counts[i]),
+            [int(value[i]) for value in values]
+        )
+
+    return res
+
+
+def throughput(trace, bucket_ns=1000000000, callsite=None):
+    """
+    Calls finished in each time bucket, `(bucket_start_ns, counts)`.
+    """
+    _need_numpy()
+
+    stop = trace.stop_ns
+    if callsite is not None:
+        stop = stop[trace.callsite == trace.callsite_id(callsite)]
+
+    if not len(stop):
+        return numpy.zeros(0, numpy.int64), numpy.zeros(0, numpy.int64)
+
+    first = stop.min() // bucket_ns * bucket_ns
+    counts = numpy.bincount((stop - first) // bucket_ns)
+    return first + numpy.arange(len(counts), dtype=numpy.int64) * bucket_ns, counts
+
+
+def concurrency(trace, bucket_ns=1000000000, callsite=None):
+    """
+    The number of calls that were running at the start of each time bucket
+    and the most that were running at once during it,
+    `(bucket_start_ns, running, peak)`. Nested calls are counted as well,
+    select the outermost calls (`parent_id == 0`) to leave them out.
+    """
+    _need_numpy()
+
+    start = trace.start_ns
+    stop = trace.stop_ns
+
+    if callsite is not None:
+        mask = trace.callsite == trace.callsite_id(callsite)
+        start = start[mask]
+        stop = stop[mask]
+
+    if not len(start):
+        empty = numpy.zeros(0, numpy.int64)
+        return empty, empty, empty
+
+    # +1 when a call starts and -1 when it stops, a stop sorts before a
+    # start made at the same time
+    times = numpy.concatenate((stop, start))
+    deltas = numpy.concatenate(
+        (
+            -numpy.ones(len(stop), numpy.int64),
+            numpy.ones(len(start), numpy.int64)
+        )
+    )
+    order = numpy.argsort(times, kind='stable')
+    times = times[order]
+    running = numpy.cumsum(deltas[order])
+
+    first = times[0] // bucket_ns * bucket_ns
+    edges = numpy.arange(first, times[-1] + bucket_ns, bucket_ns, dtype=numpy.int64)
+
+    # events before each edge, the running count is the one after the last
+    # of them
+    before = numpy.searchsorted(times, edges, side='left')
+    at_edge = numpy.where(before > 0, running[numpy.maximum(before - 1, 0)], 0)
+
+    bucket = (times - first) // bucket_ns
+    peak = numpy.zeros(len(edges), numpy.int64)
+    numpy.maximum.at(peak, bucket, running)
+    peak = numpy.maximum(peak, at_edge)
+
+    return edges, at_edge, peak
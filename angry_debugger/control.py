@@ -0,0 +1,653 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, OSX
+:license: GPL(v3)
+:synopsis: live control of a running process
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+from __future__ import print_function
+import os
+import sys
+import socket
+import atexit
+import fnmatch
+import logging
+import weakref
+import tempfile
+import threading
+
+from . import stats as _stats
+from . import memo as _memo
+from .utils import format_ns
+
+
+class CallSite(object):
+    """
+    A function, method, property or class decorated with `log_it`.
+
+    `plan` is what the wrapper looks at on every call, `(enabled,
+    threshold_ns, memo)`. `memo` is the `MemoStats` the arguments get added
+    to or `None`. The plan is only ever replaced as a whole so a call sees
+    either the old plan or the new one and never has to look anything else
+    up to find out what to do.
+    """
+
+    def __init__(self, name, threshold_ns, memo=False):
+        self.name = name
+        self.default_threshold_ns = threshold_ns
+        self.default_memo = memo
+        self.plan = (True, threshold_ns, None)
+
+    @property
+    def enabled(self):
+        return self.plan[0]
+
+    @property
+    def threshold_ns(self):
+        return self.plan[1]
+
+    @property
+    def memo(self):
+        return self.plan[2]
+
+    def __repr__(self):
+        return '<CallSite {0} enabled={1} threshold_ns={2} memo={3}>'.format(
+            self.name,
+            self.plan[0],
+            self.plan[1],
+            self.plan[2] is not None
+        )
+
+
+# name -> [CallSite], one for every set of options the name was decorated
+# with. A function that gets decorated over and over, a closure, gets the
+# same site every time.
+_callsites = {}
+# code object of every decorated function -> name, the sampler uses it to
+# find the decorated functions on a stack. A code object that is not used
+# anymore is dropped.
+_codes = weakref.WeakKeyDictionary()
+# [(pattern, value)] applied in order so the last one that matches wins,
+# they are kept so functions that get decorated later follow them as well.
+# Setting a pattern again replaces the rule it had.
+_rules = []
+_thresholds = []
+_memo_rules = []
+_lock = threading.Lock()
+
+
+def _plan(site):
+    name = site.name
+
+    enabled = True
+    for pattern, value in _rules:
+        if fnmatch.fnmatchcase(name, pattern):
+            enabled = value
+
+    threshold_ns = site.default_threshold_ns
+    for pattern, value in _thresholds:
+        if fnmatch.fnmatchcase(name, pattern):
+            # None goes back to the threshold given to log_it
+            threshold_ns = site.default_threshold_ns if value is None else value
+
+    memo = site.default_memo
+    for pattern, value in _memo_rules:
+        if fnmatch.fnmatchcase(name, pattern):
+            memo = value
+
+    if memo:
+        memo = _memo.get_stats(name)
+    else:
+        memo = None
+
+    return enabled, threshold_ns, memo
+
+
+def callsite(name, threshold_ns=None, memo=False, code=None):
+    """
+    Registers a decorated object, `log_it` calls this. `code` is the code
+    object of the function if there is one.
+    """
+    with _lock:
+        if code is not None:
+            _codes[code] = name
+
+        sites = _callsites.setdefault(name, [])
+
+        for site in sites:
+            if (
+                site.default_threshold_ns == threshold_ns and
+                site.default_memo == memo
+            ):
+                return site
+
+        site = CallSite(name, threshold_ns, memo)
+        site.plan = _plan(site)
+        sites.append(site)
+
+    return site
+
+
+def get_callsites():
+    """
+    Every decorated object keyed by name, the name is the same one the
+    function statistics use.
+    """
+    with _lock:
+        return dict((name, list(sites)) for name, sites in _callsites.items())
+
+
+def _set_rule(rules, pattern, value):
+    # called with the lock held. The rule goes to the end so it still wins
+    # over the ones set before it.
+    rules[:] = [rule for rule in rules if rule[0] != pattern]
+    rules.append((pattern, value))
+
+
+def _replan():
+    # called with the lock held
+    changed = 0
+
+    for sites in _callsites.values():
+        for site in sites:
+            plan = _plan(site)
+            if plan != site.plan:
+                site.plan = plan
+                changed += 1
+
+    return changed
+
+
+def set_callsite_enabled(pattern, enabled):
+    """
+    Turns the logging of every decorated object whose name matches the
+    fnmatch `pattern` on or off. Returns the number of them that changed.
+
+    A disabled one calls straight through to the function, nothing is
+    logged, timed or counted.
+    """
+    with _lock:
+        _set_rule(_rules, pattern, bool(enabled))
+        return _replan()
+
+
+def set_callsite_threshold(pattern, threshold_ms):
+    """
+    Changes the slow call threshold of every decorated object whose name
+    matches `pattern`, `None` goes back to the one given to `log_it`.
+    """
+    if threshold_ms is None:
+        threshold_ns = None
+    else:
+        threshold_ns = int(threshold_ms * 1000000)
+
+    with _lock:
+        _set_rule(_thresholds, pattern, threshold_ns)
+        return _replan()
+
+
+def set_memo_analysis(pattern, enabled=True):
+    """
+    Starts or stops collecting the argument repetition statistics of every
+    decorated object whose name matches `pattern`, see
+    `format_memo_report`. Returns the number of them that changed.
+    """
+    with _lock:
+        _set_rule(_memo_rules, pattern, bool(enabled))
+        return _replan()
+
+
+def _parse_level(value):
+    level = 0
+
+    for part in value.replace(' ', '').split('|'):
+        part = part.upper()
+
+        if part.isdigit():
+            level |= int(part)
+            continue
+
+        if part.startswith('LEVEL_'):
+            part = part[6:]
+
+        found = logging.getLevelName(part)
+        if not isinstance(found, int):
+            raise ValueError('unknown level {0!r}'.format(part))
+
+        level |= found
+
+    return level
+
+
+def _get_logger(name):
+    if name in ('', 'root'):
+        return logging.getLogger()
+
+    return logging.getLogger(name)
+
+
+def _cmd_help(args):
+    return '\n'.join((
+        'sites [PATTERN]                 decorated objects and their state',
+        'enable PATTERN                  turn logging on for matching objects',
+        'disable PATTERN                 turn logging off for matching objects',
+        'threshold PATTERN MS|default    slow call threshold of matching objects',
+        'level LOGGER [LEVEL[|LEVEL]]    show or set the level of a logger',
+        'stats [show|reset|publish|unpublish]',
+        'memo [PATTERN on|off]           argument repetition report or turn it on/off',
+        'dump [PATH]                     write out the ring buffers',
+        'sample [start [MS [PACKAGE...]]|stop|folded PATH]',
+        'help'
+    ))
+
+
+def _cmd_sites(args):
+    pattern = args[0] if args else '*'
+    lines = []
+
+    for name, sites in sorted(get_callsites().items()):
+        if not fnmatch.fnmatchcase(name, pattern):
+            continue
+
+        for site in sites:
+            enabled, threshold_ns, memo = site.plan
+            lines.append(
+                '{0} {1}{2}{3}'.format(
+                    'on ' if enabled else 'off',
+                    name,
+                    '' if threshold_ns is None else ' (threshold {0})'.format(
+                        format_ns(threshold_ns)
+                    ),
+                    '' if memo is None else ' (memo)'
+                )
+            )
+
+    return '\n'.join(lines)
+
+
+def _cmd_enable(args):
+    if len(args) != 1:
+        raise ValueError('enable takes a pattern')
+
+    return '{0} changed'.format(set_callsite_enabled(args[0], True))
+
+
+def _cmd_disable(args):
+    if len(args) != 1:
+        raise ValueError('disable takes a pattern')
+
+    return '{0} changed'.format(set_callsite_enabled(args[0], False))
+
+
+def _cmd_threshold(args):
+    if len(args) != 2:
+        raise ValueError('threshold takes a pattern and milliseconds or default')
+
+    if args[1].lower() == 'default':
+        threshold_ms = None
+    else:
+        threshold_ms = float(args[1])
+
+    return '{0} changed'.format(set_callsite_threshold(args[0], threshold_ms))
+
+
+def _cmd_level(args):
+    if not args or len(args) > 2:
+        raise ValueError('level takes a logger name and optionally a level')
+
+    lgr = _get_logger(args[0])
+
+    if len(args) == 2:
+        lgr.setLevel(_parse_level(args[1]))
+
+    return '{0}: {1} (effective {2})'.format(
+        lgr.name,
+        logging.getLevelName(lgr.level),
+        logging.getLevelName(lgr.getEffectiveLevel())
+    )
+
+
+def _cmd_stats(args):
+    action = args[0] if args else 'show'
+
+    if action == 'reset':
+        _stats.reset_function_stats()
+        return 'statistics reset'
+
+    if action == 'publish':
+        from . import top
+
+        top.publish_stats()
+        return 'publishing statistics, python -m angry_debugger top {0}'.format(
+            os.getpid()
+        )
+
+    if action == 'unpublish':
+        from . import top
+
+        top.unpublish_stats()
+        return 'stopped publishing statistics'
+
+    if action != 'show':
+        raise ValueError('unknown stats action {0!r}'.format(action))
+
+    lines = []
+    for stats in sorted(
+        _stats.get_function_stats().values(),
+        key=lambda item: item.total_ns,
+        reverse=True
+    ):
+        if not stats.calls:
+            continue
+
+        lines.append(
+            '{0:>10} {1:>10} {2:>10} {3:>10}  {4}'.format(
+                stats.calls,
+                format_ns(stats.total_ns),
+                format_ns(stats.mean_ns),
+                format_ns(stats.percentile(99)),
+                stats.name
+            )
+        )
+
+    if not lines:
+        return 'no statistics'
+
+    return '{0:>10} {1:>10} {2:>10} {3:>10}  function\n'.format(
+        'calls',
+        'total',
+        'mean',
+        'p99'
+    ) + '\n'.join(lines)
+
+
+def _cmd_memo(args):
+    if not args:
+        return _memo.format_memo_report() or 'no memo statistics'
+
+    if len(args) != 2 or args[1] not in ('on', 'off'):
+        raise ValueError('memo takes a pattern and on or off')
+
+    return '{0} changed'.format(set_memo_analysis(args[0], args[1] == 'on'))
+
+
+def _cmd_dump(args):
+    from .handlers import get_ring_buffers
+
+    buffers = get_ring_buffers()
+    if not buffers:
+        raise ValueError('there is no RingBufferHandler')
+
+    if args:
+        path = os.path.abspath(args[0])
+        for handler in buffers:
+            handler.dump(path)
+
+        return 'written to {0}'.format(path)
+
+    return ''.join(handler.dump() for handler in buffers).rstrip('\n')
+
+
+def _cmd_sample(args):
+    from . import sampler
+
+    action = args[0] if args else 'show'
+
+    if action == 'start':
+        interval_ms = float(args[1]) if len(args) > 1 else 5.0
+        sampler.start_sampling(interval_ms, args[2:])
+        return 'sampling every {0}ms'.format(interval_ms)
+
+    if action == 'stop':
+        if sampler.stop_sampling() is None:
+            return 'the sampler is not running'
+
+        return 'stopped sampling'
+
+    if action == 'folded':
+        current = sampler.get_sampler()
+        if current is None:
+            raise ValueError('the sampler is not running')
+
+        if len(args) != 2:
+            raise ValueError('folded takes a path')
+
+        path = os.path.abspath(args[1])
+        current.write_folded(path)
+        return 'written to {0}'.format(path)
+
+    if action != 'show':
+        raise ValueError('unknown sample action {0!r}'.format(action))
+
+    return sampler.format_sample_report() or 'no samples'
+
+
+_COMMANDS = dict(
+    help=_cmd_help,
+    sites=_cmd_sites,
+    enable=_cmd_enable,
+    disable=_cmd_disable,
+    threshold=_cmd_threshold,
+    level=_cmd_level,
+    stats=_cmd_stats,
+    memo=_cmd_memo,
+    dump=_cmd_dump,
+    sample=_cmd_sample
+)
+
+
+def run_command(line):
+    """
+    Runs a single control command and returns the reply. This is what the
+    control socket does with every line it gets.
+    """
+    args = line.split()
+
+    if not args:
+        return _cmd_help([])
+
+    command = _COMMANDS.get(args[0], None)
+    if command is None:
+        return 'error: unknown command {0!r}'.format(args[0])
+
+    try:
+        return command(args[1:])
+    except Exception as err:
+        return 'error: {0}'.format(err)
+
+
+def socket_path(pid):
+    return os.path.join(
+        tempfile.gettempdir(),
+        'angry_debugger_{0}.sock'.format(pid)
+    )
+
+
+class ControlServer(object):
+    """
+    Listens on a Unix domain socket for control commands. A client connects,
+    sends one command, shuts down its side of the connection and reads the
+    reply. The socket file is only readable and writable by the user that
+    owns the process. A client that does not finish sending its command
+    within `timeout` seconds is dropped.
+    """
+
+    def __init__(self, path=None, timeout=10.0):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise RuntimeError('the control channel needs Unix domain sockets')
+
+        self.path = path or socket_path(os.getpid())
+        self.timeout = timeout
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+
+        # nothing can connect until listen is called so there is no window
+        # where another user could get in
+        try:
+            os.chmod(self.path, 0o600)
+        except OSError:
+            self.close()
+            raise
+
+        self._sock.listen(5)
+        self._thread = threading.Thread(
+            target=self._serve,
+            name='angry_debugger control'
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except (OSError, socket.error):
+                # the socket was closed
+                return
+
+            try:
+                # a client that connects and never sends anything would
+                # otherwise block every other one
+                conn.settimeout(self.timeout)
+                self._handle(conn)
+            except (OSError, socket.error):
+                pass
+            finally:
+                conn.close()
+
+    @staticmethod
+    def _handle(conn):
+        data = b''
+        while True:
+            chunk = conn.recv(4096)
+            if not chunk:
+                break
+
+            data += chunk
+
+        reply = run_command(data.decode('utf-8').strip())
+        conn.sendall(reply.encode('utf-8') + b'\n')
+
+    def close(self):
+        try:
+            self._sock.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+_server = None
+
+
+def start_control(path=None):
+    """
+    Starts listening for control commands so what gets logged can be changed
+    in the running process
+
+    python -m angry_debugger ctl {pid} disable 'mypackage.db.*'
+
+    Returns the path of the socket.
+    """
+    global _server
+
+    if _server is None:
+        _server = ControlServer(path)
+        atexit.register(stop_control)
+
+    return _server.path
+
+
+def stop_control():
+    global _server
+
+    if _server is not None:
+        _server.close()
+        _server = None
+
+
+def send_command(pid_or_path, line, timeout=10.0):
+    """
+    Sends a command to a process and returns the reply.
+    """
+    if isinstance(pid_or_path, int):
+        path = socket_path(pid_or_path)
+    else:
+        path = pid_or_path
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+
+    try:
+        sock.connect(path)
+        sock.sendall(line.encode('utf-8'))
+        sock.shutdown(socket.SHUT_WR)
+
+        data = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+
+            data += chunk
+    finally:
+        sock.close()
+
+    return data.decode('utf-8')
+
+
+def add_ctl_parser(subparsers):
+    parser = subparsers.add_parser(
+        'ctl',
+        help='change what a running process logs',
+        description=(
+            'Sends a command to a process that called '
+            'angry_debugger.start_control(). Run "help" for the commands.'
+        )
+    )
+    parser.add_argument('pid', help='process id or path of the control socket')
+    parser.add_argument('words', nargs='+', metavar='command', help='command to run')
+    parser.set_defaults(command=ctl_command)
+    return parser
+
+
+def ctl_command(args):
+    if args.pid.isdigit():
+        target = int(args.pid)
+    else:
+        target = args.pid
+
+    try:
+        reply = send_command(target, ' '.join(args.words))
+    except (OSError, socket.error) as err:
+        print('unable to connect: {0}'.format(err), file=sys.stderr)
+        return 1
+
+    sys.stdout.write(reply)
+
+    if reply.startswith('error:'):
+        return 1
+
+    return 0
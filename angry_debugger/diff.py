@@ -0,0 +1,578 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: latency diff between two recordings
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+from __future__ import print_function
+import io
+import sys
+import gzip
+import math
+import json
+
+from .handlers import NOT_LOGGED
+from .utils import format_ns
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+_TEXT_UNITS = {
+    'sec': 1000000000.0,
+    'ms': 1000000.0,
+    'us': 1000.0,
+    'ns': 1.0,
+    'ps': 0.001,
+    'fs': 0.000001,
+    'as': 0.000000001,
+    'zs': 0.000000000001,
+    'ys': 0.000000000000001
+}
+
+
+class Recording(object):
+    """
+    The calls loaded from a single recording.
+
+    `durations` only holds the calls that were timed (`LEVEL_TIME_IT`),
+    `calls` holds the number of calls made to every function whether they
+    were timed or not.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = {}
+        self.durations = {}
+        self.edges = set()
+
+    def add(self, src, dst, duration_ns):
+        if not dst:
+            return
+
+        self.calls[dst] = self.calls.get(dst, 0) + 1
+
+        if duration_ns is not None:
+            self.durations.setdefault(dst, []).append(duration_ns)
+
+        if src:
+            self.edges.add((src, dst))
+
+
+def _split_location(value):
+    # "some_module.some_function [/path/file.py:10]"
+    if value.endswith(']') and ' [' in value:
+        value = value.rsplit(' [', 1)[0]
+
+    # LEVEL_CALL_FROM was not set, NDJSON has null for this
+    if value == NOT_LOGGED:
+        return None
+
+    return value
+
+
+def _parse_text_duration(value):
+    if 'to fast to measure' in value:
+        return 0
+
+    number, unit = value.split()
+    return int(float(number) * _TEXT_UNITS[unit])
+
+
+def _load_text(recording, lines):
+    src = dst = duration = None
+    # a src line was seen, src itself is None when it was not logged
+    in_call = False
+
+    for line in lines:
+        line = line.strip()
+
+        if line.startswith('src: '):
+            if dst is not None:
+                recording.add(src, dst, duration)
+
+            src = _split_location(line[5:])
+            dst = duration = None
+            in_call = True
+
+        elif line.startswith('dst: ') and in_call:
+            dst = _split_location(line[5:])
+
+        elif line.startswith('duration: ') and dst is not None:
+            if duration is None:
+                try:
+                    duration = _parse_text_duration(line[10:])
+                except (ValueError, KeyError):
+                    pass
+
+        # the footer of a logging run starts with the span tree and ends with
+        # the duration of the whole run, that one belongs to the run and not
+        # to the last call in it. The first line of the footer gets the
+        # prefix from the log format.
+        elif line.startswith('*' * 20) or line.endswith('span tree:'):
+            if dst is not None:
+                recording.add(src, dst, duration)
+
+            src = dst = duration = None
+            in_call = False
+
+    if dst is not None:
+        recording.add(src, dst, duration)
+
+
+def _load_ndjson(recording, lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            data = json.loads(line)
+        except ValueError:
+            # the last line of a file that is still being written to
+            continue
+
+        recording.add(data.get('src'), data.get('dst'), data.get('duration_ns'))
+
+
+def load_recording(path):
+    """
+    Loads the output of `log_it` from a file. The file can be the plain text
+    output, NDJSON written by `NDJSONFormatter`, a (gzip compressed) file
+    written by `NDJSONHandler` or a trace store written by
+    `TraceStoreHandler`.
+    """
+    recording = Recording(path)
+
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+
+    if magic == GZIP_MAGIC:
+        f = io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', errors='replace')
+    else:
+        f = io.open(path, 'r', encoding='utf-8', errors='replace')
+
+    with f:
+        first = ''
+        for first in f:
+            if first.strip():
+                break
+
+        lines = _chain(first, f)
+
+        if first.lstrip().startswith('{'):
+            _load_ndjson(recording, lines)
+        else:
+            _load_text(recording, lines)
+
+    return recording
+
+
+def _chain(first, lines):
+    yield first
+
+    for line in lines:
+        yield line
+
+
+def percentile(values, percent):
+    """
+    Nearest rank percentile of a sorted list.
+    """
+    if not values:
+        return 0
+
+    index = int(math.ceil(len(values) * percent / 100.0)) - 1
+    return values[max(index, 0)]
+
+
+def mann_whitney_u(baseline, candidate):
+    """
+    Mann-Whitney U test using the normal approximation with a correction for
+    ties. Returns the probability that a call from the candidate is slower
+    than a call from the baseline and the two sided p value.
+
+    Latencies are almost never normally distributed, they have long tails
+    and more than one mode, so a t-test is not used. This test only looks at
+    the order of the values.
+    """
+    n1 = len(baseline)
+    n2 = len(candidate)
+
+    if not n1 or not n2:
+        return 0.5, 1.0
+
+    values = sorted(
+        [(value, 0) for value in baseline] +
+        [(value, 1) for value in candidate]
+    )
+
+    n = n1 + n2
+    rank_sum = 0.0
+    tie_sum = 0.0
+    i = 0
+
+    while i < n:
+        j = i
+        while j + 1 < n and values[j + 1][0] == values[i][0]:
+            j += 1
+
+        # ranks start at 1, tied values all get the average rank
+        rank = (i + j + 2) / 2.0
+        ties = j - i + 1
+
+        if ties > 1:
+            tie_sum += ties ** 3 - ties
+
+        for k in range(i, j + 1):
+            if values[k][1]:
+                rank_sum += rank
+
+        i = j + 1
+
+    u = rank_sum - n2 * (n2 + 1) / 2.0
+    mean = n1 * n2 / 2.0
+    variance = n1 * n2 / 12.0 * ((n + 1) - tie_sum / (n * (n - 1)))
+
+    if variance <= 0:
+        return 0.5, 1.0
+
+    # continuity correction
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    p_value = math.erfc(max(z, 0.0) / math.sqrt(2.0))
+
+    return u / (n1 * n2), p_value
+
+
+class FunctionDiff(object):
+
+    def __init__(self, name, baseline_calls, candidate_calls, baseline, candidate):
+        self.name = name
+        self.baseline_calls = baseline_calls
+        self.candidate_calls = candidate_calls
+        self.baseline = sorted(baseline)
+        self.candidate = sorted(candidate)
+        self.tested = False
+        self.p_slower = 0.5
+        self.p_value = 1.0
+        self.regression = False
+        self.improvement = False
+
+    @property
+    def timed(self):
+        return bool(self.baseline and self.candidate)
+
+    def percentiles(self, percent):
+        return percentile(self.baseline, percent), percentile(self.candidate, percent)
+
+    def change(self, percent):
+        """
+        Relative change of a percentile, 0.1 is 10% slower.
+        """
+        base, cand = self.percentiles(percent)
+        if not base:
+            return 0.0
+
+        return (cand - base) / float(base)
+
+    def to_dict(self):
+        res = dict(
+            name=self.name,
+            baseline_calls=self.baseline_calls,
+            candidate_calls=self.candidate_calls,
+            regression=self.regression,
+            improvement=self.improvement
+        )
+
+        if self.timed:
+            for percent in (50, 90, 99):
+                base, cand = self.percentiles(percent)
+                res['baseline_p{0}_ns'.format(percent)] = base
+                res['candidate_p{0}_ns'.format(percent)] = cand
+                res['change_p{0}'.format(percent)] = round(self.change(percent), 4)
+
+        if self.tested:
+            res['p_slower'] = round(self.p_slower, 4)
+            res['p_value'] = self.p_value
+
+        return res
+
+
+class TraceDiff(object):
+    """
+    Compares a baseline recording with a candidate.
+
+    A function is a regression when the test says the candidate is slower
+    (p value below `alpha`) and the percentile it is judged on went up by
+    more than `threshold`. Functions with fewer than `min_calls` timed calls
+    in either recording are not tested.
+    """
+
+    def __init__(
+        self,
+        baseline,
+        candidate,
+        threshold=0.1,
+        alpha=0.01,
+        min_calls=20,
+        percent=50
+    ):
+        self.baseline = baseline
+        self.candidate = candidate
+        self.threshold = threshold
+        self.alpha = alpha
+        self.min_calls = min_calls
+        self.percent = percent
+        self.functions = []
+
+        names = set(baseline.calls) | set(candidate.calls)
+
+        for name in sorted(names):
+            func = FunctionDiff(
+                name,
+                baseline.calls.get(name, 0),
+                candidate.calls.get(name, 0),
+                baseline.durations.get(name, []),
+                candidate.durations.get(name, [])
+            )
+
+            if (
+                len(func.baseline) >= min_calls and
+                len(func.candidate) >= min_calls
+            ):
+                func.tested = True
+                func.p_slower, func.p_value = mann_whitney_u(
+                    func.baseline,
+                    func.candidate
+                )
+
+                if func.p_value < alpha:
+                    change = func.change(percent)
+
+                    if func.p_slower > 0.5 and change > threshold:
+                        func.regression = True
+                    elif func.p_slower < 0.5 and change < -threshold:
+                        func.improvement = True
+
+            self.functions.append(func)
+
+        self.new_functions = sorted(set(candidate.calls) - set(baseline.calls))
+        self.removed_functions = sorted(set(baseline.calls) - set(candidate.calls))
+        self.new_edges = sorted(candidate.edges - baseline.edges)
+        self.removed_edges = sorted(baseline.edges - candidate.edges)
+
+    @property
+    def regressions(self):
+        return [func for func in self.functions if func.regression]
+
+    @property
+    def improvements(self):
+        return [func for func in self.functions if func.improvement]
+
+    def to_dict(self):
+        return dict(
+            baseline=self.baseline.path,
+            candidate=self.candidate.path,
+            threshold=self.threshold,
+            alpha=self.alpha,
+            percentile=self.percent,
+            regressions=[func.name for func in self.regressions],
+            improvements=[func.name for func in self.improvements],
+            functions=[func.to_dict() for func in self.functions],
+            new_functions=self.new_functions,
+            removed_functions=self.removed_functions,
+            new_edges=[list(edge) for edge in self.new_edges],
+            removed_edges=[list(edge) for edge in self.removed_edges]
+        )
+
+    def __str__(self):
+        lines = [
+            'baseline:  {0}'.format(self.baseline.path),
+            'candidate: {0}'.format(self.candidate.path),
+            '',
+            '{0:>8} {1:>8} {2:>10} {3:>10} {4:>8} {5:>10} {6:>8} {7:>9}  {8}'.format(
+                'calls', 'change', 'p50', 'p50 new', 'change',
+                'p99 new', 'change', 'p value', 'function'
+            )
+        ]
+
+        for func in self.functions:
+            if func.baseline_calls:
+                calls = '{0:+.0%}'.format(
+                    (func.candidate_calls - func.baseline_calls) /
+                    float(func.baseline_calls)
+                )
+            else:
+                calls = 'new'
+
+            if func.timed:
+                base_p50, cand_p50 = func.percentiles(50)
+                cand_p99 = func.percentiles(99)[1]
+
+                if func.tested:
+                    p_value = '{0:.4f}'.format(func.p_value)
+                else:
+                    p_value = '-'
+
+                timing = '{0:>10} {1:>10} {2:>+8.1%} {3:>10} {4:>+8.1%} {5:>9}'.format(
+                    format_ns(base_p50),
+                    format_ns(cand_p50),
+                    func.change(50),
+                    format_ns(cand_p99),
+                    func.change(99),
+                    p_value
+                )
+            else:
+                timing = '{0:>10} {1:>10} {2:>8} {3:>10} {4:>8} {5:>9}'.format(
+                    '-', '-', '-', '-', '-', '-'
+                )
+
+            if func.regression:
+                flag = '  REGRESSION'
+            elif func.improvement:
+                flag = '  improved'
+            else:
+                flag = ''
+
+            lines.append(
+                '{0:>8} {1:>8} {2}  {3}{4}'.format(
+                    func.candidate_calls,
+                    calls,
+                    timing,
+                    func.name,
+                    flag
+                )
+            )
+
+        for title, items in (
+            ('new functions', self.new_functions),
+            ('removed functions', self.removed_functions)
+        ):
+            if items:
+                lines.append('')
+                lines.append(title + ':')
+                lines.extend('    ' + item for item in items)
+
+        for title, edges in (
+            ('new call edges', self.new_edges),
+            ('removed call edges', self.removed_edges)
+        ):
+            if edges:
+                lines.append('')
+                lines.append(title + ':')
+                lines.extend(
+                    '    {0} -> {1}'.format(src, dst) for src, dst in edges
+                )
+
+        lines.append('')
+        lines.append(
+            '{0} regression(s), {1} improvement(s) '
+            '(p{2} change > {3:.0%}, alpha {4})'.format(
+                len(self.regressions),
+                len(self.improvements),
+                self.percent,
+                self.threshold,
+                self.alpha
+            )
+        )
+
+        return '\n'.join(lines)
+
+
+def diff_recordings(baseline, candidate, **kwargs):
+    """
+    Loads two recordings and compares them, see `TraceDiff` for the keyword
+    arguments.
+    """
+    return TraceDiff(
+        load_recording(baseline),
+        load_recording(candidate),
+        **kwargs
+    )
+
+
+def add_diff_parser(subparsers):
+    parser = subparsers.add_parser(
+        'diff',
+        help='compare the latency of two recordings',
+        description=(
+            'Compares a baseline recording with a candidate. The recordings '
+            'can be the text output of log_it, NDJSON (gzip compressed or '
+            'not) or a trace store. Exits with 1 if there are regressions.'
+        )
+    )
+    parser.add_argument('baseline', help='baseline recording')
+    parser.add_argument('candidate', help='candidate recording')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=10.0,
+        help='percent a percentile has to go up to be a regression (default: 10)'
+    )
+    parser.add_argument(
+        '--alpha',
+        type=float,
+        default=0.01,
+        help='significance level of the test (default: 0.01)'
+    )
+    parser.add_argument(
+        '--percentile',
+        type=float,
+        default=50,
+        help='percentile regressions are judged on (default: 50)'
+    )
+    parser.add_argument(
+        '--min-calls',
+        type=int,
+        default=20,
+        help='timed calls needed in both recordings to test a function (default: 20)'
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='print the result as JSON'
+    )
+    parser.set_defaults(command=diff_command)
+    return parser
+
+
+def diff_command(args):
+    result = diff_recordings(
+        args.baseline,
+        args.candidate,
+        threshold=args.threshold / 100.0,
+        alpha=args.alpha,
+        min_calls=args.min_calls,
+        percent=args.percentile
+    )
+
+    if args.json:
+        print(json.dumps(result.to_dict(), indent=2, sort_keys=True))
+    else:
+        print(result)
+
+    sys.stdout.flush()
+
+    if result.regressions:
+        return 1
+
+    return 0
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: garbage collector pauses charged to the calls they happened in
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import gc
+import threading
+
+from .runs import call_stack, current_run
+from .stats import get_function_stats
+from .utils import perf_counter_ns, format_ns
+
+
+class GCStats(object):
+    """
+    Every collection made while `track_gc_pauses` is on.
+
+    `generations[n]` is `[collections, total_ns, max_ns, collected,
+    uncollectable]` for generation `n`. `attributed_ns` is the part of
+    `total_ns` that happened while a decorated call was running.
+    """
+
+    def __init__(self):
+        self.generations = {}
+        self.collections = 0
+        self.total_ns = 0
+        self.attributed_ns = 0
+        self._lock = threading.Lock()
+
+    def add(self, generation, pause_ns, collected, uncollectable, attributed):
+        with self._lock:
+            entry = self.generations.setdefault(generation, [0, 0, 0, 0, 0])
+            entry[0] += 1
+            entry[1] += pause_ns
+            entry[2] = max(entry[2], pause_ns)
+            entry[3] += collected
+            entry[4] += uncollectable
+
+            self.collections += 1
+            self.total_ns += pause_ns
+
+            if attributed:
+                self.attributed_ns += pause_ns
+
+    def reset(self):
+        with self._lock:
+            self.generations = {}
+            self.collections = 0
+            self.total_ns = 0
+            self.attributed_ns = 0
+
+    def __repr__(self):
+        return '<GCStats collections={0} total={1}>'.format(
+            self.collections,
+            format_ns(self.total_ns)
+        )
+
+
+_gc_stats = GCStats()
+_start = None
+
+
+# The callback runs on the thread that triggered the collection and every
+# other thread waits for it to finish, so the pause belongs to the calls
+# that are on the stack of that thread. A collection can not start while
+# another one is running so a single start time is enough.
+def _callback(phase, info):
+    global _start
+
+    if phase == 'start':
+        _start = perf_counter_ns()
+        return
+
+    if _start is None:
+        # tracking was turned on in the middle of a collection
+        return
+
+    pause_ns = perf_counter_ns() - _start
+    _start = None
+
+    stack = call_stack()
+    for record in stack:
+        record.gc_ns += pause_ns
+        record.gc_count += 1
+
+    run = current_run()
+    if run is not None:
+        run.gc_ns += pause_ns
+        run.gc_count += 1
+
+    _gc_stats.add(
+        info.get('generation', -1),
+        pause_ns,
+        info.get('collected', 0),
+        info.get('uncollectable', 0),
+        bool(stack)
+    )
+
+
+def track_gc_pauses():
+    """
+    Times every garbage collection and charges the pause to the decorated
+    calls and the logging run in progress on the thread that triggered it.
+    The records show it as "of which GC" under the duration and the
+    function statistics get `gc_ns`, `gc_count` and `gc_calls`.
+    """
+    if not hasattr(gc, 'callbacks'):
+        raise RuntimeError('gc.callbacks is needed to time the garbage collector')
+
+    if _callback not in gc.callbacks:
+        gc.callbacks.append(_callback)
+
+
+def untrack_gc_pauses():
+    global _start
+
+    if hasattr(gc, 'callbacks') and _callback in gc.callbacks:
+        gc.callbacks.remove(_callback)
+
+    _start = None
+
+
+def get_gc_stats():
+    return _gc_stats
+
+
+def reset_gc_stats():
+    _gc_stats.reset()
+
+
+def format_gc_report(limit=None):
+    """
+    The collections by generation and then the functions that lost the most
+    time to garbage collector pauses. A pause is charged to every decorated
+    call that was running so the time of a nested call is in the caller as
+    well.
+    """
+    stats = _gc_stats
+
+    with stats._lock:
+        generations = sorted(
+            (generation, list(entry))
+            for generation, entry in stats.generations.items()
+        )
+        collections = stats.collections
+        total_ns = stats.total_ns
+        attributed_ns = stats.attributed_ns
+
+    lines = [
+        'garbage collector: {0} collections, {1}, {2} of it in decorated '
+        'calls\n'.format(
+            collections,
+            format_ns(total_ns),
+            format_ns(attributed_ns)
+        )
+    ]
+
+    for generation, (count, gen_ns, max_ns, collected, uncollectable) in generations:
+        lines.append(
+            '    generation {0}: {1} collections, {2}, longest {3}, '
+            '{4} collected, {5} uncollectable\n'.format(
+                generation,
+                count,
+                format_ns(gen_ns),
+                format_ns(max_ns),
+                collected,
+                uncollectable
+            )
+        )
+
+    functions = sorted(
+        (item for item in get_function_stats().values() if item.gc_ns),
+        key=lambda item: item.gc_ns,
+        reverse=True
+    )
+
+    if limit is not None:
+        functions = functions[:limit]
+
+    for item in functions:
+        lines.append(
+            '{0}: {1} of {2} calls paused {3} times, {4} of {5} ({6:.1%}) '
+            'lost to GC\n'.format(
+                item.name,
+                item.gc_calls,
+                item.calls,
+                item.gc_count,
+                format_ns(item.gc_ns),
+                format_ns(item.total_ns),
+                item.gc_share
+            )
+        )
+
+    return ''.join(lines)
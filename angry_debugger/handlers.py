@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: structured output handlers
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import os
+import gzip
+import weakref
+import logging
+import logging.handlers
+from collections import deque
+from json.encoder import encode_basestring_ascii
+
+from .records import CallRecord
+
+
+NOT_LOGGED = 'NOT LOGGED'
+
+
+def _str(value):
+    if value is None or value == NOT_LOGGED or value == '':
+        return 'null'
+
+    return encode_basestring_ascii(str(value))
+
+
+def _int(value):
+    if value is None or value == NOT_LOGGED:
+        return 'null'
+
+    return str(int(value))
+
+
+def format_call_record(record):
+    """
+    Encodes a `CallRecord` as a single line of compact JSON.
+    """
+    return ''.join((
+        '{"timestamp_ns":', _int(record.timestamp_ns),
+        ',"level":', _str(logging.getLevelName(record.level)),
+        ',"thread":', _str(record.thread_name),
+        ',"thread_id":', _int(record.thread_id),
+        ',"run_id":', _int(record.run_id),
+        ',"span_id":', _int(record.span_id),
+        ',"parent_id":', _int(record.parent_id),
+        ',"src":', _str(record.calling_obj),
+        ',"src_file":', _str(record.calling_filename),
+        ',"src_line":', _int(record.calling_line_no),
+        ',"dst":', _str(record.called_obj),
+        ',"dst_file":', _str(record.called_filename),
+        ',"dst_line":', _int(record.called_line_no),
+        ',"args":', _str(record.arg_string),
+        ',"result":', _str(record.result),
+        ',"duration_ns":', _int(record.duration_ns),
+        ',"cpu_ns":', _int(record.cpu_ns),
+        ',"blocks":', _int(record.blocks),
+        ',"peak_bytes":', _int(record.peak_bytes),
+        ',"gc_ns":', _int(record.gc_ns),
+        ',"io_ns":', _int(record.io_ns),
+        ',"io_bytes":', _int(record.io_bytes),
+        ',"exception":', _str(record.exception),
+        '}'
+    ))
+
+
+class NDJSONFormatter(logging.Formatter):
+    """
+    Formats a log record as a single line of compact JSON.
+
+    Records that are created by `log_it` are written using a fixed set of
+    fields. The encoder is hand rolled for those fields so there is no
+    intermediate dictionary and no generic `json.dumps` call for every record.
+
+    {"timestamp_ns":1575768985229000000,"level":"ANGRY","thread":"Thread-5",
+     "thread_id":14016,"run_id":0,"src":"__main__.do","src_file":"example.py",
+     "src_line":889,"dst":"__main__.SomeClass.method_test_1",
+     "dst_file":"example.py","dst_line":859,"args":"(arg='argument 1')",
+     "result":"None","duration_ns":358800411,"cpu_ns":null,"blocks":null,
+     "peak_bytes":null,"gc_ns":0,"io_ns":0,"io_bytes":0,"exception":null}
+
+    Anything that was not logged because of the logging level is `null`.
+    `run_id` is the id of the logging run the call was made in, 0 if it was
+    made outside of a logging run. `cpu_ns` is only filled in when
+    `LEVEL_CPU` is set and `blocks` and `peak_bytes` are only filled in when
+    `LEVEL_MEMORY` is set. `gc_ns` stays 0 unless `track_gc_pauses` is on
+    and `io_ns` and `io_bytes` stay 0 unless `instrument_io` is on.
+
+    Any other record is written as timestamp_ns, level, thread, thread_id
+    and msg.
+    """
+
+    def format(self, record):
+        msg = record.msg
+
+        if isinstance(msg, CallRecord):
+            return format_call_record(msg)
+
+        return ''.join((
+            '{"timestamp_ns":', _int(record.created * 1000000000),
+            ',"level":', _str(record.levelname),
+            ',"thread":', _str(record.threadName),
+            ',"thread_id":', _int(record.thread),
+            ',"msg":', _str(record.getMessage().strip()),
+            '}'
+        ))
+
+
+class NDJSONHandler(logging.handlers.BufferingHandler):
+    """
+    Writes records as newline delimited JSON.
+
+    Records are held until `capacity` of them have been collected and then
+    they are formatted and written all at once. The output is compressed as
+    a gzip stream unless `compress` is `False`. When `max_bytes` is set the
+    file gets rotated once the number of bytes written to the disk reaches
+    it, the old files are renamed the same way
+    `logging.handlers.RotatingFileHandler` renames them.
+
+    handler = angry_debugger.NDJSONHandler('trace.ndjson.gz', max_bytes=50 * 1024 * 1024, backup_count=5)
+    logging.getLogger().addHandler(handler)
+    """
+
+    def __init__(
+        self,
+        filename,
+        max_bytes=0,
+        backup_count=0,
+        capacity=512,
+        compress=True,
+        compress_level=6
+    ):
+        logging.handlers.BufferingHandler.__init__(self, capacity)
+        self.filename = os.path.abspath(filename)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.compress_level = compress_level
+        self.setFormatter(NDJSONFormatter())
+
+        self._raw = None
+        self._stream = None
+
+    def _open(self):
+        self._raw = open(self.filename, 'ab')
+
+        if self.compress:
+            self._stream = gzip.GzipFile(
+                fileobj=self._raw,
+                mode='wb',
+                compresslevel=self.compress_level
+            )
+        else:
+            self._stream = self._raw
+
+    def _close_stream(self):
+        if self._stream is not None:
+            if self._stream is not self._raw:
+                self._stream.close()
+            self._raw.close()
+
+        self._stream = None
+        self._raw = None
+
+    def do_rollover(self):
+        self._close_stream()
+
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = '{0}.{1}'.format(self.filename, i)
+                dst = '{0}.{1}'.format(self.filename, i + 1)
+
+                if os.path.exists(src):
+                    if os.path.exists(dst):
+                        os.remove(dst)
+                    os.rename(src, dst)
+
+            dst = self.filename + '.1'
+            if os.path.exists(dst):
+                os.remove(dst)
+
+            if os.path.exists(self.filename):
+                os.rename(self.filename, dst)
+
+        elif os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if not self.buffer:
+                return
+
+            fmt = self.format
+            data = '\n'.join(fmt(record) for record in self.buffer) + '\n'
+            self.buffer = []
+
+            if self._stream is None:
+                self._open()
+
+            self._stream.write(data.encode('utf-8'))
+
+            if self.max_bytes > 0 and self._raw.tell() >= self.max_bytes:
+                self.do_rollover()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            try:
+                self.flush()
+            finally:
+                self._close_stream()
+        finally:
+            self.release()
+
+        logging.Handler.close(self)
+
+
+_ring_buffers = weakref.WeakSet()
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the last `capacity` records in memory and throws the older ones
+    away. Nothing is formatted until the records are dumped so keeping a
+    record costs next to nothing.
+
+    handler = angry_debugger.RingBufferHandler(10000)
+    logging.getLogger().addHandler(handler)
+    ...
+    handler.dump('last_calls.log')
+
+    The buffers can also be dumped from outside of the process with
+    `python -m angry_debugger ctl {pid} dump {path}`.
+    """
+
+    def __init__(self, capacity=10000):
+        logging.Handler.__init__(self)
+        self.capacity = capacity
+        self.buffer = deque(maxlen=capacity)
+        _ring_buffers.add(self)
+
+    def emit(self, record):
+        # the deque drops the oldest record once it is full
+        self.buffer.append(record)
+
+    def dump(self, filename=None, clear=True):
+        """
+        Formats the records in the buffer, oldest first, writes them to
+        `filename` if one is given and returns the text. The buffer is
+        cleared unless `clear` is `False`.
+        """
+        # Handler.handle holds the same lock while a record is added
+        self.acquire()
+        try:
+            records = list(self.buffer)
+
+            if clear:
+                self.buffer.clear()
+        finally:
+            self.release()
+
+        text = ''.join(self.format(record) + '\n' for record in records)
+
+        if filename is not None:
+            with open(filename, 'a') as f:
+                f.write(text)
+
+        return text
+
+    def close(self):
+        _ring_buffers.discard(self)
+        logging.Handler.close(self)
+
+
+def get_ring_buffers():
+    """
+    Every `RingBufferHandler` that has not been closed.
+    """
+    return list(_ring_buffers)
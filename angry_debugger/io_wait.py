@@ -0,0 +1,561 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: time spent waiting on files, sockets and subprocesses
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import io
+import os
+import sys
+import socket
+import select
+import threading
+import subprocess
+
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+try:
+    import builtins
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    import __builtin__ as builtins
+
+from .runs import call_stack
+from .stats import get_function_stats
+from .memory import format_bytes
+from .utils import perf_counter_ns, format_ns
+
+
+# the most IOWait entries kept for a single call, anything past that is
+# added to one entry for the kind of operation
+MAX_TARGETS = 32
+
+# socket operations made from these modules are not timed, the logging
+# handlers and the control socket would otherwise show up in the calls
+_IGNORED_MODULES = ('logging', __package__)
+
+_original_open = io.open
+_original_builtin_open = builtins.open
+_local = threading.local()
+
+
+class IOWait(object):
+    """
+    The I/O a single decorated call or span did on one file, socket or
+    subprocess, kept on the record of the innermost call that was running
+    (`CallRecord.io_waits`).
+    """
+
+    def __init__(self, parent_id, kind, target):
+        self.parent_id = parent_id
+        self.kind = kind
+        self.target = target
+        self.count = 0
+        self.bytes = 0
+        self.wait_ns = 0
+
+    def __str__(self):
+        if self.target:
+            name = '{0} {1}'.format(self.kind, self.target)
+        else:
+            name = self.kind
+
+        return '{0}: {1}x, {2}, {3}'.format(
+            name,
+            self.count,
+            format_bytes(self.bytes),
+            format_ns(self.wait_ns)
+        )
+
+    def __repr__(self):
+        return '<IOWait {0} {1} count={2}>'.format(
+            self.kind,
+            self.target,
+            self.count
+        )
+
+
+class IOStats(object):
+    """
+    Totals for every kind of operation made while `instrument_io` is on,
+    `kinds[kind]` is `[count, bytes, wait_ns]`. `attributed_ns` is the part
+    of the wait that happened while a decorated call was running.
+    """
+
+    def __init__(self):
+        self.kinds = {}
+        self.attributed_ns = 0
+        self._lock = threading.Lock()
+
+    def add(self, kind, nbytes, wait_ns, attributed):
+        with self._lock:
+            entry = self.kinds.setdefault(kind, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += nbytes
+            entry[2] += wait_ns
+
+            if attributed:
+                self.attributed_ns += wait_ns
+
+    def reset(self):
+        with self._lock:
+            self.kinds = {}
+            self.attributed_ns = 0
+
+    @property
+    def wait_ns(self):
+        return sum(entry[2] for entry in self.kinds.values())
+
+    def __repr__(self):
+        return '<IOStats wait={0}>'.format(format_ns(self.wait_ns))
+
+
+_io_stats = IOStats()
+
+
+def _add(kind, describe, obj, nbytes, wait_ns):
+    stack = call_stack()
+    _io_stats.add(kind, nbytes, wait_ns, bool(stack))
+
+    if not stack:
+        return
+
+    for record in stack:
+        record.io_ns += wait_ns
+        record.io_bytes += nbytes
+        record.io_count += 1
+
+    record = stack[-1]
+    waits = record.io_waits
+
+    if waits is None:
+        waits = record.io_waits = {}
+
+    try:
+        target = describe(obj)
+    except Exception:
+        target = ''
+
+    key = (kind, target)
+    wait = waits.get(key, None)
+
+    if wait is None:
+        if len(waits) >= MAX_TARGETS:
+            key = (kind, '...')
+            wait = waits.get(key, None)
+
+        if wait is None:
+            wait = waits[key] = IOWait(record.span_id, kind, key[1])
+
+    wait.count += 1
+    wait.bytes += nbytes
+    wait.wait_ns += wait_ns
+
+
+def _wrap(kind, func, count_bytes, describe, check_caller=False):
+    def wrapper(*args, **kwargs):
+        # an operation made by another one that is being timed, select.select
+        # called by a selector or wait called by communicate
+        if getattr(_local, 'busy', False):
+            return func(*args, **kwargs)
+
+        if check_caller:
+            # noinspection PyProtectedMember
+            module = sys._getframe(1).f_globals.get('__name__', '')
+            if module.split('.', 1)[0] in _IGNORED_MODULES:
+                return func(*args, **kwargs)
+
+        _local.busy = True
+        start = perf_counter_ns()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            wait_ns = perf_counter_ns() - start
+            _local.busy = False
+            _add(kind, describe, args[0] if args else None, 0, wait_ns)
+            raise
+
+        wait_ns = perf_counter_ns() - start
+        _local.busy = False
+        _add(
+            kind,
+            describe,
+            args[0] if args else None,
+            count_bytes(args, result),
+            wait_ns
+        )
+        return result
+
+    wrapper.__name__ = getattr(func, '__name__', kind)
+    wrapper.__doc__ = getattr(func, '__doc__', None)
+    wrapper._io_original = func
+    return wrapper
+
+
+def _no_bytes(args, result):
+    return 0
+
+
+def _result_len(args, result):
+    return len(result) if result is not None else 0
+
+
+def _result_count(args, result):
+    return result or 0
+
+
+def _result_first_len(args, result):
+    return len(result[0])
+
+
+def _result_first(args, result):
+    return result[0] or 0
+
+
+def _data_len(args, result):
+    return memoryview(args[1]).nbytes
+
+
+def _no_target(obj):
+    return ''
+
+
+def _file_name(obj):
+    return str(obj.name)
+
+
+def _socket_address(obj):
+    try:
+        address = obj.getpeername()
+    except (OSError, socket.error):
+        address = None
+
+    if not address:
+        # not connected, a unix socket without a name on the other side or
+        # a listening socket
+        address = obj.getsockname()
+
+    if isinstance(address, tuple):
+        return '{0}:{1}'.format(*address[:2])
+
+    return str(address)
+
+
+def _process_name(obj):
+    args = obj.args
+
+    if isinstance(args, (list, tuple)):
+        args = ' '.join(str(arg) for arg in args)
+
+    args = str(args)
+    if len(args) > 60:
+        args = args[:57] + '...'
+
+    return args
+
+
+# The file operations are timed at the bottom layer, the one that makes the
+# system calls. A read that is answered from the buffer of a BufferedReader
+# does not wait on anything and is not counted.
+class _TimedFileIO(io.FileIO):
+    read = _wrap('file read', io.FileIO.read, _result_len, _file_name)
+    readall = _wrap('file read', io.FileIO.readall, _result_len, _file_name)
+    readinto = _wrap('file read', io.FileIO.readinto, _result_count, _file_name)
+    write = _wrap('file write', io.FileIO.write, _result_count, _file_name)
+
+
+def _open(
+    file,
+    mode='r',
+    buffering=-1,
+    encoding=None,
+    errors=None,
+    newline=None,
+    closefd=True,
+    opener=None
+):
+    modes = set(mode) if isinstance(mode, str) else set()
+
+    # noinspection PyProtectedMember
+    caller = sys._getframe(1).f_globals.get('__name__', '')
+
+    if (
+        caller.split('.', 1)[0] in _IGNORED_MODULES or
+        # anything unusual is left to the real open so the errors and the
+        # warnings are the same
+        not modes or
+        modes - set('rwxabt+') or
+        len(mode) != len(modes) or
+        len(modes & set('rwxa')) != 1 or
+        ('b' in modes and ('t' in modes or encoding or errors or newline)) or
+        ('b' in modes and buffering == 1)
+    ):
+        return _original_open(
+            file,
+            mode,
+            buffering,
+            encoding,
+            errors,
+            newline,
+            closefd,
+            opener
+        )
+
+    binary = 'b' in modes
+    raw = _TimedFileIO(
+        file,
+        ''.join(c for c in 'xrwa+' if c in modes),
+        closefd,
+        opener=opener
+    )
+    result = raw
+
+    # this is what io.open does with the classes it uses
+    try:
+        line_buffering = False
+
+        if buffering == 1 or (buffering < 0 and raw.isatty()):
+            buffering = -1
+            line_buffering = True
+
+        if buffering < 0:
+            buffering = io.DEFAULT_BUFFER_SIZE
+
+            try:
+                block_size = os.fstat(raw.fileno()).st_blksize
+            except (OSError, AttributeError):
+                pass
+            else:
+                if block_size > 1:
+                    buffering = block_size
+
+        if buffering == 0:
+            if binary:
+                return result
+
+            raise ValueError("can't have unbuffered text I/O")
+
+        if '+' in modes:
+            result = io.BufferedRandom(raw, buffering)
+        elif 'r' in modes:
+            result = io.BufferedReader(raw, buffering)
+        else:
+            result = io.BufferedWriter(raw, buffering)
+
+        if binary:
+            return result
+
+        result = io.TextIOWrapper(
+            result,
+            encoding,
+            errors,
+            newline,
+            line_buffering
+        )
+        result.mode = mode
+        return result
+    except BaseException:
+        result.close()
+        raise
+
+
+_SOCKET_METHODS = (
+    ('send', 'socket send', _result_count, _socket_address),
+    ('sendall', 'socket send', _data_len, _socket_address),
+    ('sendto', 'socket send', _result_count, _socket_address),
+    ('recv', 'socket recv', _result_len, _socket_address),
+    ('recv_into', 'socket recv', _result_count, _socket_address),
+    ('recvfrom', 'socket recv', _result_first_len, _socket_address),
+    ('recvfrom_into', 'socket recv', _result_first, _socket_address),
+    ('connect', 'socket connect', _no_bytes, _socket_address),
+    ('connect_ex', 'socket connect', _no_bytes, _socket_address),
+    ('accept', 'socket accept', _no_bytes, _socket_address)
+)
+
+_SELECTORS = (
+    'SelectSelector',
+    'PollSelector',
+    'EpollSelector',
+    'DevpollSelector',
+    'KqueueSelector'
+)
+
+# (object, attribute name, what was in its __dict__ or None)
+_patched = []
+
+
+def _patch(obj, name, wrapper):
+    _patched.append((obj, name, obj.__dict__.get(name, None)))
+    setattr(obj, name, wrapper)
+
+
+def instrument_io():
+    """
+    Times the blocking I/O made inside of decorated calls and spans: files
+    opened with `open` from now on, every socket's send, recv, connect and
+    accept, `select.select`, the selectors in `selectors` and
+    `subprocess.Popen.wait` and `communicate`.
+
+    The wait is added to the `io_ns`, `io_bytes` and `io_count` of every
+    decorated call running on the thread and the call that made the
+    operation gets an `IOWait` for each file, socket or process in its
+    `io_waits`. The records show it as "of which I/O" under the duration.
+
+    The files and sockets used by the logging handlers and by
+    angry_debugger itself are not timed.
+    """
+    if _patched:
+        return
+
+    builtins.open = _open
+    io.open = _open
+
+    for name, kind, count_bytes, describe in _SOCKET_METHODS:
+        func = getattr(socket.socket, name, None)
+
+        if func is not None:
+            _patch(
+                socket.socket,
+                name,
+                _wrap(kind, func, count_bytes, describe, True)
+            )
+
+    _patch(
+        select,
+        'select',
+        _wrap('select', select.select, _no_bytes, _no_target, True)
+    )
+
+    for name in _SELECTORS:
+        cls = getattr(selectors, name, None)
+
+        if cls is not None:
+            _patch(
+                cls,
+                'select',
+                _wrap('select', cls.select, _no_bytes, _no_target, True)
+            )
+
+    _patch(
+        subprocess.Popen,
+        'wait',
+        _wrap('subprocess wait', subprocess.Popen.wait, _no_bytes, _process_name)
+    )
+    _patch(
+        subprocess.Popen,
+        'communicate',
+        _wrap(
+            'subprocess wait',
+            subprocess.Popen.communicate,
+            _no_bytes,
+            _process_name
+        )
+    )
+
+
+def uninstrument_io():
+    """
+    Puts back everything `instrument_io` replaced. Files that were opened
+    while it was on stay timed until they are closed.
+    """
+    builtins.open = _original_builtin_open
+    io.open = _original_open
+
+    while _patched:
+        obj, name, original = _patched.pop()
+
+        if original is None:
+            delattr(obj, name)
+        else:
+            setattr(obj, name, original)
+
+
+def get_io_stats():
+    return _io_stats
+
+
+def reset_io_stats():
+    _io_stats.reset()
+
+
+def format_io_report(limit=None):
+    """
+    The time spent waiting on each kind of operation and then the functions
+    that spent the most time waiting on I/O. The wait of a nested call is in
+    the caller as well.
+    """
+    stats = _io_stats
+
+    with stats._lock:
+        kinds = sorted(
+            ((kind, list(entry)) for kind, entry in stats.kinds.items()),
+            key=lambda item: item[1][2],
+            reverse=True
+        )
+        attributed_ns = stats.attributed_ns
+
+    lines = [
+        'I/O: {0}, {1} of it in decorated calls\n'.format(
+            format_ns(sum(entry[2] for _, entry in kinds)),
+            format_ns(attributed_ns)
+        )
+    ]
+
+    for kind, (count, nbytes, wait_ns) in kinds:
+        lines.append(
+            '    {0}: {1}x, {2}, {3}\n'.format(
+                kind,
+                count,
+                format_bytes(nbytes),
+                format_ns(wait_ns)
+            )
+        )
+
+    functions = sorted(
+        (item for item in get_function_stats().values() if item.io_ns),
+        key=lambda item: item.io_ns,
+        reverse=True
+    )
+
+    if limit is not None:
+        functions = functions[:limit]
+
+    for item in functions:
+        lines.append(
+            '{0}: {1} of {2} calls did {3} operations, {4}, {5} of {6} '
+            '({7:.1%}) waiting on I/O\n'.format(
+                item.name,
+                item.io_calls,
+                item.calls,
+                item.io_count,
+                format_bytes(item.io_bytes),
+                format_ns(item.io_ns),
+                format_ns(item.total_ns),
+                item.io_share
+            )
+        )
+
+    return ''.join(lines)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: logging levels
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import logging
+
+
+LEVEL_TIME_IT = 128
+LEVEL_ARGS = 256
+LEVEL_RETURN = 512
+LEVEL_CALL_FROM = 1024
+LEVEL_CALL_TO = 2048
+LEVEL_ANGRY = 3968
+LEVEL_MEMORY = 4096
+LEVEL_CPU = 8192
+
+# all of the flags set, `logging.disable` with this drops every record
+# angry_debugger makes
+HIGHEST_LEVEL = LEVEL_ANGRY | LEVEL_MEMORY | LEVEL_CPU
+
+_LEVEL_NAMES = (
+    (LEVEL_TIME_IT, 'TIME_IT'),
+    (LEVEL_ARGS, 'ARGS'),
+    (LEVEL_RETURN, 'RETURN'),
+    (LEVEL_CALL_FROM, 'CALL_FROM'),
+    (LEVEL_CALL_TO, 'CALL_TO'),
+    (LEVEL_MEMORY, 'MEMORY'),
+    (LEVEL_CPU, 'CPU')
+)
+
+
+# every combination of the levels gets a name. The names of the levels that
+# are set are joined by " | " in the order above and the levels that make
+# up LEVEL_ANGRY are shown as ANGRY.
+def _add_level_names():
+    for combination in range(1, 1 << len(_LEVEL_NAMES)):
+        level = 0
+        names = []
+
+        for i, (bit, name) in enumerate(_LEVEL_NAMES):
+            if combination & (1 << i):
+                level |= bit
+                names.append(name)
+
+        if level & LEVEL_ANGRY == LEVEL_ANGRY:
+            names = ['ANGRY'] + [
+                name for bit, name in _LEVEL_NAMES
+                if level & bit and not LEVEL_ANGRY & bit
+            ]
+
+        logging.addLevelName(level, ' | '.join(names))
+
+
+_add_level_names()
+
+
+def get_level(lgr):
+    """
+    The effective level of `lgr`, 0 if `logging.disable` would drop anything
+    logged at it so none of the work for a record that can never be written
+    gets done.
+    """
+    level = int(lgr.getEffectiveLevel())
+
+    if lgr.manager.disable >= level:
+        return 0
+
+    return level
@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: per line timing of a single function
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import sys
+import inspect
+import linecache
+import threading
+
+from .levels import LEVEL_TIME_IT, get_level
+from .utils import perf_counter_ns, format_ns
+
+
+class LineStats(object):
+    """
+    Hit counts and time for every line of a single function added up over
+    all of the calls that were timed.
+
+    The time of a line runs from when the line starts to when the next line
+    in the same function starts, so a line that calls something includes
+    the time spent in that call.
+    """
+
+    def __init__(self, name, code):
+        self.name = name
+        self.filename = code.co_filename
+        self.first_line_no = code.co_firstlineno
+        self.calls = 0
+        # line number -> [hits, total_ns]
+        self.lines = {}
+        self._lock = threading.Lock()
+
+    def _line(self, prev_line_no, duration_ns, line_no):
+        with self._lock:
+            if prev_line_no is not None:
+                # the entry is missing if the stats were reset during a call
+                self.lines.setdefault(prev_line_no, [0, 0])[1] += duration_ns
+
+            if line_no is not None:
+                self.lines.setdefault(line_no, [0, 0])[0] += 1
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.lines = {}
+
+    @property
+    def total_ns(self):
+        return sum(total_ns for _, total_ns in self.lines.values())
+
+    def format(self):
+        """
+        The source of the function with the hits, the time, the time per hit
+        and the share of the total time next to each line.
+        """
+        with self._lock:
+            lines = dict(
+                (line_no, list(entry)) for line_no, entry in self.lines.items()
+            )
+
+        total_ns = sum(entry[1] for entry in lines.values())
+
+        try:
+            code_lines = _function_lines(self.filename, self.first_line_no)
+        except (IOError, OSError):
+            code_lines = []
+
+        if not code_lines and lines:
+            code_lines = [
+                (line_no, linecache.getline(self.filename, line_no))
+                for line_no in range(self.first_line_no, max(lines) + 1)
+            ]
+
+        res = [
+            '{0} [{1}:{2}] {3} calls, {4}\n'.format(
+                self.name,
+                self.filename,
+                self.first_line_no,
+                self.calls,
+                format_ns(total_ns)
+            ),
+            '{0:>6} {1:>8} {2:>10} {3:>10} {4:>7}  source\n'.format(
+                'line',
+                'hits',
+                'time',
+                'per hit',
+                '% time'
+            )
+        ]
+
+        for line_no, source in code_lines:
+            source = source.rstrip()
+
+            if line_no in lines:
+                hits, line_ns = lines[line_no]
+                res.append(
+                    '{0:>6} {1:>8} {2:>10} {3:>10} {4:>7.1f}  {5}\n'.format(
+                        line_no,
+                        hits,
+                        format_ns(line_ns),
+                        format_ns(line_ns / float(hits or 1)),
+                        line_ns * 100.0 / total_ns if total_ns else 0.0,
+                        source
+                    )
+                )
+            else:
+                res.append(
+                    '{0:>6} {1:>8} {2:>10} {3:>10} {4:>7}  {5}\n'.format(
+                        line_no, '', '', '', '', source
+                    )
+                )
+
+        return ''.join(res)
+
+    def __str__(self):
+        return self.format()
+
+    def __repr__(self):
+        return '<LineStats {0} calls={1} lines={2}>'.format(
+            self.name,
+            self.calls,
+            len(self.lines)
+        )
+
+
+def _function_lines(filename, first_line_no):
+    # inspect.getblock finds the end of the def the same way the source
+    # of a function is found by inspect.getsource
+    lines = linecache.getlines(filename)
+    if not lines:
+        return []
+
+    block = inspect.getblock(lines[first_line_no - 1:])
+    return list(enumerate(block, first_line_no))
+
+
+_line_stats = {}
+_line_stats_lock = threading.Lock()
+
+
+def _get_stats(name, code):
+    with _line_stats_lock:
+        try:
+            return _line_stats[name]
+        except KeyError:
+            stats = _line_stats[name] = LineStats(name, code)
+            return stats
+
+
+def get_line_stats():
+    """
+    The line statistics of every function decorated with
+    `log_it(lines=True)`, keyed by the name of the function.
+    """
+    with _line_stats_lock:
+        return dict(_line_stats)
+
+
+def reset_line_stats():
+    with _line_stats_lock:
+        for stats in _line_stats.values():
+            stats.reset()
+
+
+def format_line_stats(name=None):
+    """
+    The annotated source of every function that has line statistics, or
+    just the one named `name`. The function that took the most time is
+    first.
+    """
+    stats = get_line_stats()
+
+    if name is not None:
+        stats = {name: stats[name]} if name in stats else {}
+
+    return '\n'.join(
+        item.format()
+        for item in sorted(
+            stats.values(),
+            key=lambda item: item.total_ns,
+            reverse=True
+        )
+        if item.calls
+    )
+
+
+# Line events are only ever turned on for the code object of the function
+# being timed. Nothing else gets traced.
+#
+# Python 3.12 and later: sys.monitoring LINE events are turned on for the
+# code object while at least one call to it is being timed. The callback is
+# handed the code object and the line number so the state of the calls
+# being timed is kept in a stack for every thread.
+#
+# Before that: a trace function is set while the call is running. Every
+# call made while it is set goes through the trace function but it only
+# hands back a line tracer for the code object being timed, nothing else
+# gets line events.
+
+_local = threading.local()
+_traced_codes = {}
+
+if hasattr(sys, 'monitoring'):
+    _LINE = sys.monitoring.events.LINE
+    _PY_RETURN = sys.monitoring.events.PY_RETURN
+else:
+    _LINE = None
+    _PY_RETURN = None
+
+_tool_id = None
+_tool_lock = threading.Lock()
+
+
+def _get_tool_id():
+    global _tool_id
+
+    with _tool_lock:
+        if _tool_id is None:
+            for tool_id in (sys.monitoring.PROFILER_ID, 3, 4):
+                if sys.monitoring.get_tool(tool_id) is None:
+                    sys.monitoring.use_tool_id(tool_id, 'angry_debugger')
+                    sys.monitoring.register_callback(
+                        tool_id,
+                        _LINE,
+                        _line_event
+                    )
+                    sys.monitoring.register_callback(
+                        tool_id,
+                        _PY_RETURN,
+                        _return_event
+                    )
+                    _tool_id = tool_id
+                    break
+            else:
+                # every tool id is in use, fall back to the trace function
+                _tool_id = -1
+
+        return _tool_id
+
+
+def _line_event(code, line_no):
+    now = perf_counter_ns()
+
+    try:
+        stack = _local.stack
+    except AttributeError:
+        return
+
+    # the code object runs in another thread or was not called through
+    # the decorator
+    if not stack or stack[-1][0] is not code:
+        return
+
+    state = stack[-1]
+    state[1]._line(state[2], now - state[3], line_no)
+    state[2] = line_no
+    state[3] = perf_counter_ns()
+
+
+def _return_event(code, instruction_offset, retval):
+    # without this the time spent in the decorator after the function
+    # returns would be added to the last line
+    now = perf_counter_ns()
+
+    try:
+        stack = _local.stack
+    except AttributeError:
+        return
+
+    if not stack or stack[-1][0] is not code or stack[-1][2] is None:
+        return
+
+    state = stack[-1]
+    state[1]._line(state[2], now - state[3], None)
+    state[2] = None
+
+
+class _FrameTracer(object):
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.line_no = None
+        self.start = 0
+
+    def __call__(self, frame, event, arg):
+        now = perf_counter_ns()
+
+        if event == 'line':
+            self.stats._line(self.line_no, now - self.start, frame.f_lineno)
+            self.line_no = frame.f_lineno
+            self.start = perf_counter_ns()
+
+        elif event == 'return':
+            # this is also the event for an exception leaving the frame and
+            # for a generator that yields
+            if self.line_no is not None:
+                self.stats._line(self.line_no, now - self.start, None)
+                self.line_no = None
+
+        return self
+
+
+def _trace(frame, event, arg):
+    if event == 'call':
+        stats = _traced_codes.get(frame.f_code, None)
+        if stats is not None:
+            return _FrameTracer(stats)
+
+    return None
+
+
+class LineTimer(object):
+    """
+    Times the lines of a single function, created by `log_it(lines=True)`.
+
+    The lines only get timed when the logger of the function has
+    `LEVEL_TIME_IT` set. If another trace function is set (a debugger or
+    coverage) when the call is made on a Python that does not have
+    `sys.monitoring` the call is not timed.
+    """
+
+    def __init__(self, name, func, lgr):
+        self.code = func.__code__
+        self.lgr = lgr
+        self.stats = _get_stats(name, self.code)
+        self._active = 0
+        self._lock = threading.Lock()
+
+        if _LINE is not None and _get_tool_id() != -1:
+            self.start = self._start_monitoring
+            self.stop = self._stop_monitoring
+        else:
+            self.start = self._start_trace
+            self.stop = self._stop_trace
+
+    def _enabled(self):
+        lgr_level = get_level(self.lgr)
+        return lgr_level | LEVEL_TIME_IT == lgr_level
+
+    def _start_monitoring(self):
+        if not self._enabled():
+            return None
+
+        with self._lock:
+            if self._active == 0:
+                sys.monitoring.set_local_events(
+                    _tool_id,
+                    self.code,
+                    _LINE | _PY_RETURN
+                )
+
+            self._active += 1
+
+        stats = self.stats
+        stats.calls += 1
+
+        try:
+            stack = _local.stack
+        except AttributeError:
+            stack = _local.stack = []
+
+        state = [self.code, stats, None, 0]
+        stack.append(state)
+        return state
+
+    def _stop_monitoring(self, state):
+        if state is None:
+            return
+
+        now = perf_counter_ns()
+        stack = _local.stack
+
+        if stack and stack[-1] is state:
+            stack.pop()
+        elif state in stack:
+            stack.remove(state)
+
+        if state[2] is not None:
+            state[1]._line(state[2], now - state[3], None)
+
+        with self._lock:
+            self._active -= 1
+
+            if self._active == 0:
+                sys.monitoring.set_local_events(_tool_id, self.code, 0)
+
+    def _start_trace(self):
+        if not self._enabled():
+            return None
+
+        previous = sys.gettrace()
+
+        if previous is not None and previous is not _trace:
+            return None
+
+        _traced_codes[self.code] = self.stats
+        self.stats.calls += 1
+
+        if previous is _trace:
+            # a timed function is already running on this thread
+            return False
+
+        sys.settrace(_trace)
+        return True
+
+    def _stop_trace(self, token):
+        if token:
+            sys.settrace(None)
@@ -0,0 +1,656 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: lock contention
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import os
+import sys
+import logging
+import threading
+
+from . import runs as _runs
+from .records import INDENT, get_duration
+from .utils import perf_counter_ns, time_ns, is_package_file
+
+try:
+    from threading import get_ident
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from thread import get_ident
+
+logger = logging.getLogger(__name__)
+
+_original_lock = threading.Lock
+_original_rlock = threading.RLock
+_original_condition = threading.Condition
+_original_semaphore = threading.Semaphore
+_original_bounded_semaphore = threading.BoundedSemaphore
+_original_logging_run_lock = _runs._logging_run_lock
+
+LOCK_TEMPLATE = '''\
+[{debug_type}] \
+{thread_name}\
+[{thread_id}]
+                          lock: {name}
+                          held by: {holder}
+'''
+
+
+class LockStats(object):
+    """
+    Contention totals for every lock that shares a name.
+
+    Locks that share a name are used from more than one thread at the same
+    time so the totals are updated under a lock of their own. It is an
+    original lock, the instrumented ones report to this.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total_ns = 0
+        self.wait_max_ns = 0
+        self.hold_total_ns = 0
+        self.hold_max_ns = 0
+        self.holders = {}
+        self._lock = _original_lock()
+
+    @property
+    def contention_rate(self):
+        if not self.acquisitions:
+            return 0.0
+
+        return self.contended / float(self.acquisitions)
+
+    @property
+    def mean_wait_ns(self):
+        if not self.acquisitions:
+            return 0.0
+
+        return self.wait_total_ns / float(self.acquisitions)
+
+    @property
+    def mean_hold_ns(self):
+        if not self.acquisitions:
+            return 0.0
+
+        return self.hold_total_ns / float(self.acquisitions)
+
+    def add_wait(self, wait_ns, contended):
+        with self._lock:
+            self.acquisitions += 1
+            self.wait_total_ns += wait_ns
+
+            if wait_ns > self.wait_max_ns:
+                self.wait_max_ns = wait_ns
+
+            if contended:
+                self.contended += 1
+
+    def add_hold(self, hold_ns, holder):
+        with self._lock:
+            self.hold_total_ns += hold_ns
+
+            if hold_ns > self.hold_max_ns:
+                self.hold_max_ns = hold_ns
+
+            totals = self.holders.setdefault(holder, [0, 0])
+            totals[0] += 1
+            totals[1] += hold_ns
+
+    def __repr__(self):
+        return (
+            '<LockStats {0} acquisitions={1} contended={2} '
+            'wait={3}ns hold={4}ns>'.format(
+                self.name,
+                self.acquisitions,
+                self.contended,
+                self.wait_total_ns,
+                self.hold_total_ns
+            )
+        )
+
+
+_lock_stats = {}
+_lock_stats_lock = _original_lock()
+
+
+def _get_stats(name):
+    try:
+        return _lock_stats[name]
+    except KeyError:
+        with _lock_stats_lock:
+            if name not in _lock_stats:
+                _lock_stats[name] = LockStats(name)
+
+            return _lock_stats[name]
+
+
+def _after_fork():
+    # a thread that was updating the totals when the process forked does
+    # not exist in the child, the lock it was holding would never be
+    # released.
+    global _lock_stats_lock
+
+    _lock_stats_lock = _original_lock()
+
+    for stats in _lock_stats.values():
+        stats._lock = _original_lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def get_lock_stats():
+    """
+    Returns a copy of the contention statistics for all of the instrumented
+    locks. The keys are the lock names.
+    """
+    with _lock_stats_lock:
+        return dict(_lock_stats)
+
+
+def reset_lock_stats():
+    with _lock_stats_lock:
+        _lock_stats.clear()
+
+
+def format_lock_stats():
+    """
+    A text summary of the lock statistics, the locks that have been waited
+    on the longest are first.
+    """
+    lines = []
+
+    for stats in sorted(
+        get_lock_stats().values(),
+        key=lambda item: item.wait_total_ns,
+        reverse=True
+    ):
+        lines.append(
+            '{0}: {1} acquisitions, {2} contended ({3:.1%})\n'.format(
+                stats.name,
+                stats.acquisitions,
+                stats.contended,
+                stats.contention_rate
+            )
+        )
+        lines.append(get_duration(0, stats.wait_total_ns / 1e9, 'total wait'))
+        lines.append(get_duration(0, stats.wait_max_ns / 1e9, 'max wait'))
+        lines.append(get_duration(0, stats.hold_total_ns / 1e9, 'total held'))
+        lines.append(get_duration(0, stats.hold_max_ns / 1e9, 'max held'))
+
+        with stats._lock:
+            holders = [
+                (holder, list(totals))
+                for holder, totals in stats.holders.items()
+            ]
+
+        for holder, (count, hold_ns) in sorted(
+            holders,
+            key=lambda item: item[1][1],
+            reverse=True
+        ):
+            lines.append(
+                get_duration(
+                    0,
+                    hold_ns / 1e9,
+                    'held by {0} ({1}x)'.format(
+                        holder or 'no decorated call',
+                        count
+                    )
+                )
+            )
+
+    return ''.join(lines)
+
+
+class LockRecord(object):
+    """
+    Child record for a lock that was released inside of a logging run.
+    """
+
+    def __init__(self, level, thread, name, holder, wait_ns, hold_ns, contended):
+        self.level = level
+        self.thread_name = thread.getName()
+        self.thread_id = thread.ident
+        self.name = name
+        self.holder = holder
+        self.wait_ns = wait_ns
+        self.hold_ns = hold_ns
+        self.contended = contended
+        # the lock was just released
+        self.timestamp_ns = time_ns()
+
+    def __str__(self):
+        msg = LOCK_TEMPLATE.format(
+            debug_type=logging.getLevelName(self.level),
+            thread_name=self.thread_name,
+            thread_id=self.thread_id,
+            name=self.name,
+            holder=self.holder
+        )
+
+        if self.contended:
+            msg += get_duration(0, self.wait_ns / 1e9, 'wait')
+        else:
+            msg += INDENT + 'wait: not contended\n'
+
+        msg += get_duration(0, self.hold_ns / 1e9, 'held')
+        return msg + '\n'
+
+
+def _creation_site():
+    """
+    File and line a lock is being created at. `None` is returned if the
+    lock is being created by angry_debugger itself, those locks are never
+    instrumented.
+    """
+    # noinspection PyProtectedMember
+    frame = sys._getframe(2)
+    threading_file = threading.__file__.rstrip('co')
+
+    while (
+        frame is not None and
+        frame.f_code.co_filename.rstrip('co') == threading_file
+    ):
+        frame = frame.f_back
+
+    if frame is None:
+        return '<unknown>'
+
+    if is_package_file(frame.f_code.co_filename):
+        return None
+
+    return '{0}:{1}'.format(frame.f_code.co_filename, frame.f_lineno)
+
+
+def _released(name, stats, holder_record, wait_ns, hold_ns, contended):
+    holder = holder_record.called_obj if holder_record is not None else None
+    stats.add_hold(hold_ns, holder)
+
+    if holder_record is None or _runs.current_run() is None:
+        return
+
+    _runs.emit(
+        logger,
+        holder_record.level,
+        LockRecord(
+            holder_record.level,
+            threading.current_thread(),
+            name,
+            holder,
+            wait_ns,
+            hold_ns,
+            contended
+        )
+    )
+
+
+class InstrumentedLock(object):
+    """
+    Wraps a `threading.Lock` or a `threading.RLock` and records how long
+    every acquire waited and how long the lock was held.
+
+    The decorated call that is running when the lock gets acquired is
+    recorded as the holder. If the lock is acquired inside of a decorated
+    call while a logging run is active a record is added to the run when
+    the lock is released.
+
+    some_lock = angry_debugger.InstrumentedLock(some_lock, 'some_lock')
+    """
+
+    def __init__(self, lock=None, name=None):
+        if lock is None:
+            lock = _original_lock()
+
+        if name is None:
+            name = _creation_site() or '<unknown>'
+
+        self._lock = lock
+        self.name = name
+        self._stats = _get_stats(name)
+        self._owner = None
+        self._count = 0
+        self._acquired_ns = 0
+        self._wait_ns = 0
+        self._contended = False
+        self._holder = None
+
+    def _acquired(self, wait_ns, contended):
+        self._owner = get_ident()
+        self._count = 1
+        self._wait_ns = wait_ns
+        self._contended = contended
+        self._holder = _runs.current_call()
+        self._stats.add_wait(wait_ns, contended)
+        self._acquired_ns = perf_counter_ns()
+
+    def _release_hold(self):
+        hold_ns = perf_counter_ns() - self._acquired_ns
+        args = (
+            self.name,
+            self._stats,
+            self._holder,
+            self._wait_ns,
+            hold_ns,
+            self._contended
+        )
+        self._owner = None
+        self._count = 0
+        self._holder = None
+        return args
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._owner == get_ident() and self._count:
+            # RLock acquired again by the thread that owns it
+            res = self._lock.acquire(blocking, timeout)
+            if res:
+                self._count += 1
+            return res
+
+        if self._lock.acquire(False):
+            self._acquired(0, False)
+            return True
+
+        if not blocking:
+            self._stats.add_wait(0, True)
+            return False
+
+        start = perf_counter_ns()
+
+        if timeout == -1:
+            res = self._lock.acquire()
+        else:
+            res = self._lock.acquire(True, timeout)
+
+        wait_ns = perf_counter_ns() - start
+
+        if res:
+            self._acquired(wait_ns, True)
+        else:
+            self._stats.add_wait(wait_ns, True)
+
+        return res
+
+    def release(self):
+        if self._count > 1 and self._owner == get_ident():
+            self._count -= 1
+            self._lock.release()
+            return
+
+        args = self._release_hold()
+        self._lock.release()
+        _released(*args)
+
+    def locked(self):
+        if hasattr(self._lock, 'locked'):
+            return self._lock.locked()
+
+        return self._count > 0
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    # these are used by threading.Condition
+
+    def _is_owned(self):
+        return self._owner == get_ident()
+
+    def _release_save(self):
+        count = self._count
+        args = self._release_hold()
+
+        if hasattr(self._lock, '_release_save'):
+            state = self._lock._release_save()
+        else:
+            self._lock.release()
+            state = None
+
+        _released(*args)
+        return state, count
+
+    def _acquire_restore(self, saved):
+        state, count = saved
+        start = perf_counter_ns()
+
+        if state is not None:
+            self._lock._acquire_restore(state)
+        else:
+            self._lock.acquire()
+
+        self._acquired(perf_counter_ns() - start, False)
+        self._count = count
+
+    # used by logging and threading in the child process after a fork, the
+    # thread that held the lock does not exist in the child
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+        self._owner = None
+        self._count = 0
+        self._acquired_ns = 0
+        self._wait_ns = 0
+        self._contended = False
+        self._holder = None
+
+    def __repr__(self):
+        return '<InstrumentedLock {0} {1!r}>'.format(self.name, self._lock)
+
+
+class InstrumentedSemaphore(object):
+    """
+    Wraps a `threading.Semaphore` or a `threading.BoundedSemaphore`. The
+    hold time is only known when the semaphore is released by the same
+    thread that acquired it.
+    """
+
+    def __init__(self, semaphore=None, name=None):
+        if semaphore is None:
+            semaphore = _original_semaphore()
+
+        if name is None:
+            name = _creation_site() or '<unknown>'
+
+        self._semaphore = semaphore
+        self.name = name
+        self._stats = _get_stats(name)
+        self._local = threading.local()
+
+    def _held(self):
+        try:
+            return self._local.held
+        except AttributeError:
+            held = self._local.held = []
+            return held
+
+    def acquire(self, blocking=True, timeout=None):
+        if self._semaphore.acquire(False):
+            wait_ns = 0
+            contended = False
+
+        elif not blocking:
+            self._stats.add_wait(0, True)
+            return False
+
+        else:
+            start = perf_counter_ns()
+
+            if timeout is None:
+                res = self._semaphore.acquire()
+            else:
+                res = self._semaphore.acquire(True, timeout)
+
+            wait_ns = perf_counter_ns() - start
+            contended = True
+
+            if not res:
+                self._stats.add_wait(wait_ns, True)
+                return False
+
+        self._stats.add_wait(wait_ns, contended)
+        self._held().append(
+            (perf_counter_ns(), wait_ns, contended, _runs.current_call())
+        )
+        return True
+
+    def release(self, n=1):
+        held = self._held()
+        released = []
+
+        for _ in range(n):
+            if held:
+                released.append(held.pop())
+
+        if n == 1:
+            self._semaphore.release()
+        else:
+            self._semaphore.release(n)
+
+        now = perf_counter_ns()
+        for acquired_ns, wait_ns, contended, holder in released:
+            _released(
+                self.name,
+                self._stats,
+                holder,
+                wait_ns,
+                now - acquired_ns,
+                contended
+            )
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def __repr__(self):
+        return '<InstrumentedSemaphore {0} {1!r}>'.format(self.name, self._semaphore)
+
+
+def watch_lock(lock, name=None):
+    """
+    Instruments a single lock, condition or semaphore that already exists.
+    The returned object has to be used in place of the original one.
+
+    self._lock = angry_debugger.watch_lock(self._lock, 'SomeClass._lock')
+    """
+    if name is None:
+        name = _creation_site() or '<unknown>'
+
+    if isinstance(lock, _original_condition):
+        # noinspection PyProtectedMember,PyUnresolvedReferences
+        return _original_condition(InstrumentedLock(lock._lock, name))
+
+    if isinstance(lock, _original_semaphore):
+        return InstrumentedSemaphore(lock, name)
+
+    return InstrumentedLock(lock, name)
+
+
+def _lock_factory():
+    name = _creation_site()
+    if name is None:
+        return _original_lock()
+
+    return InstrumentedLock(_original_lock(), name)
+
+
+def _rlock_factory(*args, **kwargs):
+    name = _creation_site()
+    if name is None:
+        return _original_rlock(*args, **kwargs)
+
+    return InstrumentedLock(_original_rlock(*args, **kwargs), name)
+
+
+class _Condition(_original_condition):
+
+    def __init__(self, lock=None):
+        if lock is None:
+            lock = _original_rlock()
+            name = _creation_site()
+
+            if name is not None:
+                lock = InstrumentedLock(lock, name)
+
+        _original_condition.__init__(self, lock)
+
+
+def _semaphore_factory(value=1):
+    name = _creation_site()
+    semaphore = _original_semaphore(value)
+
+    if name is None:
+        return semaphore
+
+    return InstrumentedSemaphore(semaphore, name)
+
+
+def _bounded_semaphore_factory(value=1):
+    name = _creation_site()
+    semaphore = _original_bounded_semaphore(value)
+
+    if name is None:
+        return semaphore
+
+    return InstrumentedSemaphore(semaphore, name)
+
+
+def instrument_locks():
+    """
+    Replaces `threading.Lock`, `threading.RLock`, `threading.Condition`,
+    `threading.Semaphore` and `threading.BoundedSemaphore` so every one of
+    them that gets created from now on is instrumented. A lock is named
+    after the file and line it was created at.
+
+    Locks that already exist are not touched, except for the lock that
+    angry_debugger uses for the logging runs so the contention the debugger
+    itself adds shows up as "angry_debugger._logging_run_lock".
+    """
+    threading.Lock = _lock_factory
+    threading.RLock = _rlock_factory
+    threading.Condition = _Condition
+    threading.Semaphore = _semaphore_factory
+    threading.BoundedSemaphore = _bounded_semaphore_factory
+
+    _runs._logging_run_lock = InstrumentedLock(
+        _original_logging_run_lock,
+        'angry_debugger._logging_run_lock'
+    )
+
+
+def uninstrument_locks():
+    threading.Lock = _original_lock
+    threading.RLock = _original_rlock
+    threading.Condition = _original_condition
+    threading.Semaphore = _original_semaphore
+    threading.BoundedSemaphore = _original_bounded_semaphore
+
+    _runs._logging_run_lock = _original_logging_run_lock
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: finds the functions that would benefit from a cache
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+from .utils import format_ns
+
+
+# the cache sizes that get simulated, 128 is the lru_cache default
+CACHE_SIZES = (16, 128, 1024)
+
+_MASK_64 = (1 << 64) - 1
+
+
+def _mix(value):
+    # hash() of a small int is the int itself, the bits have to be spread
+    # out for the sketch to work. This is the splitmix64 finalizer.
+    value &= _MASK_64
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & _MASK_64
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & _MASK_64
+    return value ^ (value >> 31)
+
+
+class HyperLogLog(object):
+    """
+    Estimates the number of distinct values it has been given using
+    `2 ** precision` bytes no matter how many values there are. With the
+    default precision the estimate is within about 1.6%.
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+        if self.size == 16:
+            self._alpha = 0.673
+        elif self.size == 32:
+            self._alpha = 0.697
+        elif self.size == 64:
+            self._alpha = 0.709
+        else:
+            self._alpha = 0.7213 / (1 + 1.079 / self.size)
+
+    def add(self, hashed):
+        """
+        Adds a 64 bit hash.
+        """
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        registers = self.registers
+        estimate = self._alpha * self.size * self.size / sum(
+            2.0 ** -value for value in registers
+        )
+
+        if estimate <= 2.5 * self.size:
+            # small range correction, linear counting
+            zeros = registers.count(0)
+            if zeros:
+                estimate = self.size * math.log(self.size / float(zeros))
+
+        return int(round(estimate))
+
+
+def _freeze(value, depth=0):
+    # turns the common unhashable containers into something that can be
+    # hashed and compares the same way
+    if depth > 4:
+        raise TypeError('nested too deep')
+
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item, depth + 1) for item in value)
+
+    if isinstance(value, dict):
+        return tuple(
+            sorted(
+                ((key, _freeze(item, depth + 1)) for key, item in value.items()),
+                key=repr
+            )
+        )
+
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item, depth + 1) for item in value)
+
+    if isinstance(value, bytearray):
+        return bytes(value)
+
+    hash(value)
+    return value
+
+
+def make_key(args, kwargs):
+    """
+    The hash `functools.lru_cache` would use for the call and whether the
+    arguments could be hashed at all. Arguments that can not be hashed are
+    hashed by their contents so how often they repeat can still be measured,
+    a call like that can not be cached by `lru_cache` as it is.
+    """
+    if kwargs:
+        key = (args, tuple(sorted(kwargs.items())))
+    else:
+        key = args
+
+    try:
+        return _mix(hash(key)), True
+    except TypeError:
+        pass
+
+    try:
+        return _mix(hash(_freeze(key))), False
+    except TypeError:
+        pass
+
+    try:
+        return _mix(hash(repr(key))), False
+    except Exception:
+        # nothing can be done with it, it counts as a value that is never
+        # seen again
+        return _mix(id(key)), False
+
+
+class MemoStats(object):
+    """
+    How often a function is called with the same arguments.
+
+    `distinct` is an estimate of the number of different argument tuples.
+    For every cache size in `cache_sizes` a least recently used cache is
+    simulated on the hashes of the arguments, `hits[size]` is how many
+    calls it would have answered and `saved_ns[size]` is the time those
+    calls took, roughly what `functools.lru_cache(maxsize=size)` would have
+    saved. The memory used depends on the cache sizes and not on the number
+    of calls.
+    """
+
+    def __init__(self, name, cache_sizes=CACHE_SIZES, precision=12):
+        self.name = name
+        self.cache_sizes = tuple(sorted(cache_sizes))
+        self.precision = precision
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # the decorated functions hold on to their stats object so it gets
+        # emptied instead of replaced
+        with self._lock:
+            self.calls = 0
+            self.unhashable = 0
+            self.total_ns = 0
+            self.hits = dict((size, 0) for size in self.cache_sizes)
+            self.saved_ns = dict((size, 0) for size in self.cache_sizes)
+            self._sketch = HyperLogLog(self.precision)
+            self._caches = [(size, OrderedDict()) for size in self.cache_sizes]
+
+    def add(self, args, kwargs, duration_ns):
+        hashed, hashable = make_key(args, kwargs)
+
+        with self._lock:
+            self.calls += 1
+            self.total_ns += duration_ns
+
+            if not hashable:
+                self.unhashable += 1
+
+            self._sketch.add(hashed)
+
+            for size, cache in self._caches:
+                if hashed in cache:
+                    # only Python 3 has move_to_end
+                    del cache[hashed]
+                    cache[hashed] = None
+                    self.hits[size] += 1
+                    self.saved_ns[size] += duration_ns
+                else:
+                    cache[hashed] = None
+                    if len(cache) > size:
+                        cache.popitem(last=False)
+
+    @property
+    def distinct(self):
+        return min(self._sketch.count(), self.calls)
+
+    @property
+    def repeat_rate(self):
+        """
+        The share of the calls made with arguments that were seen before, the
+        hit rate of a cache that never throws anything away.
+        """
+        if not self.calls:
+            return 0.0
+
+        return 1.0 - self.distinct / float(self.calls)
+
+    def hit_rate(self, size):
+        if not self.calls:
+            return 0.0
+
+        return self.hits[size] / float(self.calls)
+
+    def best_size(self):
+        """
+        The smallest simulated cache size that saves the most time.
+        """
+        best = None
+
+        for size in self.cache_sizes:
+            if best is None or self.saved_ns[size] > self.saved_ns[best]:
+                best = size
+
+        return best
+
+    def __repr__(self):
+        return '<MemoStats {0} calls={1} distinct={2}>'.format(
+            self.name,
+            self.calls,
+            self.distinct
+        )
+
+
+_memo_stats = {}
+_memo_stats_lock = threading.Lock()
+
+
+def get_stats(name):
+    try:
+        return _memo_stats[name]
+    except KeyError:
+        with _memo_stats_lock:
+            if name not in _memo_stats:
+                _memo_stats[name] = MemoStats(name)
+
+            return _memo_stats[name]
+
+
+def get_memo_stats():
+    """
+    The argument repetition statistics of every function that has been
+    analysed, keyed by the same name the function statistics use.
+    """
+    with _memo_stats_lock:
+        return dict(_memo_stats)
+
+
+def reset_memo_stats():
+    with _memo_stats_lock:
+        for stats in _memo_stats.values():
+            stats.reset()
+
+
+def format_memo_report(limit=None):
+    """
+    The analysed functions ranked by the time a cache of the best size
+    would have saved.
+    """
+    stats = sorted(
+        (item for item in get_memo_stats().values() if item.calls),
+        key=lambda item: item.saved_ns[item.best_size()],
+        reverse=True
+    )
+
+    if limit is not None:
+        stats = stats[:limit]
+
+    lines = []
+
+    for item in stats:
+        lines.append(
+            '{0}: {1} calls, ~{2} distinct ({3:.1%} repeated), {4}{5}\n'.format(
+                item.name,
+                item.calls,
+                item.distinct,
+                item.repeat_rate,
+                format_ns(item.total_ns),
+                '' if not item.unhashable else (
+                    ', {0:.1%} of the calls have unhashable '
+                    'arguments'.format(item.unhashable / float(item.calls))
+                )
+            )
+        )
+
+        best = item.best_size()
+        for size in item.cache_sizes:
+            lines.append(
+                '    maxsize={0:<6} hit rate {1:>6.1%}  saves {2:>10}{3}\n'.format(
+                    size,
+                    item.hit_rate(size),
+                    format_ns(item.saved_ns[size]),
+                    '  <- best' if size == best and item.saved_ns[size] else ''
+                )
+            )
+
+    return ''.join(lines)
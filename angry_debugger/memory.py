@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: per call memory accounting
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import sys
+import random
+import threading
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+if hasattr(sys, 'getallocatedblocks'):
+    getallocatedblocks = sys.getallocatedblocks
+else:
+    def getallocatedblocks():
+        return 0
+
+
+_sample_rate = 0.0
+_tracing_lock = threading.Lock()
+_tracing_owner = None
+
+
+def set_memory_sampling(sample_rate):
+    """
+    Sets how often `tracemalloc` gets turned on for a call that is logged
+    with `LEVEL_MEMORY`. 0.0 (the default) never turns it on and only the
+    number of allocated blocks is recorded, 1.0 turns it on for every call.
+
+    `tracemalloc` is very expensive, which is why it is only turned on for a
+    sample of the calls. It is only turned on if it is not already running
+    and while it is running for one call it is not turned on for any other.
+    """
+    global _sample_rate
+
+    if tracemalloc is None and sample_rate:
+        raise RuntimeError('tracemalloc is not available')
+
+    _sample_rate = float(sample_rate)
+
+
+def start():
+    """
+    Takes the "before" snapshot for a call.
+
+    The allocated block count is for the whole interpreter, allocations made
+    by other threads while the call is running get counted as well.
+    """
+    global _tracing_owner
+
+    traced = False
+
+    if _sample_rate and random.random() < _sample_rate:
+        with _tracing_lock:
+            if _tracing_owner is None and not tracemalloc.is_tracing():
+                _tracing_owner = threading.current_thread()
+                traced = True
+
+        if traced:
+            tracemalloc.start()
+
+    return getallocatedblocks(), traced
+
+
+def stop(token):
+    """
+    Returns the net number of allocated blocks and the peak traced memory in
+    bytes, the peak is `None` if the call was not sampled.
+    """
+    global _tracing_owner
+
+    blocks = getallocatedblocks() - token[0]
+
+    if token[1]:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        _tracing_owner = None
+    else:
+        peak = None
+
+    return blocks, peak
+
+
+def format_bytes(value):
+    for divider, suffix in (
+        (1024.0 * 1024.0 * 1024.0, 'GiB'),
+        (1024.0 * 1024.0, 'MiB'),
+        (1024.0, 'KiB')
+    ):
+        if abs(value) >= divider:
+            return '{0:.1f} {1}'.format(value / divider, suffix)
+
+    return '{0} B'.format(value)
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: pytest plugin for latency budgets
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import os
+import json
+import fnmatch
+import logging
+
+import pytest
+
+from .levels import LEVEL_TIME_IT, HIGHEST_LEVEL
+from . import stats as _stats
+
+
+# The hooks pytest loads for every session are in angry_debugger_pytest,
+# this module and the rest of angry_debugger only get imported once there
+# is a package to time.
+
+
+def _parse_budgets(lines):
+    budgets = []
+
+    for line in lines:
+        if '=' not in line:
+            raise pytest.UsageError(
+                'angry_debugger_budgets: expected "function = milliseconds" '
+                'and got {0!r}'.format(line)
+            )
+
+        pattern, budget_ms = line.rsplit('=', 1)
+        budgets.append((pattern.strip(), float(budget_ms)))
+
+    return budgets
+
+
+class Budget(object):
+
+    def __init__(self, pattern, budget_ms, percent, source):
+        self.pattern = pattern
+        self.budget_ns = budget_ms * 1000000.0
+        self.percent = percent
+        self.source = source
+
+    def check(self, results):
+        """
+        The functions that went over the budget, `[(name, value_ns)]`.
+        """
+        over = []
+
+        for name, result in results.items():
+            if not fnmatch.fnmatchcase(name, self.pattern):
+                continue
+
+            value = _stats.histogram_percentile(result['histogram'], self.percent)
+            if value > self.budget_ns:
+                over.append((name, value))
+
+        return over
+
+
+class _DropRecords(logging.Handler):
+    # A filter on the logger of a package does not see the records of the
+    # loggers of its modules, a handler does. The package logger stops
+    # propagating and this handler passes on everything that is not an
+    # angry_debugger record the same way propagating would have.
+
+    def __init__(self, lgr):
+        logging.Handler.__init__(self)
+        self.lgr = lgr
+        self.propagate = lgr.propagate
+
+    def handle(self, record):
+        if record.levelno & HIGHEST_LEVEL:
+            return False
+
+        if self.propagate and self.lgr.parent is not None:
+            self.lgr.parent.callHandlers(record)
+
+        return True
+
+    def emit(self, record):
+        pass
+
+
+def _summary(calls, total_ns, histogram):
+    return dict(
+        calls=calls,
+        mean_ns=total_ns / float(calls) if calls else 0.0,
+        p50_ns=_stats.histogram_percentile(histogram, 50),
+        p95_ns=_stats.histogram_percentile(histogram, 95),
+        p99_ns=_stats.histogram_percentile(histogram, 99)
+    )
+
+
+class LatencyBudgetPlugin(object):
+    """
+    Times the decorated functions of the selected packages while the tests
+    run, checks them against the budgets and writes the report.
+
+    The timing comes from the per function statistics `log_it` already
+    keeps. The loggers of the selected packages are set to `LEVEL_TIME_IT`
+    and get a handler that drops every record `log_it` makes, the ones made
+    in the modules of the packages as well, so nothing gets written
+    anywhere. The statistics are updated before a record is logged. The
+    percentiles come from the statistics histogram so they are within a
+    bucket (about 12%) of the real value.
+    """
+
+    def __init__(self, config, packages):
+        self.config = config
+        self.packages = packages
+        self.percent = float(config.getini('angry_debugger_percentile'))
+        self.budgets = [
+            Budget(pattern, budget_ms, self.percent, 'ini')
+            for pattern, budget_ms in _parse_budgets(
+                config.getini('angry_debugger_budgets')
+            )
+        ]
+        self.report_path = config.getoption('angry_debugger_report')
+        self.tests = {}
+        self._saved = {}
+
+    def enable(self):
+        for package in self.packages:
+            lgr = logging.getLogger(package)
+            handler = _DropRecords(lgr)
+            self._saved[package] = (lgr.level, lgr.propagate, handler)
+            lgr.setLevel(LEVEL_TIME_IT)
+            lgr.propagate = False
+            lgr.addHandler(handler)
+
+    def disable(self):
+        for package, (level, propagate, handler) in self._saved.items():
+            lgr = logging.getLogger(package)
+            lgr.setLevel(level)
+            lgr.propagate = propagate
+            lgr.removeHandler(handler)
+
+        self._saved.clear()
+
+    @staticmethod
+    def _snapshot():
+        return dict(
+            (name, (stats.calls, stats.total_ns, list(stats.histogram)))
+            for name, stats in _stats.get_function_stats().items()
+        )
+
+    def _item_budgets(self, item):
+        budgets = list(self.budgets)
+
+        for marker in item.iter_markers(name='latency_budget'):
+            if len(marker.args) < 2:
+                raise pytest.UsageError(
+                    '{0}: latency_budget needs a function name and a budget '
+                    'in milliseconds'.format(item.nodeid)
+                )
+
+            budgets.append(
+                Budget(
+                    marker.args[0],
+                    float(marker.args[1]),
+                    float(marker.kwargs.get('percentile', self.percent)),
+                    'marker'
+                )
+            )
+
+        return budgets
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        before = self._snapshot()
+        yield
+        after = self._snapshot()
+
+        results = {}
+        for name, (calls, total_ns, histogram) in after.items():
+            p_calls, p_total_ns, p_histogram = before.get(
+                name,
+                (0, 0, [0] * _stats.HISTOGRAM_SIZE)
+            )
+
+            if calls == p_calls:
+                continue
+
+            results[name] = dict(
+                calls=calls - p_calls,
+                total_ns=total_ns - p_total_ns,
+                histogram=[a - b for a, b in zip(histogram, p_histogram)]
+            )
+
+        violations = []
+        for budget in self._item_budgets(item):
+            for name, value in budget.check(results):
+                violations.append((name, value, budget))
+
+        self.tests[item.nodeid] = dict(
+            (
+                name,
+                _summary(result['calls'], result['total_ns'], result['histogram'])
+            )
+            for name, result in results.items()
+        )
+        item.angry_debugger_violations = violations
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+
+        violations = getattr(item, 'angry_debugger_violations', None)
+        if call.when != 'call' or not violations or not report.passed:
+            return
+
+        lines = ['latency budget exceeded:']
+        for name, value, budget in violations:
+            lines.append(
+                '    {0}: p{1:g} {2:.3f} ms > {3:.3f} ms ({4} budget {5!r})'.format(
+                    name,
+                    budget.percent,
+                    value / 1000000.0,
+                    budget.budget_ns / 1000000.0,
+                    budget.source,
+                    budget.pattern
+                )
+            )
+
+        report.outcome = 'failed'
+        report.longrepr = '\n'.join(lines)
+
+    def write_report(self):
+        functions = {}
+        for name, stats in _stats.get_function_stats().items():
+            if stats.calls:
+                functions[name] = _summary(stats.calls, stats.total_ns, stats.histogram)
+
+        data = dict(
+            version=1,
+            packages=sorted(self.packages),
+            percentile=self.percent,
+            budgets=[
+                dict(pattern=budget.pattern, budget_ms=budget.budget_ns / 1000000.0)
+                for budget in self.budgets
+            ],
+            functions=functions,
+            tests=self.tests
+        )
+
+        path = os.path.abspath(self.report_path)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+
+        return path
+
+    def pytest_sessionfinish(self, session):
+        self.disable()
+
+        if self.report_path:
+            self.write_report()
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.report_path:
+            terminalreporter.write_line(
+                'angry_debugger latency report: {0}'.format(
+                    os.path.abspath(self.report_path)
+                )
+            )
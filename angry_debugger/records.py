@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: log records
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import logging
+import itertools
+
+from .utils import format_exception, format_ns, func_arg_string
+from .memory import format_bytes
+
+
+LOGGING_TEMPLATE = '''\
+[{debug_type}] \
+{thread_name}\
+[{thread_id}]
+                          src: {calling_obj} [{calling_filename}:{calling_line_no}]
+                          dst: {called_obj} [{called_filename}:{called_line_no}]
+                          {msg}'''
+
+INDENT = ' ' * 26
+
+_span_counter = itertools.count(1)
+
+# the result of a call has not been set, `None` is a result
+_NO_RESULT = object()
+
+
+def get_duration(start, stop, label='duration'):
+    divider = 1.0
+    suffix = 'sec'
+    suffixes = [
+        'ms',
+        'us',
+        'ns',
+        'ps',
+        'fs',
+        'as',
+        'zs',
+        'ys'
+    ]
+
+    duration = 0
+    while suffixes:
+        duration = round((stop - start) * divider, 3)
+        if int(duration) > 0:
+            break
+
+        divider *= 1000.0
+        suffix = suffixes.pop(0)
+
+    if duration == 0:
+        duration = INDENT + label + ': to fast to measure\n'
+    else:
+        duration = INDENT + label + ': {0:.3f} {1}\n'.format(duration, suffix)
+
+    return duration
+
+
+def off_cpu(cpu_ns, wall_ns):
+    """
+    The share of the wall time that was not spent running on the CPU.
+    """
+    if not wall_ns:
+        return 0.0
+
+    return max(0.0, 1.0 - cpu_ns / float(wall_ns))
+
+
+def format_cpu(cpu_ns, wall_ns):
+    msg = get_duration(0, cpu_ns / 1000000000.0, 'cpu')
+    return msg[:-1] + ' (off-cpu {0:.1%})\n'.format(off_cpu(cpu_ns, wall_ns))
+
+
+def format_gc(gc_ns, gc_count):
+    return INDENT + 'of which GC: {0} ({1} collection{2})\n'.format(
+        format_ns(gc_ns),
+        gc_count,
+        '' if gc_count == 1 else 's'
+    )
+
+
+def format_io(io_ns, io_count, io_bytes, io_waits):
+    msg = INDENT + 'of which I/O: {0} ({1} operation{2}, {3})\n'.format(
+        format_ns(io_ns),
+        io_count,
+        '' if io_count == 1 else 's',
+        format_bytes(io_bytes)
+    )
+
+    # the waits of the calls this one made are in io_ns but only the ones
+    # made by this call are listed
+    if io_waits:
+        for wait in sorted(
+            io_waits.values(),
+            key=lambda item: item.wait_ns,
+            reverse=True
+        ):
+            msg += INDENT + '    {0}\n'.format(wait)
+
+    return msg
+
+
+class CallRecord(object):
+    """
+    Holds the data for a single call made to a decorated object.
+
+    Nothing gets turned into text until the record is emitted. The record is
+    what gets passed to the logger as the message, `logging` calls `str` on
+    it when a handler formats it. If the call raised an exception a reference
+    to the traceback is kept and it is only formatted at that time. The same
+    goes for the arguments and the return value, `set_args` and `set_result`
+    keep the objects and `arg_string` and `result` only `repr` them the
+    first time they are read. A record that is thrown away never formats
+    them.
+    """
+
+    message = 'function called: {0}{1}\n'
+
+    def __init__(
+        self,
+        level,
+        thread,
+        calling_obj,
+        calling_filename,
+        calling_line_no,
+        called_obj,
+        called_filename,
+        called_line_no,
+        f_name,
+        arg_string,
+        timestamp_ns,
+        time_it,
+        run_id=0,
+        cpu_it=False
+    ):
+        self.level = level
+        self.thread_name = thread.getName()
+        self.thread_id = thread.ident
+        self.calling_obj = calling_obj
+        self.calling_filename = calling_filename
+        self.calling_line_no = calling_line_no
+        self.called_obj = called_obj
+        self.called_filename = called_filename
+        self.called_line_no = called_line_no
+        self.f_name = f_name
+        self._arg_string = arg_string
+        self._args = None
+        self.timestamp_ns = timestamp_ns
+        self.time_it = time_it
+        self.run_id = run_id
+        self.cpu_it = cpu_it
+        self.cpu_ns = None
+        self.duration_ns = None
+        self._result = None
+        self._raw_result = _NO_RESULT
+        self.blocks = None
+        self.peak_bytes = None
+        self.exc_info = None
+        self.span_id = next(_span_counter)
+        self.parent_id = 0
+        self.depth = 0
+        self.child_ns = 0
+        # filled in by the garbage collector callback, see gc_pauses.py
+        self.gc_ns = 0
+        self.gc_count = 0
+        # filled in while instrument_io is on, see io_wait.py
+        self.io_ns = 0
+        self.io_bytes = 0
+        self.io_count = 0
+        self.io_waits = None
+        self._traceback = None
+        self._text = None
+
+    def set_args(self, func, args, kwargs):
+        """
+        Keeps the arguments of the call so they can be formatted if the
+        record gets written out. They are formatted the way they are at that
+        time.
+        """
+        self._args = (func, args, kwargs)
+
+    @property
+    def arg_string(self):
+        if self._args is not None:
+            self._arg_string = func_arg_string(*self._args)
+            # the objects are not needed anymore
+            self._args = None
+
+        return self._arg_string
+
+    @arg_string.setter
+    def arg_string(self, value):
+        self._args = None
+        self._arg_string = value
+
+    def set_result(self, result):
+        """
+        Keeps the return value of the call so it can be formatted if the
+        record gets written out.
+        """
+        self._raw_result = result
+
+    @property
+    def result(self):
+        if self._raw_result is not _NO_RESULT:
+            self._result = repr(self._raw_result)
+            self._raw_result = _NO_RESULT
+
+        return self._result
+
+    @result.setter
+    def result(self, value):
+        self._raw_result = _NO_RESULT
+        self._result = value
+
+    @property
+    def self_ns(self):
+        """
+        Time spent in the call itself, the duration minus the time spent in
+        the decorated calls it made.
+        """
+        if self.duration_ns is None:
+            return None
+
+        return self.duration_ns - self.child_ns
+
+    @property
+    def exception(self):
+        """
+        Name of the exception type the call raised or `None`.
+        """
+        if self.exc_info is None:
+            return None
+
+        return self.exc_info[0].__name__
+
+    def format_traceback(self):
+        if self._traceback is None:
+            if self.exc_info is None:
+                return ''
+
+            self._traceback = ''.join(format_exception(*self.exc_info))
+            # the traceback holds references to every frame involved.
+            # Once it has been formatted there is no reason to keep those
+            # frames alive.
+            self.exc_info = (self.exc_info[0], self.exc_info[1], None)
+
+        return self._traceback
+
+    def __str__(self):
+        if self._text is not None:
+            return self._text
+
+        msg = LOGGING_TEMPLATE.format(
+            debug_type=logging.getLevelName(self.level),
+            thread_name=self.thread_name,
+            thread_id=self.thread_id,
+            calling_obj=self.calling_obj,
+            calling_filename=self.calling_filename,
+            calling_line_no=self.calling_line_no,
+            called_obj=self.called_obj,
+            called_filename=self.called_filename,
+            called_line_no=self.called_line_no,
+            msg=self.message.format(self.f_name, self.arg_string)
+        )
+
+        if self.time_it and self.duration_ns is not None:
+            msg += get_duration(0, self.duration_ns / 1000000000.0)
+
+            if self.gc_count:
+                msg += format_gc(self.gc_ns, self.gc_count)
+
+            if self.io_count:
+                msg += format_io(self.io_ns, self.io_count, self.io_bytes, self.io_waits)
+
+        if self.cpu_it and self.cpu_ns is not None:
+            msg += format_cpu(self.cpu_ns, self.duration_ns)
+
+        if self.blocks is not None:
+            msg += INDENT + 'memory: {0:+d} blocks'.format(self.blocks)
+            if self.peak_bytes is not None:
+                msg += ', peak {0}'.format(format_bytes(self.peak_bytes))
+            msg += '\n'
+
+        if self.exc_info is not None:
+            msg += INDENT + '{0} raised {1}\n'.format(self.f_name, self.exception)
+            for line in self.format_traceback().splitlines():
+                msg += INDENT + line + '\n'
+
+        elif self.result is not None:
+            msg += INDENT + '{0} => {1}\n'.format(self.f_name, self.result)
+
+        self._text = msg + '\n'
+        return self._text
+
+
+class SpanRecord(CallRecord):
+    """
+    A block of code timed with `angry_debugger.span`.
+    """
+
+    message = 'span: {0}{1}\n'
@@ -0,0 +1,566 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: capture and replay of calls
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+from __future__ import print_function
+import os
+import sys
+import mmap
+import struct
+import atexit
+import pickle
+import logging
+import importlib
+import threading
+from collections import namedtuple
+
+from .levels import HIGHEST_LEVEL
+from .utils import perf_counter_ns
+
+logger = logging.getLogger(__name__)
+
+# A capture file starts with MAGIC followed by frames. Every frame is
+#
+#   kind, call id, number of out of band buffers, size of the pickle
+#   the pickle
+#   for every buffer: the size of the buffer followed by the buffer
+#
+# Large buffers (bytes like objects that support pickle protocol 5) are not
+# copied into the pickle, they are written straight from the memory of the
+# object and when the file is read they are handed to pickle as slices of
+# the mmap'ed file.
+
+MAGIC = b'ADCAPT01'
+
+PICKLE_PROTOCOL = min(5, pickle.HIGHEST_PROTOCOL)
+
+_FRAME = struct.Struct('<BIIQ')
+_BUFFER = struct.Struct('<Q')
+
+FRAME_HEADER = 0
+FRAME_CALL = 1
+FRAME_RETURN = 2
+FRAME_RAISE = 3
+
+CapturedCall = namedtuple(
+    'CapturedCall',
+    ['call_id', 'args', 'kwargs', 'outcome', 'value']
+)
+
+
+# bytes and bytearray arguments and return values at least this big are
+# written out of band as well, normally pickle only does that for objects
+# like numpy arrays. pickle handles bytes and bytearray before it looks at
+# any reducer so they have to be wrapped.
+OUT_OF_BAND_SIZE = 64 * 1024
+
+
+def _load_bytes(buf, kind):
+    if kind == 'bytearray':
+        return bytearray(buf)
+
+    return bytes(buf)
+
+
+class _OutOfBand(object):
+
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        return (
+            _load_bytes,
+            (pickle.PickleBuffer(self.data), type(self.data).__name__)
+        )
+
+
+def _out_of_band(obj):
+    if (
+        PICKLE_PROTOCOL >= 5 and
+        type(obj) in (bytes, bytearray) and
+        len(obj) >= OUT_OF_BAND_SIZE
+    ):
+        return _OutOfBand(obj)
+
+    return obj
+
+
+def _dumps(obj):
+    if PICKLE_PROTOCOL < 5:
+        return pickle.dumps(obj, PICKLE_PROTOCOL), []
+
+    buffers = []
+
+    def buffer_callback(buf):
+        try:
+            buffers.append(buf.raw())
+        except BufferError:
+            # not contiguous, it has to go in band
+            return True
+
+        return False
+
+    data = pickle.dumps(obj, PICKLE_PROTOCOL, buffer_callback=buffer_callback)
+    return data, buffers
+
+
+class CaptureWriter(object):
+    """
+    Writes the calls made to a single function to a capture file.
+
+    The arguments are serialized before the function is called so anything
+    the function changes in them is not captured. If the arguments can not
+    be pickled the call is skipped. Nothing is captured once the writer has
+    been closed.
+    """
+
+    def __init__(self, path, func_name, limit=None):
+        self.path = os.path.abspath(path)
+        self.func_name = func_name
+        self.limit = limit
+        self.captured = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._file = None
+        self._closed = False
+
+    def _open(self):
+        # called with the lock held
+        self._file = open(self.path, 'wb')
+        self._file.write(MAGIC)
+        self._write_frame(FRAME_HEADER, 0, *_dumps({
+            'function': self.func_name,
+            'protocol': PICKLE_PROTOCOL,
+            'python': tuple(sys.version_info[:3])
+        }))
+
+    def _write_frame(self, kind, call_id, data, buffers):
+        write = self._file.write
+        write(_FRAME.pack(kind, call_id, len(buffers), len(data)))
+        write(data)
+
+        for buf in buffers:
+            write(_BUFFER.pack(buf.nbytes))
+            write(buf)
+
+    def _write(self, kind, call_id, obj):
+        # pickling happens outside of the lock, only the write is serialized
+        data, buffers = _dumps(obj)
+
+        with self._lock:
+            if self._file is not None:
+                self._write_frame(kind, call_id, data, buffers)
+
+    def before(self, args, kwargs):
+        """
+        Captures the arguments of a call, returns the id of the call or
+        `None` if it was not captured.
+        """
+        with self._lock:
+            if self._closed:
+                return None
+
+            if self.limit is not None and self._next_id >= self.limit:
+                return None
+
+            if self._file is None:
+                self._open()
+
+            self._next_id += 1
+            call_id = self._next_id
+
+        try:
+            self._write(
+                FRAME_CALL,
+                call_id,
+                (
+                    tuple(_out_of_band(arg) for arg in args),
+                    dict((k, _out_of_band(v)) for k, v in kwargs.items())
+                )
+            )
+        except Exception as err:
+            self.skipped += 1
+            logger.debug(
+                'unable to capture call to %s: %s',
+                self.func_name,
+                err
+            )
+            return None
+
+        self.captured += 1
+        return call_id
+
+    def after(self, call_id, result=None, exc_info=None):
+        if call_id is None:
+            return
+
+        try:
+            if exc_info is not None:
+                self._write(FRAME_RAISE, call_id, exc_info[1])
+            else:
+                self._write(FRAME_RETURN, call_id, _out_of_band(result))
+        except Exception:
+            # the result can not be pickled, the call can still be
+            # replayed, it just can not be checked.
+            pass
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            # opening the file again would truncate it
+            self._closed = True
+
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_captures = []
+
+
+def capture_writer(path, func_name, limit=None):
+    writer = CaptureWriter(path, func_name, limit)
+
+    if not _captures:
+        atexit.register(close_captures)
+
+    _captures.append(writer)
+    return writer
+
+
+def flush_captures():
+    for writer in _captures:
+        writer.flush()
+
+
+def close_captures():
+    """
+    Closes every capture file, this is done when the interpreter exits. The
+    calls made after this are not captured.
+    """
+    for writer in _captures:
+        writer.close()
+
+
+class CaptureReader(object):
+    """
+    Reads a capture file through `mmap`.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError('{0} is not a capture file'.format(self.path))
+
+        self._view = memoryview(self._mmap)
+        self.header = None
+
+        for kind, _, obj in self._frames():
+            if kind == FRAME_HEADER:
+                self.header = obj
+            break
+
+    @property
+    def func_name(self):
+        return self.header['function']
+
+    def _frames(self):
+        offset = len(MAGIC)
+        size = len(self._mmap)
+
+        while offset + _FRAME.size <= size:
+            kind, call_id, buffer_count, data_size = _FRAME.unpack_from(self._mmap, offset)
+            offset += _FRAME.size
+
+            data = self._view[offset:offset + data_size]
+            offset += data_size
+
+            buffers = []
+            for _ in range(buffer_count):
+                buffer_size = _BUFFER.unpack_from(self._mmap, offset)[0]
+                offset += _BUFFER.size
+                buffers.append(self._view[offset:offset + buffer_size])
+                offset += buffer_size
+
+            if offset > size:
+                # the process that wrote the file did not finish the frame
+                return
+
+            if buffers:
+                obj = pickle.loads(data, buffers=buffers)
+            else:
+                obj = pickle.loads(data)
+
+            yield kind, call_id, obj
+
+    def calls(self):
+        """
+        All of the captured calls in the order they were made. `outcome` is
+        `'return'`, `'raise'` or `None` if the result was not captured.
+        """
+        calls = {}
+        order = []
+
+        for kind, call_id, obj in self._frames():
+            if kind == FRAME_CALL:
+                calls[call_id] = [call_id, obj[0], obj[1], None, None]
+                order.append(call_id)
+            elif kind in (FRAME_RETURN, FRAME_RAISE) and call_id in calls:
+                calls[call_id][3] = 'return' if kind == FRAME_RETURN else 'raise'
+                calls[call_id][4] = obj
+
+        return [CapturedCall(*calls[call_id]) for call_id in order]
+
+    def close(self):
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            # something loaded from the file is still holding on to it, the
+            # mmap gets closed when that object is garbage collected.
+            pass
+
+
+def resolve_function(name):
+    """
+    Imports a function from a `module:qualified.name` string. If the function
+    is wrapped by `log_it` the original function is returned.
+    """
+    module_name, _, attr_path = name.partition(':')
+    obj = importlib.import_module(module_name)
+
+    for attr in attr_path.split('.'):
+        obj = getattr(obj, attr)
+
+    while hasattr(obj, '__wrapped__'):
+        obj = obj.__wrapped__
+
+    return obj
+
+
+def _percentile(durations, percent):
+    if not durations:
+        return 0
+
+    index = int(round((len(durations) - 1) * percent / 100.0))
+    return durations[index]
+
+
+class ReplayResult(object):
+
+    def __init__(self, durations, mismatches, errors, elapsed_ns):
+        self.durations = sorted(durations)
+        self.mismatches = mismatches
+        self.errors = errors
+        self.elapsed_ns = elapsed_ns
+
+    @property
+    def calls(self):
+        return len(self.durations)
+
+    @property
+    def throughput(self):
+        """
+        Calls per second.
+        """
+        if not self.elapsed_ns:
+            return 0.0
+
+        return self.calls / (self.elapsed_ns / 1000000000.0)
+
+    def percentile(self, percent):
+        return _percentile(self.durations, percent)
+
+    def __str__(self):
+        lines = [
+            'calls: {0}'.format(self.calls),
+            'throughput: {0:.1f} calls/sec'.format(self.throughput),
+            'mismatches: {0}'.format(self.mismatches),
+            'unexpected exceptions: {0}'.format(self.errors)
+        ]
+
+        if self.durations:
+            lines.append(
+                'latency min/p50/p90/p99/max: {0}/{1}/{2}/{3}/{4} ns'.format(
+                    self.durations[0],
+                    self.percentile(50),
+                    self.percentile(90),
+                    self.percentile(99),
+                    self.durations[-1]
+                )
+            )
+            lines.append(
+                'latency mean: {0:.0f} ns'.format(
+                    sum(self.durations) / float(len(self.durations))
+                )
+            )
+
+        return '\n'.join(lines)
+
+
+def replay_capture(path, func=None, repeat=1, check=False, warmup=0):
+    """
+    Calls a function with every set of arguments in a capture file.
+
+    The calls run in a tight loop `repeat` times over and every call is
+    timed. With `check` set the return values are compared to the ones that
+    were captured, a call that raised is expected to raise the same type of
+    exception. If `func` is not given it is imported using the name stored
+    in the capture file.
+
+    The arguments are loaded once and reused for every repeat, a function
+    that changes its arguments will see the changed values on the next pass.
+    """
+    reader = CaptureReader(path)
+    calls = []
+    try:
+        if func is None:
+            func = resolve_function(reader.func_name)
+
+        # objects loaded from out of band buffers can point straight into
+        # the file so it stays open until the calls are done.
+        calls = reader.calls()
+
+        for call in calls[:warmup]:
+            try:
+                func(*call.args, **call.kwargs)
+            except Exception:
+                pass
+
+        durations = []
+        append = durations.append
+        mismatches = 0
+        errors = 0
+        clock = perf_counter_ns
+
+        begin = clock()
+        for _ in range(repeat):
+            for call in calls:
+                args = call.args
+                kwargs = call.kwargs
+                start = clock()
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as err:
+                    append(clock() - start)
+
+                    if call.outcome == 'raise':
+                        if check and type(err) is not type(call.value):
+                            mismatches += 1
+                    else:
+                        errors += 1
+                    continue
+
+                append(clock() - start)
+
+                if check and call.outcome is not None:
+                    if call.outcome == 'raise':
+                        mismatches += 1
+                    else:
+                        try:
+                            if result != call.value:
+                                mismatches += 1
+                        except Exception:
+                            mismatches += 1
+    finally:
+        del calls[:]
+        reader.close()
+
+    return ReplayResult(durations, mismatches, errors, clock() - begin)
+
+
+def add_replay_parser(subparsers):
+    parser = subparsers.add_parser(
+        'replay',
+        help='replay a capture file as a benchmark',
+        description=(
+            'Calls the captured function with every set of captured '
+            'arguments in a tight loop and reports throughput and latency.'
+        )
+    )
+    parser.add_argument('path', help='path to the capture file')
+    parser.add_argument(
+        '--func',
+        help=(
+            'function to call as module:qualified.name, by default the '
+            'function the calls were captured from'
+        )
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='number of passes over the captured calls (default: 1)'
+    )
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=0,
+        help='number of captured calls to run before timing starts'
+    )
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='compare the results to the captured results'
+    )
+    parser.set_defaults(command=replay_command)
+    return parser
+
+
+def replay_command(args):
+    # the replayed function should not be slowed down by log_it. The levels
+    # of angry_debugger are all above CRITICAL so they have to be disabled
+    # as well, log_it does nothing but count the call for a level that is.
+    previous = logging.root.manager.disable
+    logging.disable(HIGHEST_LEVEL)
+
+    try:
+        func = resolve_function(args.func) if args.func else None
+        result = replay_capture(
+            args.path,
+            func,
+            repeat=args.repeat,
+            check=args.check,
+            warmup=args.warmup
+        )
+    finally:
+        logging.disable(previous)
+
+    print(result)
+
+    if args.check and result.mismatches:
+        return 1
+
+    return 0
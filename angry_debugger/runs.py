@@ -0,0 +1,595 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: logging runs
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import sys
+import time
+import random
+import threading
+import itertools
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+from .levels import LEVEL_CPU
+from .records import format_cpu, format_gc, get_duration as _get_duration, INDENT
+from .spans import SpanTree
+from .memo import make_key
+from .utils import thread_time_ns, format_ns
+
+
+# the runs that are active keyed by the run id
+_logging_runs = {}
+_unknown_logging = []
+_logging_run_lock = threading.Lock()
+_logging_run_counter = itertools.count(1)
+
+
+class _ThreadVar(object):
+    # stands in for a ContextVar where there is no contextvars module
+
+    def __init__(self, default=None):
+        self._local = threading.local()
+        self._default = default
+
+    def get(self):
+        return getattr(self._local, 'value', self._default)
+
+    def set(self, value):
+        self._local.value = value
+
+
+# The run is kept in a context variable. Every thread starts out with its
+# own context so for synchronous code this is the same as keying the runs
+# on the thread. Every asyncio task runs in a copy of the context it was
+# created in so each task gets its own run, a task created while a run is
+# active adds its records to that run until it starts one of its own.
+#
+# The records of the decorated calls and spans that are running are kept
+# the same way so the calls of two tasks that take turns on a thread do not
+# end up nested in each other. The stack is a tuple, a task gets the stack
+# of the call it was created in and every push or pop sets a new one so
+# whatever one task does is never seen by another.
+if contextvars is None:
+    _current_run = _ThreadVar()
+    _stack = _ThreadVar(())
+else:
+    _current_run = contextvars.ContextVar(
+        'angry_debugger_logging_run',
+        default=None
+    )
+    _stack = contextvars.ContextVar('angry_debugger_call_stack', default=())
+
+
+STAR_TEMPLATE = '*' * 20 + ' {0} Logging Run {1} ' + ('*' * 20) + '\n'
+
+
+_detect_redundant = False
+_redundant_min_count = 2
+
+
+def set_redundant_call_detection(enabled=True, min_count=2):
+    """
+    Looks for decorated calls that are made more than once with the same
+    arguments during a logging run, repeated config lookups or one query
+    per item instead of one for all of them. The calls that were repeated
+    at least `min_count` times are shown at the end of the run.
+
+    Only the runs started after this is called are looked at and nothing
+    is done for calls made outside of a run.
+    """
+    global _detect_redundant
+    global _redundant_min_count
+
+    _detect_redundant = enabled
+    _redundant_min_count = min_count
+
+
+class RedundantCall(object):
+    """
+    A function that was called `count` times with the same arguments during
+    a logging run. `wasted_ns` is the time all but one of those calls took.
+    """
+
+    def __init__(self, name, description, count, total_ns):
+        self.name = name
+        self.description = description
+        self.count = count
+        self.total_ns = total_ns
+        self.wasted_ns = total_ns - total_ns // count
+
+    def __repr__(self):
+        return '<RedundantCall {0} count={1} wasted={2}>'.format(
+            self.description,
+            self.count,
+            format_ns(self.wasted_ns)
+        )
+
+
+def _describe(name, args, kwargs, limit=120):
+    try:
+        text = ', '.join(
+            [repr(arg) for arg in args] +
+            ['{0}={1!r}'.format(key, value) for key, value in kwargs.items()]
+        )
+    except Exception:
+        text = '...'
+
+    if len(text) > limit:
+        text = text[:limit - 3] + '...'
+
+    return '{0}({1})'.format(name, text)
+
+
+def format_redundant_calls(calls, limit=20):
+    lines = [
+        INDENT + 'redundant calls:',
+        INDENT + '{0:>8} {1:>10}  call'.format('count', 'wasted')
+    ]
+
+    for call in calls[:limit]:
+        lines.append(
+            INDENT + '{0:>8} {1:>10}  {2}'.format(
+                call.count,
+                format_ns(call.wasted_ns),
+                call.description
+            )
+        )
+
+    if len(calls) > limit:
+        lines.append(INDENT + '{0} more'.format(len(calls) - limit))
+
+    return '\n'.join(lines) + '\n'
+
+
+class RunRecord(object):
+    """
+    The start or the stop of a logging run. It gets passed to the logger as
+    the message the same way a `CallRecord` does so a handler can tell where
+    a run starts and stops without having to look at the text.
+    """
+
+    def __init__(self, kind, run, text, stop=None, tree=None, redundant=None):
+        self.kind = kind
+        self.run_id = run.run_id
+        self.thread_name = run.thread.getName()
+        self.thread_id = run.thread.ident
+        self.start_ns = int(run.start * 1000000000)
+
+        if stop is None:
+            self.stop_ns = None
+        else:
+            self.stop_ns = int(stop * 1000000000)
+
+        self.tree = tree
+        self.redundant = redundant
+        self.gc_ns = run.gc_ns
+        self.gc_count = run.gc_count
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+
+def _current_task():
+    # only look for a task if asyncio has been imported by something else
+    asyncio = sys.modules.get('asyncio', None)
+    current_task = getattr(asyncio, 'current_task', None)
+
+    if current_task is None:
+        return None
+
+    try:
+        return current_task()
+    except RuntimeError:
+        # no event loop running in this thread
+        return None
+
+
+def _run_name(thread, task):
+    name = thread.getName()
+
+    if task is not None and hasattr(task, 'get_name'):
+        name += ' ' + task.get_name()
+
+    return name
+
+
+class _LoggingRun(object):
+
+    def __init__(self, thread, owner, parent=None):
+        self.thread = thread
+        self.name = _run_name(thread, owner if owner is not thread else None)
+        # the task or the thread that started the run, it is the only one
+        # that can end it
+        self.owner = owner
+        # the run this one hides from the task that started it, a task that
+        # starts a run while it is in the run of the task that created it
+        self.parent = parent
+        self.run_id = next(_logging_run_counter)
+        self.records = []
+        self.finished = False
+        self.start = time.time()
+        self.cpu_start = thread_time_ns()
+        self.gc_ns = 0
+        self.gc_count = 0
+
+        if _detect_redundant:
+            # (name, argument hash) -> [count, total_ns, description]
+            self.fingerprints = {}
+        else:
+            self.fingerprints = None
+
+    def add_call(self, name, args, kwargs, duration_ns):
+        """
+        Fingerprints a decorated call for the redundant call detection.
+        """
+        key = (name, make_key(args, kwargs)[0])
+        entry = self.fingerprints.get(key, None)
+
+        if entry is None:
+            self.fingerprints[key] = [1, duration_ns, None]
+            return
+
+        entry[0] += 1
+        entry[1] += duration_ns
+
+        # the arguments are only turned into text once they repeat
+        if entry[2] is None:
+            entry[2] = _describe(name, args, kwargs)
+
+    def redundant_calls(self, min_count=None):
+        """
+        The calls that were made at least `min_count` times with the same
+        arguments, the ones that wasted the most time first.
+        """
+        if not self.fingerprints:
+            return []
+
+        if min_count is None:
+            min_count = _redundant_min_count
+
+        calls = [
+            RedundantCall(name, description, count, total_ns)
+            for (name, _), (count, total_ns, description)
+            in list(self.fingerprints.items())
+            if count >= min_count
+        ]
+        calls.sort(key=lambda call: call.wasted_ns, reverse=True)
+        return calls
+
+    def span_tree(self):
+        return SpanTree(record[2] for record in self.records)
+
+    def flush(self):
+        if not self.records:
+            return None
+
+        name = self.name
+        tree = self.span_tree()
+
+        lgr, level = self.records[0][:2]
+        lgr.log(level, RunRecord('start', self, STAR_TEMPLATE.format('Start', name)))
+
+        for lgr, level, msg in self.records:
+            lgr.log(level, msg)
+
+        stop = time.time()
+
+        if tree:
+            msg = tree.format()
+        else:
+            msg = ''
+
+        redundant = self.redundant_calls()
+        if redundant:
+            text = format_redundant_calls(redundant)
+
+            # the first line is the one that gets the prefix from the log
+            # format
+            msg += text if msg else text.lstrip()
+
+        msg += _get_duration(self.start, stop)
+
+        if self.gc_count:
+            msg += format_gc(self.gc_ns, self.gc_count)
+
+        if level | LEVEL_CPU == level and self.cpu_start is not None:
+            msg += format_cpu(
+                thread_time_ns() - self.cpu_start,
+                int((stop - self.start) * 1000000000)
+            )
+
+        msg += STAR_TEMPLATE.format('Stop', name)
+
+        lgr.log(level, RunRecord('stop', self, msg, stop, tree, redundant))
+        return tree
+
+
+class RunRetention(object):
+    """
+    Decides which logging runs get written out once they end.
+
+    A run is kept if it took at least `min_duration_ms`, if a decorated call
+    made during it raised an exception (`keep_errors`) or if it is one of
+    the `sample_rate` share of runs picked at random. Everything else is
+    thrown away without any of it being formatted, the arguments and the
+    return values of the calls included.
+    """
+
+    def __init__(self, min_duration_ms=None, keep_errors=True, sample_rate=0.0):
+        if min_duration_ms is None:
+            self.min_duration = None
+        else:
+            self.min_duration = min_duration_ms / 1000.0
+
+        self.keep_errors = keep_errors
+        self.sample_rate = float(sample_rate)
+        self.kept = 0
+        self.dropped = 0
+
+    def keep(self, run):
+        if (
+            self.min_duration is not None and
+            time.time() - run.start >= self.min_duration
+        ):
+            return True
+
+        if self.keep_errors:
+            for record in run.records:
+                if getattr(record[2], 'exc_info', None) is not None:
+                    return True
+
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def __repr__(self):
+        return '<RunRetention kept={0} dropped={1}>'.format(
+            self.kept,
+            self.dropped
+        )
+
+
+_retention = None
+
+
+def set_run_retention(min_duration_ms=None, keep_errors=True, sample_rate=0.0):
+    """
+    Only writes out the logging runs that are worth looking at, see
+    `RunRetention`. The decision is made when the run ends so the records
+    are collected the same as always, a run that is dropped just never gets
+    formatted. Returns the `RunRetention` so you can see how many runs were
+    kept and dropped.
+    """
+    global _retention
+
+    _retention = RunRetention(min_duration_ms, keep_errors, sample_rate)
+    return _retention
+
+
+def clear_run_retention():
+    """
+    Goes back to writing out every logging run.
+    """
+    global _retention
+
+    _retention = None
+
+
+def _finish_run(run):
+    retention = _retention
+
+    if retention is not None and run.records:
+        if not retention.keep(run):
+            retention.dropped += 1
+            return None
+
+        retention.kept += 1
+
+    return run.flush()
+
+
+def _active_run():
+    # a task can outlive the run it inherited, it is back in the run that
+    # one was hiding
+    run = _current_run.get()
+
+    while run is not None and run.finished:
+        run = run.parent
+
+    return run
+
+
+def emit(lgr, lgr_level, msg):
+    """
+    Sends a message to the logger, or holds on to it if a logging run is
+    active.
+    """
+    run = _active_run()
+
+    if run is not None:
+        run.records.append([lgr, lgr_level, msg])
+    elif _logging_runs:
+        _unknown_logging.append([lgr, lgr_level, msg])
+    else:
+        lgr.log(lgr_level, msg)
+
+
+def current_run():
+    """
+    The logging run that is active for the calling thread or asyncio task,
+    `None` if there is not one.
+    """
+    return _active_run()
+
+
+def call_stack():
+    """
+    The records for the decorated calls that are running in the calling
+    thread or asyncio task, the outermost call is first.
+    """
+    return _stack.get()
+
+
+def push_call(record):
+    """
+    Puts the record of a decorated call or span that is starting on top of
+    the call stack. Returns the stack it was put on, the last record in it
+    is the one of the call that made this one.
+    """
+    stack = _stack.get()
+    _stack.set(stack + (record,))
+    return stack
+
+
+def pop_call(record):
+    """
+    Takes the record of a decorated call or span that finished off of the
+    call stack. Returns what is left on it.
+    """
+    stack = _stack.get()
+
+    if stack and stack[-1] is record:
+        stack = stack[:-1]
+    elif record in stack:
+        # a span that was entered in a generator and left after it yielded
+        stack = tuple(item for item in stack if item is not record)
+    else:
+        return stack
+
+    _stack.set(stack)
+    return stack
+
+
+def current_call():
+    """
+    The record for the innermost decorated call running in the calling
+    thread or asyncio task or `None`.
+    """
+    stack = _stack.get()
+    if stack:
+        return stack[-1]
+
+    return None
+
+
+def _flush_unknown_logging():
+    for lgr, level, msg in _unknown_logging[:]:
+        _unknown_logging.remove([lgr, level, msg])
+        lgr.log(level, msg)
+
+
+def _owner(thread):
+    task = _current_task()
+
+    if task is None:
+        return thread
+
+    return task
+
+
+def _pop_run(owner):
+    """
+    Takes the run that `owner` started out of the current context and puts
+    back the run it was hiding. A run that was inherited from the task or
+    the context it was copied from is left alone, it belongs to the one
+    that started it.
+    """
+    run = _active_run()
+
+    if run is None or run.owner is not owner:
+        return None
+
+    parent = run.parent
+    while parent is not None and parent.finished:
+        parent = parent.parent
+
+    _current_run.set(parent)
+
+    run.finished = True
+    run.owner = None
+    del _logging_runs[run.run_id]
+    return run
+
+
+def start_logging_run():
+    """
+    Starts a logging run for the calling thread or asyncio task. If the
+    caller already started one it is ended first.
+
+    A task that starts a run while it is in the run of the task that
+    created it gets a run of its own, the run of the other task is not
+    touched and the task is back in it once its own run ends.
+    """
+    thread = threading.current_thread()
+    owner = _owner(thread)
+
+    with _logging_run_lock:
+        _flush_unknown_logging()
+
+        # the old run is taken out before it is flushed so nothing that
+        # happens while it is being written out can get added to it.
+        run = _pop_run(owner)
+        if run is not None:
+            _finish_run(run)
+
+        parent = _active_run()
+        run = _LoggingRun(thread, owner, parent)
+        _logging_runs[run.run_id] = run
+        _current_run.set(run)
+
+
+def end_logging_run():
+    """
+    Ends the logging run the calling thread or asyncio task started and
+    writes it out. The `SpanTree` of the run is returned, `None` if there
+    was no run, nothing was logged during it or it was dropped by
+    `set_run_retention`.
+
+    The run of another task, one that the caller is only in because it was
+    created while that run was active, is not ended.
+    """
+    thread = threading.current_thread()
+    owner = _owner(thread)
+
+    with _logging_run_lock:
+        _flush_unknown_logging()
+
+        run = _pop_run(owner)
+        if run is not None:
+            return _finish_run(run)
+
+    return None
+
+
+def logging_run(func):
+    def wrapper(*args, **kwargs):
+        start_logging_run()
+        result = func(*args, **kwargs)
+        end_logging_run()
+        return result
+
+    return wrapper
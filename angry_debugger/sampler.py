@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: statistical sampling of the stacks of every thread
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import sys
+import atexit
+import threading
+
+from . import control as _control
+from .stats import get_stats, get_function_stats
+from .utils import perf_counter_ns, format_ns, is_package_file
+
+try:
+    from threading import get_ident
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from thread import get_ident
+
+
+class Sampler(threading.Thread):
+    """
+    Looks at the stack of every thread `interval_ms` apart.
+
+    A sample is attributed to the innermost function on the stack that is
+    decorated with `log_it` or that is in one of `packages` (module names,
+    a package matches all of the modules in it). A decorated function is
+    counted under the same name its function statistics use, a package
+    under "<package> (package)". Every decorated function further out on
+    the stack gets the sample as well so there is a self and a total count
+    the same way there is for the calls. The time of a sample is the time
+    since the sample before it.
+
+    This is wall clock time, a thread that is sleeping or waiting on a lock
+    gets samples the same as one that is running. The cost is the same for
+    every sample no matter how many calls get made, the frames of
+    angry_debugger are left out of the stacks.
+    """
+
+    def __init__(self, interval_ms=5.0, packages=None, max_depth=256):
+        threading.Thread.__init__(self, name='angry_debugger sampler')
+        self.daemon = True
+        self.interval_ns = int(interval_ms * 1000000)
+        self.packages = tuple(packages or ())
+        self.max_depth = max_depth
+        self.samples = 0
+        # folded stack -> samples
+        self.stacks = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # code object -> (name, decorated, package) or None to leave it out
+        self._codes = {}
+
+    def run(self):
+        ident = get_ident()
+        interval = self.interval_ns / 1000000000.0
+        last = perf_counter_ns()
+
+        while not self._stop_event.wait(interval):
+            now = perf_counter_ns()
+            # a process that was suspended does not get charged for it
+            weight_ns = min(now - last, self.interval_ns * 10)
+            last = now
+
+            self.sample(weight_ns, ident)
+
+    def stop(self):
+        self._stop_event.set()
+
+        if self.is_alive() and self is not threading.current_thread():
+            self.join()
+
+    def _info(self, frame):
+        code = frame.f_code
+
+        try:
+            return self._codes[code]
+        except KeyError:
+            pass
+
+        if is_package_file(code.co_filename):
+            info = None
+        else:
+            name = _control._codes.get(code, None)
+            module = frame.f_globals.get('__name__', '<string>')
+
+            for package in self.packages:
+                if module == package or module.startswith(package + '.'):
+                    break
+            else:
+                package = None
+
+            if name is None:
+                info = (
+                    '{0}.{1}'.format(
+                        module,
+                        getattr(code, 'co_qualname', code.co_name)
+                    ).replace(';', ','),
+                    False,
+                    package
+                )
+            else:
+                info = (name, True, package)
+
+        self._codes[code] = info
+        return info
+
+    def sample(self, weight_ns, ident=None):
+        """
+        Takes one sample of every thread except `ident`.
+        """
+        frames = sys._current_frames()
+
+        try:
+            for thread_id, frame in frames.items():
+                if thread_id == ident:
+                    continue
+
+                path = []
+                owner = None
+                decorated = set()
+                depth = 0
+
+                while frame is not None and depth < self.max_depth:
+                    info = self._info(frame)
+                    frame = frame.f_back
+                    depth += 1
+
+                    if info is None:
+                        continue
+
+                    name, is_decorated, package = info
+                    path.append(name)
+
+                    if is_decorated:
+                        decorated.add(name)
+
+                        if owner is None:
+                            owner = name
+
+                    elif owner is None and package is not None:
+                        owner = package + ' (package)'
+
+                if not path:
+                    continue
+
+                path.reverse()
+                path = ';'.join(path)
+
+                with self._lock:
+                    self.samples += 1
+                    self.stacks[path] = self.stacks.get(path, 0) + 1
+
+                if owner is not None:
+                    get_stats(owner).add_sample(weight_ns, True)
+
+                for name in decorated:
+                    if name != owner:
+                        get_stats(name).add_sample(weight_ns, False)
+        finally:
+            # the frames keep every local variable of every thread alive
+            del frames
+
+    def reset(self):
+        with self._lock:
+            self.samples = 0
+            self.stacks = {}
+
+    def format_folded(self):
+        """
+        The stacks that were sampled as folded stacks, one line for each
+        stack with the number of samples. `flamegraph.pl` and speedscope
+        read this format.
+        """
+        with self._lock:
+            stacks = sorted(self.stacks.items())
+
+        return ''.join('{0} {1}\n'.format(path, count) for path, count in stacks)
+
+    def write_folded(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.format_folded())
+
+    def __repr__(self):
+        return '<Sampler interval={0} samples={1}>'.format(
+            format_ns(self.interval_ns),
+            self.samples
+        )
+
+
+_sampler = None
+
+
+def start_sampling(interval_ms=5.0, packages=None):
+    """
+    Starts sampling the stacks of every thread in the background, see
+    `Sampler`. A sampler that is already running is stopped first. Returns
+    the `Sampler`.
+
+    The samples go into the function statistics (`samples`, `sampled_ns`,
+    `self_samples` and `self_sampled_ns`) of the decorated functions so
+    those can be measured with the logging turned off.
+    """
+    global _sampler
+
+    stop_sampling()
+
+    _sampler = Sampler(interval_ms, packages)
+    _sampler.start()
+    atexit.register(stop_sampling)
+    return _sampler
+
+
+def stop_sampling():
+    """
+    Stops the sampler and returns it so the results can still be read,
+    `None` if it was not running.
+    """
+    global _sampler
+
+    sampler = _sampler
+    _sampler = None
+
+    if sampler is not None:
+        sampler.stop()
+
+    return sampler
+
+
+def get_sampler():
+    """
+    The running `Sampler` or `None`.
+    """
+    return _sampler
+
+
+def format_sample_report(limit=None):
+    """
+    The functions and packages that got the most samples attributed to
+    them. "self" is the share of the samples where the function was the
+    innermost one, "total" the share where it was anywhere on the stack.
+    """
+    functions = get_function_stats().values()
+    samples = sum(item.self_samples for item in functions)
+
+    if not samples:
+        return ''
+
+    functions = sorted(
+        (item for item in functions if item.samples),
+        key=lambda item: (item.self_samples, item.samples),
+        reverse=True
+    )
+
+    if limit is not None:
+        functions = functions[:limit]
+
+    lines = [
+        '{0:>7} {1:>10} {2:>7} {3:>10}  function\n'.format(
+            'self',
+            'self time',
+            'total',
+            'total time'
+        )
+    ]
+
+    for item in functions:
+        lines.append(
+            '{0:>7.1%} {1:>10} {2:>7.1%} {3:>10}  {4}\n'.format(
+                item.self_samples / float(samples),
+                format_ns(item.self_sampled_ns),
+                item.samples / float(samples),
+                format_ns(item.sampled_ns),
+                item.name
+            )
+        )
+
+    return ''.join(lines)
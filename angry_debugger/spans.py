@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: span tree of a logging run
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+from .records import CallRecord, INDENT
+from .utils import format_ns
+
+
+class Span(object):
+    """
+    A single decorated call in a logging run.
+
+    `total_ns` is how long the call took, `self_ns` is that minus the time
+    spent in the decorated calls it made. Time spent in functions that are
+    not decorated is counted as self time of the decorated function that
+    called them.
+    """
+
+    def __init__(self, record, depth):
+        self.span_id = record.span_id
+        self.parent_id = record.parent_id
+        self.depth = depth
+        self.name = record.called_obj
+        self.start_ns = record.timestamp_ns
+        self.total_ns = record.duration_ns or 0
+        self.self_ns = record.self_ns or 0
+        self.exception = record.exception
+        self.record = record
+        self.children = []
+
+    def walk(self):
+        """
+        This span and everything under it in the order the calls were made.
+        """
+        yield self
+
+        for child in self.children:
+            for span in child.walk():
+                yield span
+
+    def __repr__(self):
+        return '<Span {0} {1} total={2} self={3}>'.format(
+            self.span_id,
+            self.name,
+            format_ns(self.total_ns),
+            format_ns(self.self_ns)
+        )
+
+
+class SpanTree(object):
+    """
+    The decorated calls of a logging run nested the way they were made.
+
+    A call whose caller is not a part of the run, because the caller started
+    before the run did or was still running when the run ended, is a root.
+    """
+
+    def __init__(self, records):
+        self.roots = []
+        self.spans = {}
+
+        # span ids are handed out when a call starts so sorting on them puts
+        # the calls back into the order they were made in.
+        records = sorted(
+            (record for record in records if isinstance(record, CallRecord)),
+            key=lambda r: r.span_id
+        )
+
+        for record in records:
+            parent = self.spans.get(record.parent_id, None)
+
+            if parent is None:
+                span = Span(record, 0)
+                self.roots.append(span)
+            else:
+                span = Span(record, parent.depth + 1)
+                parent.children.append(span)
+
+            self.spans[span.span_id] = span
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __iter__(self):
+        return self.walk()
+
+    def walk(self):
+        for root in self.roots:
+            for span in root.walk():
+                yield span
+
+    @property
+    def total_ns(self):
+        return sum(root.total_ns for root in self.roots)
+
+    def self_time(self):
+        """
+        Self time added up for each function, `[(name, calls, self_ns,
+        total_ns)]` with the function that used the most time on its own
+        first.
+
+        `total_ns` only counts the outermost call when a function calls
+        itself so recursion does not count the same time more than once.
+        """
+        res = {}
+
+        def add(span, active):
+            entry = res.setdefault(span.name, [span.name, 0, 0, 0])
+            entry[1] += 1
+            entry[2] += span.self_ns
+
+            if span.name not in active:
+                entry[3] += span.total_ns
+
+            active = active | {span.name}
+            for child in span.children:
+                add(child, active)
+
+        for root in self.roots:
+            add(root, frozenset())
+
+        return sorted(
+            (tuple(entry) for entry in res.values()),
+            key=lambda entry: entry[2],
+            reverse=True
+        )
+
+    def format(self):
+        # the first line is the one that gets the prefix from the log format
+        lines = [
+            'span tree:',
+            INDENT + '{0:>10} {1:>10}  function'.format('total', 'self')
+        ]
+
+        for span in self.walk():
+            line = INDENT + '{0:>10} {1:>10}  {2}{3}'.format(
+                format_ns(span.total_ns),
+                format_ns(span.self_ns),
+                '  ' * span.depth,
+                span.name
+            )
+
+            if span.exception is not None:
+                line += ' raised ' + span.exception
+
+            lines.append(line)
+
+        return '\n'.join(lines) + '\n'
+
+    def format_folded(self):
+        """
+        The tree as folded stacks, one line for each path with the self time
+        in nanoseconds, the format `flamegraph.pl` and speedscope read. The
+        sampler writes the same format.
+        """
+        res = {}
+
+        def add(span, path):
+            path = path + (span.name.replace(';', ','),)
+            res[path] = res.get(path, 0) + span.self_ns
+
+            for child in span.children:
+                add(child, path)
+
+        for root in self.roots:
+            add(root, ())
+
+        return ''.join(
+            '{0} {1}\n'.format(';'.join(path), value)
+            for path, value in sorted(res.items())
+            if value > 0
+        )
+
+    def __str__(self):
+        return self.format()
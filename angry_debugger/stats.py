@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: per function statistics
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import os
+import threading
+
+
+# Durations are counted in a log linear histogram. Every power of 2 is split
+# into 4 buckets so a percentile read from the histogram is never more than
+# 25% off. 256 buckets covers everything that fits into 64 bits.
+HISTOGRAM_SIZE = 256
+
+
+def histogram_bucket(duration_ns):
+    duration_ns = int(duration_ns)
+
+    if duration_ns < 4:
+        return max(duration_ns, 0)
+
+    bits = duration_ns.bit_length()
+    return (bits - 2) * 4 + ((duration_ns >> (bits - 3)) & 3)
+
+
+def bucket_bounds(bucket):
+    """
+    The lowest and highest duration in nanoseconds a bucket holds.
+    """
+    if bucket < 4:
+        return bucket, bucket
+
+    shift = bucket // 4 - 1
+    low = (4 + bucket % 4) << shift
+    return low, low + (1 << shift) - 1
+
+
+def histogram_percentile(histogram, percent):
+    """
+    Reads a percentile from a histogram, the middle of the bucket the
+    percentile falls into is returned.
+    """
+    count = sum(histogram)
+    if not count:
+        return 0.0
+
+    target = count * percent / 100.0
+    seen = 0
+
+    for bucket, bucket_count in enumerate(histogram):
+        seen += bucket_count
+        if bucket_count and seen >= target:
+            low, high = bucket_bounds(bucket)
+            return (low + high) / 2.0
+
+    return 0.0
+
+
+class FunctionStats(object):
+    """
+    Running totals for a single decorated function.
+
+    The counters are updated without a lock, they cost next to nothing on
+    a call but two calls that finish on different threads at the same time
+    can lose one of the updates. They are a close approximation and not an
+    exact count.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.histogram = [0] * HISTOGRAM_SIZE
+        self.cpu_calls = 0
+        self.cpu_total_ns = 0
+        self.cpu_wall_ns = 0
+        self.memory_calls = 0
+        self.blocks_total = 0
+        self.peak_samples = 0
+        self.peak_total = 0
+        self.peak_max = 0
+        self.gc_calls = 0
+        self.gc_count = 0
+        self.gc_ns = 0
+        self.io_calls = 0
+        self.io_count = 0
+        self.io_bytes = 0
+        self.io_ns = 0
+        self.samples = 0
+        self.sampled_ns = 0
+        self.self_samples = 0
+        self.self_sampled_ns = 0
+        self.slot = None
+
+    @property
+    def error_rate(self):
+        if not self.calls:
+            return 0.0
+
+        return self.errors / float(self.calls)
+
+    @property
+    def mean_ns(self):
+        if not self.calls:
+            return 0.0
+
+        return self.total_ns / float(self.calls)
+
+    @property
+    def off_cpu(self):
+        """
+        Share of the time spent in the calls that were timed with
+        `LEVEL_CPU` that was not spent running on the CPU.
+        """
+        if not self.cpu_wall_ns:
+            return 0.0
+
+        return max(0.0, 1.0 - self.cpu_total_ns / float(self.cpu_wall_ns))
+
+    def add_cpu(self, cpu_ns, duration_ns):
+        self.cpu_calls += 1
+        self.cpu_total_ns += cpu_ns
+        self.cpu_wall_ns += duration_ns
+
+    @property
+    def mean_blocks(self):
+        if not self.memory_calls:
+            return 0.0
+
+        return self.blocks_total / float(self.memory_calls)
+
+    @property
+    def mean_peak_bytes(self):
+        if not self.peak_samples:
+            return 0.0
+
+        return self.peak_total / float(self.peak_samples)
+
+    def add_memory(self, blocks, peak_bytes):
+        self.memory_calls += 1
+        self.blocks_total += blocks
+
+        if peak_bytes is not None:
+            self.peak_samples += 1
+            self.peak_total += peak_bytes
+            self.peak_max = max(self.peak_max, peak_bytes)
+
+    @property
+    def gc_share(self):
+        """
+        Share of the time spent in the calls that went to garbage collector
+        pauses, only counted while `track_gc_pauses` is on.
+        """
+        if not self.total_ns:
+            return 0.0
+
+        return self.gc_ns / float(self.total_ns)
+
+    def add_gc(self, gc_ns, gc_count):
+        self.gc_calls += 1
+        self.gc_count += gc_count
+        self.gc_ns += gc_ns
+
+    @property
+    def io_share(self):
+        """
+        Share of the time spent in the calls that went to waiting on I/O,
+        only counted while `instrument_io` is on.
+        """
+        if not self.total_ns:
+            return 0.0
+
+        return self.io_ns / float(self.total_ns)
+
+    def add_io(self, io_ns, io_count, io_bytes):
+        self.io_calls += 1
+        self.io_count += io_count
+        self.io_bytes += io_bytes
+        self.io_ns += io_ns
+
+    def add_sample(self, weight_ns, innermost):
+        """
+        Adds a sample taken by the sampler, `innermost` is `True` if the
+        function is the one the sample is attributed to and `False` if it
+        was only further out on the stack.
+        """
+        self.samples += 1
+        self.sampled_ns += weight_ns
+
+        if innermost:
+            self.self_samples += 1
+            self.self_sampled_ns += weight_ns
+
+    def percentile(self, percent):
+        return histogram_percentile(self.histogram, percent)
+
+    def add(self, duration_ns, error=False):
+        bucket = histogram_bucket(duration_ns)
+
+        self.calls += 1
+        self.total_ns += duration_ns
+        self.histogram[bucket] += 1
+
+        if error:
+            self.errors += 1
+
+        # reset_function_stats can take the slot away on another thread
+        slot = self.slot
+        if slot is not None:
+            slot.update(self, bucket)
+
+    def __repr__(self):
+        return (
+            '<FunctionStats {0} calls={1} errors={2} error_rate={3:.2%}>'.format(
+                self.name,
+                self.calls,
+                self.errors,
+                self.error_rate
+            )
+        )
+
+
+_function_stats = {}
+_function_stats_lock = threading.Lock()
+_publisher = None
+
+
+def set_publisher(publisher):
+    """
+    Sets the object every `FunctionStats` gets a slot from. The slot is
+    updated every time the stats are. Passing `None` stops publishing.
+    """
+    global _publisher
+
+    with _function_stats_lock:
+        _publisher = publisher
+
+        for stats in _function_stats.values():
+            if publisher is None:
+                stats.slot = None
+            else:
+                stats.slot = publisher.allocate(stats)
+
+
+def get_stats(name):
+    """
+    Gets the `FunctionStats` instance for a dotted function name. It is
+    created if it does not exist.
+    """
+    try:
+        return _function_stats[name]
+    except KeyError:
+        with _function_stats_lock:
+            if name not in _function_stats:
+                stats = FunctionStats(name)
+                if _publisher is not None:
+                    stats.slot = _publisher.allocate(stats)
+
+                _function_stats[name] = stats
+
+            return _function_stats[name]
+
+
+def get_function_stats():
+    """
+    Returns a copy of the statistics for all of the decorated functions that
+    have been called. The keys are the dotted function names.
+    """
+    with _function_stats_lock:
+        return dict(_function_stats)
+
+
+def reset_function_stats():
+    """
+    Clears the statistics. The slots they had in the shared memory of the
+    publisher are handed back so the functions called after this start
+    filling them up again from the first one.
+    """
+    with _function_stats_lock:
+        for stats in _function_stats.values():
+            # a call that is finishing on another thread may still be
+            # holding on to the old stats
+            stats.slot = None
+
+        _function_stats.clear()
+
+        if _publisher is not None:
+            _publisher.release_all()
+
+
+def _after_fork():
+    # a thread that was updating the stats when the process forked does not
+    # exist in the child, whatever lock it was holding would never be
+    # released.
+    global _function_stats_lock
+
+    _function_stats_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
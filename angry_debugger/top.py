@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: live statistics in shared memory
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+import atexit
+import struct
+
+from . import stats as _stats
+from .utils import time_ns, format_ns
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+# The segment starts with a header followed by a fixed number of slots, one
+# slot for every decorated function. A slot is only ever written to by the
+# process that owns the segment. Nothing is locked, every counter is written
+# with a single `pack_into` from the totals the process already keeps so a
+# reader can only ever see a value that is slightly out of date.
+
+MAGIC = b'ADSTATS1'
+
+_HEADER = struct.Struct('<8sIIIq')
+_NAME_SIZE = 120
+_NAME = struct.Struct('<{0}s'.format(_NAME_SIZE))
+_COUNTERS = struct.Struct('<QQQ')
+_BUCKET = struct.Struct('<Q')
+_HISTOGRAM = struct.Struct('<{0}Q'.format(_stats.HISTOGRAM_SIZE))
+
+SLOT_SIZE = _NAME.size + _COUNTERS.size + _HISTOGRAM.size
+
+
+def segment_name(pid):
+    return 'angry_debugger_{0}'.format(pid)
+
+
+class Slot(object):
+
+    def __init__(self, buf, offset):
+        self._buf = buf
+        self._counters = offset + _NAME.size
+        self._histogram = self._counters + _COUNTERS.size
+
+    def update(self, stats, bucket):
+        try:
+            _COUNTERS.pack_into(
+                self._buf,
+                self._counters,
+                stats.calls,
+                stats.errors,
+                stats.total_ns
+            )
+            _BUCKET.pack_into(
+                self._buf,
+                self._histogram + bucket * _BUCKET.size,
+                stats.histogram[bucket]
+            )
+        except ValueError:
+            # publishing was stopped by another thread
+            pass
+
+
+class StatsPublisher(object):
+    """
+    Owns the shared memory segment for this process.
+    """
+
+    def __init__(self, max_functions=512):
+        if shared_memory is None:
+            raise RuntimeError(
+                'publishing statistics needs multiprocessing.shared_memory '
+                '(Python 3.8+)'
+            )
+
+        self.max_functions = max_functions
+        self.used = 0
+        self.start_ns = time_ns()
+        self._shm = shared_memory.SharedMemory(
+            name=segment_name(os.getpid()),
+            create=True,
+            size=_HEADER.size + SLOT_SIZE * max_functions
+        )
+        self._buf = self._shm.buf
+        self._write_header()
+
+    def _write_header(self):
+        _HEADER.pack_into(
+            self._buf,
+            0,
+            MAGIC,
+            self.max_functions,
+            self.used,
+            SLOT_SIZE,
+            self.start_ns
+        )
+
+    def allocate(self, stats):
+        if self.used >= self.max_functions:
+            return None
+
+        offset = _HEADER.size + SLOT_SIZE * self.used
+        _NAME.pack_into(
+            self._buf,
+            offset,
+            stats.name.encode('utf-8')[:_NAME_SIZE]
+        )
+
+        slot = Slot(self._buf, offset)
+        _COUNTERS.pack_into(
+            self._buf,
+            offset + _NAME.size,
+            stats.calls,
+            stats.errors,
+            stats.total_ns
+        )
+        _HISTOGRAM.pack_into(
+            self._buf,
+            offset + _NAME.size + _COUNTERS.size,
+            *stats.histogram
+        )
+
+        # the slot is only made visible to a reader once it is filled in
+        self.used += 1
+        self._write_header()
+        return slot
+
+    def release_all(self):
+        """
+        Hands back every slot, the next one allocated is the first one
+        again.
+        """
+        self.used = 0
+        self._write_header()
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except OSError:
+            pass
+
+
+_publisher = None
+
+
+def publish_stats(max_functions=512):
+    """
+    Starts publishing the statistics of every decorated function into a
+    shared memory segment so they can be watched from another process with
+
+    python -m angry_debugger top {pid}
+
+    The only thing this adds to a call is writing the new counter values
+    into the segment.
+    """
+    global _publisher
+
+    if _publisher is None:
+        _publisher = StatsPublisher(max_functions)
+        _stats.set_publisher(_publisher)
+        atexit.register(unpublish_stats)
+
+
+def unpublish_stats():
+    global _publisher
+
+    if _publisher is not None:
+        _stats.set_publisher(None)
+        _publisher.close()
+        _publisher = None
+
+
+class StatsReader(object):
+    """
+    Reads the statistics another process is publishing.
+    """
+
+    def __init__(self, pid):
+        if shared_memory is None:
+            raise RuntimeError(
+                'reading statistics needs multiprocessing.shared_memory '
+                '(Python 3.8+)'
+            )
+
+        try:
+            self._shm = shared_memory.SharedMemory(
+                name=segment_name(pid),
+                track=False
+            )
+        except TypeError:
+            self._shm = shared_memory.SharedMemory(name=segment_name(pid))
+
+            # before Python 3.13 the resource tracker of the process that
+            # attaches to a segment unlinks it when that process exits.
+            # That would pull the segment out from under the process
+            # being watched.
+            try:
+                from multiprocessing import resource_tracker
+                # noinspection PyProtectedMember
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+            except (ImportError, AttributeError):
+                pass
+
+        magic, _, _, slot_size, self.start_ns = _HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC or slot_size != SLOT_SIZE:
+            self.close()
+            raise ValueError('process {0} is not publishing statistics'.format(pid))
+
+    def read(self):
+        """
+        Snapshot of the published statistics, `{name: (calls, errors,
+        total_ns, histogram)}`
+        """
+        buf = self._shm.buf
+        used = _HEADER.unpack_from(buf, 0)[2]
+        res = {}
+
+        for i in range(used):
+            offset = _HEADER.size + SLOT_SIZE * i
+            name = _NAME.unpack_from(buf, offset)[0].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += _NAME.size
+            calls, errors, total_ns = _COUNTERS.unpack_from(buf, offset)
+            histogram = _HISTOGRAM.unpack_from(buf, offset + _COUNTERS.size)
+            res[name] = (calls, errors, total_ns, histogram)
+
+        return res
+
+    def close(self):
+        self._shm.close()
+
+
+def _rows(current, previous, elapsed):
+    rows = []
+
+    for name, (calls, errors, total_ns, histogram) in current.items():
+        if name in previous:
+            p_calls, p_errors, p_total_ns, p_histogram = previous[name]
+            calls -= p_calls
+            errors -= p_errors
+            total_ns -= p_total_ns
+            histogram = [a - b for a, b in zip(histogram, p_histogram)]
+
+        if calls <= 0:
+            rows.append((name, 0.0, None, None, None, current[name][0]))
+            continue
+
+        rows.append((
+            name,
+            calls / elapsed,
+            total_ns / float(calls),
+            _stats.histogram_percentile(histogram, 99),
+            errors / float(calls),
+            current[name][0]
+        ))
+
+    return rows
+
+
+_SORT_KEYS = {
+    'calls': lambda row: row[1],
+    'mean': lambda row: row[2] or 0,
+    'p99': lambda row: row[3] or 0,
+    'errors': lambda row: row[4] or 0,
+    'name': lambda row: row[0]
+}
+
+
+def add_top_parser(subparsers):
+    parser = subparsers.add_parser(
+        'top',
+        help='watch the statistics a process is publishing',
+        description=(
+            'Shows calls/sec, mean/p99 latency and error rate for every '
+            'decorated function of a process that called '
+            'angry_debugger.publish_stats().'
+        )
+    )
+    parser.add_argument('pid', type=int, help='process id')
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=1.0,
+        help='seconds between refreshes (default: 1.0)'
+    )
+    parser.add_argument(
+        '--sort',
+        choices=sorted(_SORT_KEYS.keys()),
+        default='calls',
+        help='column to sort on (default: calls)'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=40,
+        help='number of functions to show (default: 40)'
+    )
+    parser.add_argument(
+        '--iterations',
+        type=int,
+        default=0,
+        help='stop after this many refreshes, 0 runs until interrupted'
+    )
+    parser.set_defaults(command=top_command)
+    return parser
+
+
+def top_command(args):
+    reader = StatsReader(args.pid)
+    clear = sys.stdout.isatty()
+
+    # the first refresh covers everything since publishing started
+    previous = {}
+    previous_time = reader.start_ns
+    iteration = 0
+
+    try:
+        while True:
+            now = time_ns()
+            current = reader.read()
+            elapsed = max((now - previous_time) / 1000000000.0, 1e-9)
+
+            rows = _rows(current, previous, elapsed)
+            rows.sort(key=_SORT_KEYS[args.sort], reverse=args.sort != 'name')
+
+            if clear:
+                sys.stdout.write('\x1b[2J\x1b[H')
+
+            print(
+                'angry_debugger top - pid {0} - {1} functions - {2}'.format(
+                    args.pid,
+                    len(current),
+                    time.strftime('%H:%M:%S')
+                )
+            )
+            print(
+                '{0:>10} {1:>10} {2:>10} {3:>7} {4:>12}  {5}'.format(
+                    'calls/s', 'mean', 'p99', 'errors', 'total calls', 'function'
+                )
+            )
+            for name, rate, mean, p99, error_rate, total in rows[:args.limit]:
+                if mean is None:
+                    print('{0:>10} {1:>10} {2:>10} {3:>7} {4:>12}  {5}'.format(
+                        '0', '-', '-', '-', total, name
+                    ))
+                else:
+                    print('{0:>10.1f} {1:>10} {2:>10} {3:>7.1%} {4:>12}  {5}'.format(
+                        rate, format_ns(mean), format_ns(p99), error_rate, total, name
+                    ))
+
+            sys.stdout.flush()
+
+            iteration += 1
+            if args.iterations and iteration >= args.iterations:
+                break
+
+            previous = current
+            previous_time = now
+            time.sleep(args.interval)
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+    return 0
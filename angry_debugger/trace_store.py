@@ -0,0 +1,869 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: indexed on disk trace store
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import mmap
+import time
+import array
+import heapq
+import struct
+import fnmatch
+import datetime
+import logging
+from collections import namedtuple
+
+from .records import CallRecord, get_duration
+from .handlers import format_call_record
+
+
+# A trace store is made up of 3 files.
+#
+# {path}        the records, one line of JSON for each call. This is the same
+#               layout `NDJSONHandler` writes so the file can be read by any
+#               tool that understands NDJSON.
+# {path}.idx    a fixed width entry for every record. This is what gets
+#               searched, the data file is only read for the records a query
+#               returns.
+# {path}.names  the string table for the function names in the index, one
+#               name per line. The id of a name is its line number.
+# {path}.post   postings for the index. Every time the writer flushes it
+#               adds a segment for the index entries written since the last
+#               one: the time range and the longest duration of those
+#               entries and, for every function, thread and logging run in
+#               them, the sorted list of their entry numbers. A query skips
+#               the segments that can not match and only unpacks the index
+#               entries the postings point at.
+#
+# All 4 files are append only. Index entries that are not in a segment yet
+# (the writer was stopped before it flushed, or the store was written by an
+# older version) are found by reading the index from the last segment on.
+
+INDEX_MAGIC = b'ADINDEX1'
+POSTINGS_MAGIC = b'ADPOST01'
+
+_INDEX_ENTRY = struct.Struct('<qqQQIIIB3x')
+
+# size of the rest of the segment, first entry number, number of entries,
+# lowest and highest timestamp, longest duration, number of keys
+_SEGMENT_HEADER = struct.Struct('<QQIqqqI')
+# key kind, key, number of entry numbers, followed by that many uint32
+# entry numbers relative to the first entry of the segment
+_POSTING_HEADER = struct.Struct('<B7xQI4x')
+
+POSTING_FUNC = 0
+POSTING_THREAD = 1
+POSTING_RUN = 2
+
+IndexEntry = namedtuple(
+    'IndexEntry',
+    [
+        'timestamp_ns',
+        'duration_ns',
+        'offset',
+        'thread_id',
+        'length',
+        'func_id',
+        'run_id',
+        'bucket'
+    ]
+)
+
+
+def duration_bucket(duration_ns):
+    """
+    The duration bucket is the bit length of the duration in nanoseconds,
+    every bucket holds durations that are up to twice as long as the bucket
+    before it.
+    """
+    return min(int(duration_ns).bit_length(), 255)
+
+
+class _Segment(object):
+
+    def __init__(
+        self,
+        first,
+        count,
+        min_ns,
+        max_ns,
+        max_duration_ns,
+        postings,
+        end
+    ):
+        self.first = first
+        self.count = count
+        self.min_ns = min_ns
+        self.max_ns = max_ns
+        self.max_duration_ns = max_duration_ns
+        # (kind, key) -> (offset of the entry numbers, count)
+        self.postings = postings
+        # where the segment ends in the postings file
+        self.end = end
+
+    def overlaps(self, since_ns, until_ns, min_duration_ns):
+        if since_ns is not None and self.max_ns < since_ns:
+            return False
+        if until_ns is not None and self.min_ns > until_ns:
+            return False
+        if min_duration_ns is not None and self.max_duration_ns < min_duration_ns:
+            return False
+
+        return True
+
+
+def _read_segments(buf):
+    """
+    The complete segments in a postings file, a segment that was only partly
+    written is left out along with anything after it.
+    """
+    segments = []
+
+    if buf is None or buf[:len(POSTINGS_MAGIC)] != POSTINGS_MAGIC:
+        return segments
+
+    offset = len(POSTINGS_MAGIC)
+    size = len(buf)
+    expected_first = 0
+
+    while offset + _SEGMENT_HEADER.size <= size:
+        (
+            length,
+            first,
+            count,
+            min_ns,
+            max_ns,
+            max_duration_ns,
+            keys
+        ) = _SEGMENT_HEADER.unpack_from(buf, offset)
+
+        end = offset + _SEGMENT_HEADER.size + length
+        if end > size or first != expected_first:
+            break
+
+        postings = {}
+        pos = offset + _SEGMENT_HEADER.size
+
+        for _ in range(keys):
+            kind, key, key_count = _POSTING_HEADER.unpack_from(buf, pos)
+            pos += _POSTING_HEADER.size
+            postings[(kind, key)] = (pos, key_count)
+            pos += key_count * 4
+
+        segments.append(
+            _Segment(
+                first,
+                count,
+                min_ns,
+                max_ns,
+                max_duration_ns,
+                postings,
+                end
+            )
+        )
+        expected_first = first + count
+        offset = end
+
+    return segments
+
+
+class TraceStoreWriter(object):
+    """
+    Appends `CallRecord` objects to a trace store.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._names = {}
+
+        if os.path.exists(self.path + '.names'):
+            with open(self.path + '.names', 'rb') as f:
+                for i, name in enumerate(f.read().decode('utf-8').splitlines()):
+                    self._names[name] = i + 1
+
+        self._data = open(self.path, 'ab')
+        self._index = open(self.path + '.idx', 'ab')
+        self._name_file = open(self.path + '.names', 'ab')
+
+        if self._index.tell() == 0:
+            self._index.write(INDEX_MAGIC)
+
+        self._offset = self._data.tell()
+        self._entries = (self._index.tell() - len(INDEX_MAGIC)) // _INDEX_ENTRY.size
+        self._reset_segment(self._entries)
+
+        postings = _mmap(self.path + '.post') if os.path.exists(self.path + '.post') else None
+        segments = _read_segments(postings)
+
+        if postings is not None:
+            postings.close()
+
+        self._postings = open(self.path + '.post', 'ab')
+
+        if not segments:
+            # a new store or one written before there were postings, the
+            # file is started over
+            self._postings.truncate(0)
+            self._postings.write(POSTINGS_MAGIC)
+            covered = 0
+        else:
+            # a segment that was only partly written is dropped, the entries
+            # in it get written again below
+            self._postings.truncate(segments[-1].end)
+            covered = segments[-1].first + segments[-1].count
+
+        if covered < self._entries:
+            # the writer was stopped between writing the index and the
+            # postings, the entries that are missing get a segment now
+            self._index.flush()
+            self._reset_segment(covered)
+            index = _mmap(self.path + '.idx')
+            try:
+                for n in range(covered, self._entries):
+                    self._add_posting(
+                        IndexEntry(
+                            *_INDEX_ENTRY.unpack_from(
+                                index,
+                                len(INDEX_MAGIC) + n * _INDEX_ENTRY.size
+                            )
+                        )
+                    )
+            finally:
+                index.close()
+
+            self._write_segment()
+
+    def _reset_segment(self, first):
+        self._segment_first = first
+        self._segment_count = 0
+        self._segment_min_ns = None
+        self._segment_max_ns = None
+        self._segment_max_duration_ns = 0
+        self._segment_postings = {}
+
+    def _add_posting(self, entry):
+        number = self._segment_count
+        self._segment_count += 1
+
+        if self._segment_min_ns is None or entry.timestamp_ns < self._segment_min_ns:
+            self._segment_min_ns = entry.timestamp_ns
+        if self._segment_max_ns is None or entry.timestamp_ns > self._segment_max_ns:
+            self._segment_max_ns = entry.timestamp_ns
+        if entry.duration_ns > self._segment_max_duration_ns:
+            self._segment_max_duration_ns = entry.duration_ns
+
+        postings = self._segment_postings
+
+        for key in (
+            (POSTING_FUNC, entry.func_id),
+            (POSTING_THREAD, entry.thread_id),
+            (POSTING_RUN, entry.run_id)
+        ):
+            try:
+                postings[key].append(number)
+            except KeyError:
+                postings[key] = array.array('I', [number])
+
+    def _write_segment(self):
+        if not self._segment_count:
+            return
+
+        body = []
+        for (kind, key), numbers in sorted(self._segment_postings.items()):
+            body.append(_POSTING_HEADER.pack(kind, key, len(numbers)))
+
+            if sys.byteorder == 'big':
+                numbers.byteswap()
+
+            body.append(
+                numbers.tobytes() if hasattr(numbers, 'tobytes') else numbers.tostring()
+            )
+
+        body = b''.join(body)
+
+        self._postings.write(
+            _SEGMENT_HEADER.pack(
+                len(body),
+                self._segment_first,
+                self._segment_count,
+                self._segment_min_ns,
+                self._segment_max_ns,
+                self._segment_max_duration_ns,
+                len(self._segment_postings)
+            ) + body
+        )
+        self._reset_segment(self._segment_first + self._segment_count)
+
+    def _func_id(self, name):
+        try:
+            return self._names[name]
+        except KeyError:
+            func_id = len(self._names) + 1
+            self._names[name] = func_id
+            self._name_file.write(name.encode('utf-8') + b'\n')
+            return func_id
+
+    def write(self, record):
+        payload = format_call_record(record).encode('utf-8') + b'\n'
+        duration_ns = record.duration_ns or 0
+
+        entry = IndexEntry(
+            record.timestamp_ns,
+            duration_ns,
+            self._offset,
+            record.thread_id or 0,
+            len(payload) - 1,
+            self._func_id(record.called_obj),
+            record.run_id,
+            duration_bucket(duration_ns)
+        )
+
+        self._data.write(payload)
+        self._index.write(_INDEX_ENTRY.pack(*entry))
+        self._add_posting(entry)
+        self._entries += 1
+        self._offset += len(payload)
+
+    def flush(self):
+        # the data has to be on the disk before the index entry that points
+        # to it and the index before the postings that point into it, a
+        # reader only ever trusts the index and the postings.
+        self._name_file.flush()
+        self._data.flush()
+        self._index.flush()
+        self._write_segment()
+        self._postings.flush()
+
+    def close(self):
+        self.flush()
+        self._name_file.close()
+        self._data.close()
+        self._index.close()
+        self._postings.close()
+
+
+class TraceStoreHandler(logging.Handler):
+    """
+    Logging handler that writes the records made by `log_it` to a trace
+    store. Any other record is ignored.
+
+    handler = angry_debugger.TraceStoreHandler('run.trace')
+    logging.getLogger().addHandler(handler)
+    """
+
+    def __init__(self, path, flush_every=512):
+        logging.Handler.__init__(self)
+        self._writer = TraceStoreWriter(path)
+        self._flush_every = flush_every
+        self._pending = 0
+
+    def emit(self, record):
+        if not isinstance(record.msg, CallRecord):
+            return
+
+        try:
+            self._writer.write(record.msg)
+            self._pending += 1
+
+            if self._pending >= self._flush_every:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._writer.flush()
+            self._pending = 0
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            self._writer.close()
+        finally:
+            self.release()
+
+        logging.Handler.close(self)
+
+
+def _mmap(path):
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class TraceStore(object):
+    """
+    Reads a trace store.
+
+    The index, the postings and the data files are read through `mmap`. A
+    query looks up the entries for a function, thread or logging run in the
+    postings and skips the segments whose time range or longest duration
+    can not match. Only the index entries that are left get unpacked and a
+    record in the data file is only touched when it is loaded.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+        self.names = {}
+        self.func_names = {}
+
+        with open(self.path + '.names', 'rb') as f:
+            for i, name in enumerate(f.read().decode('utf-8').splitlines()):
+                self.names[name] = i + 1
+                self.func_names[i + 1] = name
+
+        self._data = _mmap(self.path)
+        self._index = _mmap(self.path + '.idx')
+
+        if self._index is not None and self._index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError('{0} is not a trace store index'.format(self.path + '.idx'))
+
+        if os.path.exists(self.path + '.post'):
+            self._postings = _mmap(self.path + '.post')
+        else:
+            self._postings = None
+
+        # only the segments for entries that made it into the index before
+        # it was mapped
+        entries = len(self)
+        self._segments = [
+            segment for segment in _read_segments(self._postings)
+            if segment.first + segment.count <= entries
+        ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+        if self._postings is not None:
+            self._postings.close()
+            self._postings = None
+
+    def __len__(self):
+        if self._index is None:
+            return 0
+
+        return (len(self._index) - len(INDEX_MAGIC)) // _INDEX_ENTRY.size
+
+    def _entry(self, number):
+        entry = IndexEntry(
+            *_INDEX_ENTRY.unpack_from(
+                self._index,
+                len(INDEX_MAGIC) + number * _INDEX_ENTRY.size
+            )
+        )
+
+        # the writer may have been stopped after writing the index entry
+        # but before the data made it to the disk
+        if entry.offset + entry.length > len(self._data):
+            return None
+
+        return entry
+
+    def _posting(self, segment, key):
+        try:
+            offset, count = segment.postings[key]
+        except KeyError:
+            return []
+
+        numbers = array.array('I')
+        chunk = self._postings[offset:offset + count * 4]
+
+        if hasattr(numbers, 'frombytes'):
+            numbers.frombytes(chunk)
+        else:
+            numbers.fromstring(chunk)
+
+        if sys.byteorder == 'big':
+            numbers.byteswap()
+
+        return numbers
+
+    def _segment_numbers(self, segment, func_ids, thread_id, run_id):
+        """
+        The entry numbers in a segment that the postings say can match, in
+        the order they were written. `None` if there is no key to look up.
+        """
+        numbers = None
+
+        if func_ids is not None:
+            numbers = set()
+            for func_id in func_ids:
+                numbers.update(self._posting(segment, (POSTING_FUNC, func_id)))
+
+        for key in (
+            (POSTING_THREAD, thread_id),
+            (POSTING_RUN, run_id)
+        ):
+            if key[1] is None:
+                continue
+
+            found = self._posting(segment, key)
+
+            if numbers is None:
+                numbers = set(found)
+            else:
+                numbers.intersection_update(found)
+
+            if not numbers:
+                break
+
+        if numbers is None:
+            return None
+
+        return sorted(numbers)
+
+    def entries(self, start_entry=0):
+        if self._index is None or self._data is None:
+            return
+
+        start = len(INDEX_MAGIC) + start_entry * _INDEX_ENTRY.size
+        stop = len(INDEX_MAGIC) + len(self) * _INDEX_ENTRY.size
+        data_size = len(self._data)
+
+        # the index is unpacked in chunks so there is never a copy of the
+        # whole thing in memory and no buffer is left exported from the mmap
+        chunk_size = _INDEX_ENTRY.size * 65536
+
+        for chunk_start in range(start, stop, chunk_size):
+            chunk = self._index[chunk_start:min(chunk_start + chunk_size, stop)]
+
+            if hasattr(_INDEX_ENTRY, 'iter_unpack'):
+                entries = _INDEX_ENTRY.iter_unpack(chunk)
+            else:
+                entries = (
+                    _INDEX_ENTRY.unpack_from(chunk, offset)
+                    for offset in range(0, len(chunk), _INDEX_ENTRY.size)
+                )
+
+            for entry in entries:
+                # the writer may have been stopped after writing the data
+                # but before the index made it to the disk, or the other
+                # way around.
+                if entry[2] + entry[4] > data_size:
+                    return
+
+                yield IndexEntry(*entry)
+
+    def func_ids(self, pattern):
+        """
+        Ids of the function names matching `pattern`. The pattern is a dotted
+        name and it can have `fnmatch` style wildcards.
+        """
+        if pattern in self.names:
+            return set([self.names[pattern]])
+
+        return set(
+            func_id for name, func_id in self.names.items()
+            if fnmatch.fnmatchcase(name, pattern)
+        )
+
+    def query(
+        self,
+        func=None,
+        thread_id=None,
+        run_id=None,
+        since_ns=None,
+        until_ns=None,
+        min_duration_ns=None
+    ):
+        """
+        Generator of the index entries that match all of the given filters,
+        in the order they were written.
+        """
+        if func is not None:
+            func_ids = self.func_ids(func)
+            if not func_ids:
+                return
+        else:
+            func_ids = None
+
+        if min_duration_ns is not None:
+            min_bucket = duration_bucket(min_duration_ns)
+        else:
+            min_bucket = None
+
+        if self._index is None or self._data is None:
+            return
+
+        covered = 0
+
+        for segment in self._segments:
+            covered = segment.first + segment.count
+
+            if not segment.overlaps(since_ns, until_ns, min_duration_ns):
+                continue
+
+            numbers = self._segment_numbers(segment, func_ids, thread_id, run_id)
+
+            if numbers is None:
+                numbers = range(segment.count)
+
+            for number in numbers:
+                entry = self._entry(segment.first + number)
+                if entry is None:
+                    return
+
+                if self._matches(
+                    entry,
+                    func_ids,
+                    thread_id,
+                    run_id,
+                    since_ns,
+                    until_ns,
+                    min_duration_ns,
+                    min_bucket
+                ):
+                    yield entry
+
+        # whatever is not in a segment yet
+        for entry in self.entries(covered):
+            if self._matches(
+                entry,
+                func_ids,
+                thread_id,
+                run_id,
+                since_ns,
+                until_ns,
+                min_duration_ns,
+                min_bucket
+            ):
+                yield entry
+
+    @staticmethod
+    def _matches(
+        entry,
+        func_ids,
+        thread_id,
+        run_id,
+        since_ns,
+        until_ns,
+        min_duration_ns,
+        min_bucket
+    ):
+        if func_ids is not None and entry.func_id not in func_ids:
+            return False
+        if run_id is not None and entry.run_id != run_id:
+            return False
+        if thread_id is not None and entry.thread_id != thread_id:
+            return False
+        if since_ns is not None and entry.timestamp_ns < since_ns:
+            return False
+        if until_ns is not None and entry.timestamp_ns > until_ns:
+            return False
+        if min_bucket is not None and (
+            entry.bucket < min_bucket or
+            entry.duration_ns < min_duration_ns
+        ):
+            return False
+
+        return True
+
+    def top(self, count, **filters):
+        """
+        The `count` slowest calls matching the filters, slowest first.
+        """
+        return heapq.nlargest(
+            count,
+            self.query(**filters),
+            key=lambda e: e.duration_ns
+        )
+
+    def histogram(self, **filters):
+        """
+        Number of calls in each duration bucket.
+        """
+        res = {}
+        for entry in self.query(**filters):
+            res[entry.bucket] = res.get(entry.bucket, 0) + 1
+
+        return res
+
+    def load_raw(self, entry):
+        return self._data[entry.offset:entry.offset + entry.length]
+
+    def load(self, entry):
+        return json.loads(self.load_raw(entry).decode('utf-8'))
+
+
+def _parse_time(value):
+    try:
+        value = float(value)
+    except ValueError:
+        pass
+    else:
+        # anything this large is already in nanoseconds
+        if value > 1e17:
+            return int(value)
+        return int(value * 1000000000)
+
+    for fmt in (
+        '%Y-%m-%dT%H:%M:%S.%f',
+        '%Y-%m-%dT%H:%M:%S',
+        '%Y-%m-%d %H:%M:%S.%f',
+        '%Y-%m-%d %H:%M:%S',
+        '%Y-%m-%d'
+    ):
+        try:
+            dt = datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+
+        return (
+            int(time.mktime(dt.timetuple())) * 1000000000 +
+            dt.microsecond * 1000
+        )
+
+    raise ValueError('unknown time format: {0!r}'.format(value))
+
+
+def _format_entry(store, entry):
+    data = store.load(entry)
+    timestamp = datetime.datetime.fromtimestamp(entry.timestamp_ns / 1000000000.0)
+    duration = get_duration(0, entry.duration_ns / 1000000000.0)
+    duration = duration.split(':', 1)[1].strip()
+
+    if data.get('exception'):
+        outcome = ' raised ' + data['exception']
+    elif data.get('result') is not None:
+        outcome = ' => ' + data['result']
+    else:
+        outcome = ''
+
+    return '{0} {1:>12} {2}[{3}] run={4} {5}{6}{7}'.format(
+        timestamp.isoformat(),
+        duration,
+        data.get('thread'),
+        entry.thread_id,
+        entry.run_id,
+        data.get('dst'),
+        data.get('args') or '',
+        outcome
+    )
+
+
+def add_query_parser(subparsers):
+    parser = subparsers.add_parser(
+        'query',
+        help='query a trace store',
+        description=(
+            'Query a trace store written by TraceStoreHandler. Only the '
+            'index is searched, the records are read for the results only.'
+        )
+    )
+    parser.add_argument('path', help='path to the trace store')
+    parser.add_argument(
+        '--func',
+        help='dotted function name, fnmatch wildcards are allowed'
+    )
+    parser.add_argument('--thread', type=int, help='thread id')
+    parser.add_argument('--run', type=int, help='logging run id')
+    parser.add_argument(
+        '--since',
+        help='start time, seconds since the epoch or YYYY-MM-DDTHH:MM:SS'
+    )
+    parser.add_argument(
+        '--until',
+        help='end time, seconds since the epoch or YYYY-MM-DDTHH:MM:SS'
+    )
+    parser.add_argument(
+        '--min-duration',
+        type=float,
+        help='only calls that took at least this many milliseconds'
+    )
+    parser.add_argument(
+        '--top',
+        type=int,
+        help='only the N slowest calls, slowest first'
+    )
+    parser.add_argument(
+        '--histogram',
+        action='store_true',
+        help='print the number of calls in each duration bucket'
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='print the matching records as NDJSON'
+    )
+    parser.set_defaults(command=query_command)
+    return parser
+
+
+def query_command(args):
+    filters = dict(
+        func=args.func,
+        thread_id=args.thread,
+        run_id=args.run
+    )
+
+    if args.since:
+        filters['since_ns'] = _parse_time(args.since)
+    if args.until:
+        filters['until_ns'] = _parse_time(args.until)
+    if args.min_duration is not None:
+        filters['min_duration_ns'] = int(args.min_duration * 1000000)
+
+    with TraceStore(args.path) as store:
+        if args.histogram:
+            for bucket, count in sorted(store.histogram(**filters).items()):
+                low = (1 << (bucket - 1)) if bucket else 0
+                print('>= {0:>16} ns: {1}'.format(low, count))
+            return 0
+
+        if args.top:
+            entries = store.top(args.top, **filters)
+        else:
+            entries = store.query(**filters)
+
+        for entry in entries:
+            if args.json:
+                print(store.load_raw(entry).decode('utf-8'))
+            else:
+                print(_format_entry(store, entry))
+
+            sys.stdout.flush()
+
+    return 0
@@ -28,12 +28,54 @@ project https://github.com/kdschlosser/angry_debugger.
 from __future__ import print_function
 import logging
 import inspect
+import traceback
+import time
 import sys
+import os
 
 logger = logging.getLogger(__name__)
 
 PY3 = sys.version_info[0] > 2
 
+PACKAGE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+if hasattr(time, 'time_ns'):
+    time_ns = time.time_ns
+    perf_counter_ns = time.perf_counter_ns
+else:
+    def time_ns():
+        return int(time.time() * 1000000000)
+
+    if hasattr(time, 'perf_counter'):
+        def perf_counter_ns():
+            return int(time.perf_counter() * 1000000000)
+    else:
+        perf_counter_ns = time_ns
+
+
+if hasattr(time, 'thread_time_ns'):
+    thread_time_ns = time.thread_time_ns
+else:
+    # there is no per thread CPU clock
+    def thread_time_ns():
+        return None
+
+
+def format_ns(value):
+    """
+    Short human readable form of a number of nanoseconds.
+    """
+    for divider, suffix in (
+        (1000000000.0, 's'),
+        (1000000.0, 'ms'),
+        (1000.0, 'us')
+    ):
+        if value >= divider:
+            return '{0:.2f}{1}'.format(value / divider, suffix)
+
+    return '{0:.0f}ns'.format(value)
+
 
 def get_line_and_file(stacklevel=2):
     """
@@ -170,3 +212,94 @@ def func_arg_string(func, args, kwargs):
 
     return "(" + ", ".join(res) + ")"
 
+
+
+def is_package_file(filename):
+    """
+    Checks if a file name points to one of the modules in this package.
+    """
+    if not filename:
+        return False
+
+    return os.path.dirname(os.path.abspath(filename)) == PACKAGE_PATH
+
+
+def _walk_tb(tb):
+    while tb is not None:
+        if not is_package_file(tb.tb_frame.f_code.co_filename):
+            yield tb.tb_frame, tb.tb_lineno
+
+        tb = tb.tb_next
+
+
+def _extract_tb(tb):
+    if hasattr(traceback, 'StackSummary'):
+        # only the frames that are kept get their source line looked up
+        return traceback.StackSummary.extract(_walk_tb(tb))
+
+    return [
+        entry for entry in traceback.extract_tb(tb)
+        if not is_package_file(entry[0])
+    ]
+
+
+def format_exception(tb_type, tb_value, tb):
+    """
+    Formats an exception the same way `traceback.format_exception` does with
+    any of the frames that belong to this package removed.
+
+    The filtering is done on the traceback frames and not on the formatted
+    text so nothing gets formatted, and no source file gets read, for a
+    frame that is going to be dropped.
+    """
+    return _format_exception(tb_type, tb_value, tb, set())
+
+
+def _format_exception(tb_type, tb_value, tb, seen):
+    lines = []
+
+    if tb_value is not None:
+        # an exception can end up being its own cause or context further
+        # down the chain, traceback stops there as well
+        seen.add(id(tb_value))
+
+    if PY3 and tb_value is not None:
+        cause = tb_value.__cause__
+        context = tb_value.__context__
+
+        if cause is not None and id(cause) not in seen:
+            lines += _format_exception(
+                type(cause),
+                cause,
+                cause.__traceback__,
+                seen
+            )
+            lines += [
+                '\nThe above exception was the direct cause '
+                'of the following exception:\n\n'
+            ]
+        elif (
+            cause is None and
+            context is not None and
+            not tb_value.__suppress_context__ and
+            id(context) not in seen
+        ):
+            lines += _format_exception(
+                type(context),
+                context,
+                context.__traceback__,
+                seen
+            )
+            lines += [
+                '\nDuring handling of the above exception, '
+                'another exception occurred:\n\n'
+            ]
+
+    entries = _extract_tb(tb)
+
+    if entries:
+        lines += ['Traceback (most recent call last):\n']
+        lines += traceback.format_list(entries)
+
+    lines += traceback.format_exception_only(tb_type, tb_value)
+    return lines
@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: per instance attribute watchpoints
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+import sys
+import types
+import logging
+import threading
+
+from .levels import LEVEL_CALL_FROM, LEVEL_CALL_TO, get_level
+from .records import LOGGING_TEMPLATE
+from .runs import emit as _emit
+from .utils import caller_name, get_line_and_file
+
+try:
+    _get_ident = threading.get_ident
+except AttributeError:
+    # noinspection PyProtectedMember,PyUnresolvedReferences
+    _get_ident = threading._get_ident
+
+
+_NOTHING = object()
+
+
+class WatchStats(object):
+    """
+    Access counts for a watched attribute, added up over every instance.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.gets = 0
+        self.sets = 0
+        self.mutations = 0
+        self.threads = set()
+
+    @property
+    def shared(self):
+        """
+        `True` if more than one thread has used the attribute.
+        """
+        return len(self.threads) > 1
+
+    def __repr__(self):
+        return (
+            '<WatchStats {0} gets={1} sets={2} mutations={3} '
+            'threads={4}>'.format(
+                self.name,
+                self.gets,
+                self.sets,
+                self.mutations,
+                len(self.threads)
+            )
+        )
+
+
+_watch_stats = []
+
+
+def get_watch_stats():
+    """
+    The `WatchStats` for every watched attribute keyed by the dotted name of
+    the attribute.
+    """
+    return dict((stats.name, stats) for stats in _watch_stats if stats.name)
+
+
+def reset_watch_stats():
+    for stats in _watch_stats:
+        stats.gets = 0
+        stats.sets = 0
+        stats.mutations = 0
+        stats.threads.clear()
+
+
+# The proxies are subclasses of the builtin containers that only override
+# the methods that change the container. Everything that reads from them is
+# the builtin C implementation so reading is as fast as it is for a plain
+# list, dict or set.
+
+class WatchedList(list):
+    __slots__ = ('_watch',)
+
+    def __reduce_ex__(self, protocol):
+        # copies and pickles are plain lists
+        return list, (list(self),)
+
+    def append(self, value):
+        self._watch._log('mutated', 'append', (value,))
+        list.append(self, value)
+
+    def extend(self, values):
+        self._watch._log('mutated', 'extend', (values,))
+        list.extend(self, values)
+
+    def insert(self, index, value):
+        self._watch._log('mutated', 'insert', (index, value))
+        list.insert(self, index, value)
+
+    def remove(self, value):
+        self._watch._log('mutated', 'remove', (value,))
+        list.remove(self, value)
+
+    def pop(self, *args):
+        self._watch._log('mutated', 'pop', args)
+        return list.pop(self, *args)
+
+    def clear(self):
+        self._watch._log('mutated', 'clear', ())
+        list.__delitem__(self, slice(None))
+
+    def sort(self, *args, **kwargs):
+        self._watch._log('mutated', 'sort', ())
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._watch._log('mutated', 'reverse', ())
+        list.reverse(self)
+
+    def __setitem__(self, index, value):
+        self._watch._log('mutated', '__setitem__', (index, value))
+        list.__setitem__(self, index, value)
+
+    def __delitem__(self, index):
+        self._watch._log('mutated', '__delitem__', (index,))
+        list.__delitem__(self, index)
+
+    def __iadd__(self, values):
+        self._watch._log('mutated', '__iadd__', (values,))
+        return list.__iadd__(self, values)
+
+    def __imul__(self, count):
+        self._watch._log('mutated', '__imul__', (count,))
+        return list.__imul__(self, count)
+
+
+class WatchedDict(dict):
+    __slots__ = ('_watch',)
+
+    def __reduce_ex__(self, protocol):
+        return dict, (dict(self),)
+
+    def __setitem__(self, key, value):
+        self._watch._log('mutated', '__setitem__', (key, value))
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._watch._log('mutated', '__delitem__', (key,))
+        dict.__delitem__(self, key)
+
+    def pop(self, *args):
+        self._watch._log('mutated', 'pop', args)
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._watch._log('mutated', 'popitem', ())
+        return dict.popitem(self)
+
+    def clear(self):
+        self._watch._log('mutated', 'clear', ())
+        dict.clear(self)
+
+    def update(self, *args, **kwargs):
+        self._watch._log('mutated', 'update', args + tuple(kwargs.items()))
+        dict.update(self, *args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._watch._log('mutated', 'setdefault', (key, default))
+
+        return dict.setdefault(self, key, default)
+
+    def __ior__(self, other):
+        self._watch._log('mutated', '__ior__', (other,))
+        dict.update(self, other)
+        return self
+
+
+class WatchedSet(set):
+    __slots__ = ('_watch',)
+
+    def __reduce_ex__(self, protocol):
+        return set, (list(self),)
+
+    def add(self, value):
+        self._watch._log('mutated', 'add', (value,))
+        set.add(self, value)
+
+    def discard(self, value):
+        self._watch._log('mutated', 'discard', (value,))
+        set.discard(self, value)
+
+    def remove(self, value):
+        self._watch._log('mutated', 'remove', (value,))
+        set.remove(self, value)
+
+    def pop(self):
+        self._watch._log('mutated', 'pop', ())
+        return set.pop(self)
+
+    def clear(self):
+        self._watch._log('mutated', 'clear', ())
+        set.clear(self)
+
+    def update(self, *others):
+        self._watch._log('mutated', 'update', others)
+        set.update(self, *others)
+
+    def difference_update(self, *others):
+        self._watch._log('mutated', 'difference_update', others)
+        set.difference_update(self, *others)
+
+    def intersection_update(self, *others):
+        self._watch._log('mutated', 'intersection_update', others)
+        set.intersection_update(self, *others)
+
+    def symmetric_difference_update(self, other):
+        self._watch._log('mutated', 'symmetric_difference_update', (other,))
+        set.symmetric_difference_update(self, other)
+
+    def __ior__(self, other):
+        self._watch._log('mutated', '__ior__', (other,))
+        return set.__ior__(self, other)
+
+    def __iand__(self, other):
+        self._watch._log('mutated', '__iand__', (other,))
+        return set.__iand__(self, other)
+
+    def __isub__(self, other):
+        self._watch._log('mutated', '__isub__', (other,))
+        return set.__isub__(self, other)
+
+    def __ixor__(self, other):
+        self._watch._log('mutated', '__ixor__', (other,))
+        return set.__ixor__(self, other)
+
+
+_PROXIES = {
+    list: WatchedList,
+    dict: WatchedDict,
+    set: WatchedSet
+}
+
+
+class WatchedAttribute(object):
+    """
+    Descriptor that logs every read and write of an attribute, the value is
+    stored for each instance.
+
+    The value is kept in the `__dict__` of the instance. For a class that
+    uses `__slots__` add a slot named the same as the attribute with a
+    leading underscore and the value is kept there.
+
+    class SomeClass(object):
+        __slots__ = ('_items',)
+        items = angry_debugger.watch(factory=list, mutations=True)
+
+    With `mutations` set a list, dict or set that gets assigned is copied
+    into a proxy that logs every change made to it in place. Hold on to what
+    the attribute returns and not the object that was assigned, the proxy
+    is a copy.
+    """
+
+    def __init__(self, default=_NOTHING, factory=None, mutations=False):
+        self.default = default
+        self.factory = factory
+        self.mutations = mutations
+        self.name = None
+        self.owner = None
+        self.full_name = None
+        self.stats = WatchStats(None)
+        self._slot = None
+        self._lgr = None
+
+        _watch_stats.append(self.stats)
+
+    def __set_name__(self, owner, name):
+        self._bind(owner, name)
+
+    def _bind(self, owner, name):
+        self.owner = owner
+        self.name = name
+        self.full_name = '{0}.{1}.{2}'.format(
+            owner.__module__,
+            owner.__name__,
+            name
+        )
+        self.stats.name = self.full_name
+
+        for cls in owner.__mro__:
+            slot = cls.__dict__.get('_' + name, None)
+            if isinstance(slot, types.MemberDescriptorType):
+                self._slot = slot
+                break
+
+        module = sys.modules.get(owner.__module__, None)
+        glbs = getattr(module, '__dict__', {})
+
+        if isinstance(glbs.get('logger', None), logging.Logger):
+            self._lgr = glbs['logger']
+        elif isinstance(glbs.get('LOGGER', None), logging.Logger):
+            self._lgr = glbs['LOGGER']
+        else:
+            self._lgr = logging.getLogger(owner.__module__)
+
+    def _find_name(self, owner):
+        # there is no __set_name__ before Python 3.6
+        for cls in owner.__mro__:
+            for name, value in cls.__dict__.items():
+                if value is self:
+                    self._bind(cls, name)
+                    return
+
+        raise AttributeError('watched attribute is not a part of {0}'.format(owner))
+
+    def _log(self, kind, op=None, args=()):
+        # the line and the caller are pulled from the stack, this has to be
+        # called directly from the method the user code called.
+        stats = self.stats
+
+        if kind == 'get':
+            stats.gets += 1
+        elif kind == 'mutated':
+            stats.mutations += 1
+        else:
+            stats.sets += 1
+
+        stats.threads.add(_get_ident())
+
+        lgr_level = get_level(self._lgr)
+
+        log_call_from = lgr_level | LEVEL_CALL_FROM == lgr_level
+        log_call_to = lgr_level | LEVEL_CALL_TO == lgr_level
+
+        if not log_call_from and not log_call_to:
+            return
+
+        if log_call_from:
+            calling_filename, calling_line_no = get_line_and_file(3)
+
+            # noinspection PyProtectedMember
+            frame = sys._getframe(2)
+            if frame.f_code.co_name == '<module>':
+                # caller_name would step back into this module
+                calling_obj = frame.f_globals.get('__name__', '<module>')
+            else:
+                calling_obj = caller_name(2)
+
+            del frame
+        else:
+            calling_filename = 'NOT LOGGED'
+            calling_line_no = 'NOT LOGGED'
+            calling_obj = 'NOT LOGGED'
+
+        if kind == 'mutated':
+            msg = 'attribute mutated: {0}.{1}({2})\n'.format(
+                self.full_name,
+                op,
+                ', '.join(repr(arg) for arg in args)
+            )
+        elif kind == 'set':
+            msg = 'attribute set: {0} = {1!r}\n'.format(self.full_name, args[0])
+        else:
+            msg = 'attribute {0}: {1}\n'.format(kind, self.full_name)
+
+        thread = threading.current_thread()
+
+        msg = LOGGING_TEMPLATE.format(
+            debug_type=logging.getLevelName(lgr_level),
+            thread_name=thread.getName(),
+            thread_id=thread.ident,
+            calling_obj=calling_obj,
+            calling_filename=calling_filename,
+            calling_line_no=calling_line_no,
+            called_obj=self.full_name + ' (attribute)',
+            called_filename='NOT LOGGED',
+            called_line_no='NOT LOGGED',
+            msg=msg
+        )
+
+        _emit(self._lgr, lgr_level, msg + '\n')
+
+    def _wrap(self, value):
+        try:
+            proxy = _PROXIES[type(value)]
+        except KeyError:
+            return value
+
+        value = proxy(value)
+        value._watch = self
+        return value
+
+    def _load(self, instance):
+        if self._slot is not None:
+            try:
+                return self._slot.__get__(instance, type(instance))
+            except AttributeError:
+                pass
+        else:
+            try:
+                return instance.__dict__[self.name]
+            except KeyError:
+                pass
+
+        if self.factory is not None:
+            value = self.factory()
+        elif self.default is not _NOTHING:
+            value = self.default
+        else:
+            raise AttributeError(
+                '{0!r} object has no attribute {1!r}'.format(
+                    type(instance).__name__,
+                    self.name
+                )
+            )
+
+        if self.mutations:
+            value = self._wrap(value)
+
+        self._store(instance, value)
+        return value
+
+    def _store(self, instance, value):
+        if self._slot is not None:
+            self._slot.__set__(instance, value)
+        else:
+            try:
+                instance.__dict__[self.name] = value
+            except AttributeError:
+                raise AttributeError(
+                    '{0} uses __slots__, add a slot named {1!r} to store '
+                    'the watched attribute in'.format(
+                        type(instance).__name__,
+                        '_' + self.name
+                    )
+                )
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        if self.owner is None:
+            self._find_name(type(instance))
+
+        value = self._load(instance)
+        self._log('get')
+        return value
+
+    def __set__(self, instance, value):
+        if self.owner is None:
+            self._find_name(type(instance))
+
+        if self.mutations and type(value) in _PROXIES:
+            value = self._wrap(value)
+
+        self._store(instance, value)
+        self._log('set', None, (value,))
+
+    def __delete__(self, instance):
+        if self.owner is None:
+            self._find_name(type(instance))
+
+        self._log('delete')
+
+        if self._slot is not None:
+            self._slot.__delete__(instance)
+        else:
+            try:
+                del instance.__dict__[self.name]
+            except KeyError:
+                raise AttributeError(self.name)
+
+
+def watch(default=_NOTHING, factory=None, mutations=False):
+    """
+    Creates a watched attribute, see `WatchedAttribute`.
+
+    class SomeClass(object):
+        counter = angry_debugger.watch(0)
+        items = angry_debugger.watch(factory=dict, mutations=True)
+
+    `default` is returned for an instance the attribute has not been set on,
+    `factory` is called to make a new value for every instance instead. The
+    reads and writes are logged with `LEVEL_CALL_FROM` or `LEVEL_CALL_TO`
+    set and they are always counted, see `get_watch_stats`.
+    """
+    return WatchedAttribute(default, factory, mutations)
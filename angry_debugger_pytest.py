@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# **angry_debugger** is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# **angry_debugger** is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with angry_debugger. If not, see http://www.gnu.org/licenses.
+
+"""
+This file is part of the **angry_debugger**
+project https://github.com/kdschlosser/angry_debugger
+
+:platform: Unix, Windows, OSX
+:license: GPL(v3)
+:synopsis: pytest entry point for the latency budgets
+
+.. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
+"""
+
+# pytest loads this for every session of every project that has
+# angry_debugger installed. Importing angry_debugger installs the traceback
+# hook so nothing from it gets imported here until at least one package is
+# given with --angry-debugger or the angry_debugger_packages ini option.
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('angry_debugger', 'latency budgets (angry_debugger)')
+    group.addoption(
+        '--angry-debugger',
+        action='append',
+        default=[],
+        metavar='PACKAGE',
+        dest='angry_debugger_packages',
+        help='time the log_it decorated functions of this package'
+    )
+    group.addoption(
+        '--angry-debugger-report',
+        default=None,
+        metavar='PATH',
+        dest='angry_debugger_report',
+        help='write the latency of every function in every test to a JSON file'
+    )
+    parser.addini(
+        'angry_debugger_packages',
+        type='linelist',
+        default=[],
+        help='packages to time the log_it decorated functions of'
+    )
+    parser.addini(
+        'angry_debugger_budgets',
+        type='linelist',
+        default=[],
+        help=(
+            'latency budgets, one per line as "function = milliseconds", '
+            'the function name can have fnmatch wildcards'
+        )
+    )
+    parser.addini(
+        'angry_debugger_percentile',
+        default='95',
+        help='percentile the budgets are checked against (default: 95)'
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        'latency_budget(function, milliseconds, percentile=95): fail the '
+        'test if the given percentile of the calls made to the function '
+        'during the test took longer than the budget'
+    )
+
+    packages = (
+        list(config.getoption('angry_debugger_packages') or []) +
+        list(config.getini('angry_debugger_packages'))
+    )
+
+    if not packages:
+        return
+
+    from angry_debugger.pytest_plugin import LatencyBudgetPlugin
+
+    plugin = LatencyBudgetPlugin(config, packages)
+    plugin.enable()
+    config.pluginmanager.register(plugin, 'angry_debugger_latency')
@@ -24,7 +24,7 @@ project https://github.com/kdschlosser/angry_debugger
 .. moduleauthor:: Kevin Schlosser @kdschlosser <kevin.g.schlosser@gmail.com>
 """
 
-from distutils.core import setup
+from setuptools import setup
 
 
 setup(
@@ -33,8 +33,14 @@ setup(
     version='0.1.0',
     url='https://github.com/kdschlosser/angry_debugger',
     packages=['angry_debugger'],
+    py_modules=['angry_debugger_pytest'],
     description=(
         'debug logging decorator'
-    )
+    ),
+    entry_points={
+        'pytest11': [
+            'angry_debugger = angry_debugger_pytest'
+        ]
+    }
 )
 
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import logging
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import angry_debugger  # NOQA
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    @property
+    def messages(self):
+        return [record.msg for record in self.records]
+
+
+@pytest.fixture
+def captured():
+    """
+    Everything logged while the test runs with the root logger set to
+    `LEVEL_TIME_IT`.
+    """
+    handler = ListHandler()
+    root = logging.getLogger()
+    level = root.level
+
+    root.addHandler(handler)
+    root.setLevel(angry_debugger.LEVEL_TIME_IT)
+
+    try:
+        yield handler
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    angry_debugger.reset_function_stats()
+    yield
+    angry_debugger.reset_function_stats()
+
+
+@pytest.fixture
+def attach(request):
+    """
+    Adds handlers to the logger of the test module only, the records do not
+    go to the root logger. Returns a function that takes the handler and
+    the level to set the logger to.
+    """
+    lgr = logging.getLogger(request.module.__name__)
+    handlers = []
+
+    def add(handler, level=angry_debugger.LEVEL_ANGRY):
+        handlers.append(handler)
+        lgr.addHandler(handler)
+        lgr.setLevel(level)
+        return handler
+
+    lgr.propagate = False
+
+    try:
+        yield add
+    finally:
+        lgr.propagate = True
+        lgr.setLevel(logging.NOTSET)
+
+        for handler in handlers:
+            lgr.removeHandler(handler)
+            handler.close()
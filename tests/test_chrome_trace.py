@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import threading
+
+import angry_debugger
+from angry_debugger import log_it
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def inner(value):
+    return value
+
+
+@log_it
+def outer(value):
+    return inner(value)
+
+
+def _load(path, finished=True):
+    with open(path) as f:
+        text = f.read()
+
+    if not finished:
+        text += ']'
+
+    return json.loads(text)
+
+
+def test_calls_and_runs_are_events(tmp_path, attach):
+    path = str(tmp_path / 'trace.json')
+    handler = attach(angry_debugger.ChromeTraceHandler(path))
+
+    angry_debugger.start_logging_run()
+    outer(1)
+    angry_debugger.end_logging_run()
+
+    thread = threading.Thread(target=outer, args=(2,), name='worker')
+    thread.start()
+    thread.join()
+
+    logger.log(angry_debugger.LEVEL_ANGRY, 'hello\nworld')
+    handler.flush()
+
+    # a file that was never finished still loads once the bracket is added
+    events = _load(path, finished=False)
+    handler.close()
+    assert _load(path) == events
+
+    calls = [event for event in events if event.get('cat') == 'log_it']
+    runs = [event for event in events if event.get('cat') == 'logging_run']
+    names = dict(
+        (event['tid'], event['args']['name'])
+        for event in events if event['name'] == 'thread_name'
+    )
+
+    assert len(calls) == 4
+    assert len(runs) == 1
+
+    run = runs[0]
+    in_run = [
+        event for event in calls
+        if event['args'].get('run_id') == run['args']['run_id']
+    ]
+    assert len(in_run) == 2
+
+    for event in in_run:
+        assert run['ts'] <= event['ts']
+        assert event['ts'] + event['dur'] <= run['ts'] + run['dur'] + 1
+
+    # span ids are handed out when a call starts
+    outer_event, inner_event = sorted(in_run, key=lambda event: event['args']['span_id'])
+    assert inner_event['args']['parent_id'] == outer_event['args']['span_id']
+    assert outer_event['args']['result'] == '1'
+    assert 'NOT LOGGED' not in json.dumps(events)
+
+    assert 'worker' in names.values()
+    assert threading.current_thread().name in names.values()
+
+    instant, = [event for event in events if event.get('ph') == 'i']
+    assert instant['name'] == 'hello'
+    assert instant['args']['msg'] == 'hello\nworld'
+
+
+def test_exceptions_are_in_the_args(tmp_path, attach):
+    path = str(tmp_path / 'trace.json')
+    handler = attach(angry_debugger.ChromeTraceHandler(path))
+
+    @log_it
+    def boom():
+        raise ValueError('x')
+
+    try:
+        boom()
+    except ValueError:
+        pass
+
+    handler.close()
+    calls = [event for event in _load(path) if event.get('cat') == 'log_it']
+    assert calls[0]['args']['exception'] == 'ValueError'
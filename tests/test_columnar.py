@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+import os
+import ast
+import json
+import array
+import struct
+import logging
+import threading
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it, columnar
+from angry_debugger.records import CallRecord
+from angry_debugger.trace_store import TraceStoreWriter
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def inner(value):
+    if value is None:
+        raise ValueError('no value')
+    return value
+
+
+@log_it
+def outer(value):
+    return inner(value)
+
+
+def _read_npy(path):
+    # reads the files the way numpy.load does, without needing NumPy
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    assert data[:8] == b'\x93NUMPY\x01\x00'
+    size, = struct.unpack('<H', data[8:10])
+    header = ast.literal_eval(data[10:10 + size].decode('latin1'))
+    assert (10 + size) % 64 == 0
+    assert not header['fortran_order']
+
+    typecode = dict((descr, code) for _, code, descr in columnar.COLUMNS)[header['descr']]
+    values = array.array(typecode)
+    values.frombytes(data[10 + size:])
+    assert len(values) == header['shape'][0]
+    return list(values)
+
+
+def _columns(directory):
+    return dict(
+        (name, _read_npy(os.path.join(directory, name + '.npy')))
+        for name, _, _ in columnar.COLUMNS
+    )
+
+
+def _strings(directory):
+    with open(os.path.join(directory, columnar.STRINGS_FILE)) as f:
+        return json.load(f)
+
+
+def _record(func, timestamp_ns, duration_ns):
+    record = CallRecord(
+        10,
+        threading.current_thread(),
+        'caller',
+        'caller.py',
+        1,
+        func,
+        'callee.py',
+        2,
+        func.split('.')[-1],
+        '',
+        timestamp_ns,
+        True,
+        run_id=3
+    )
+    record.duration_ns = duration_ns
+    return record
+
+
+def _trace(tmp_path, attach):
+    directory = str(tmp_path / 'columns')
+    handler = attach(columnar.ColumnarHandler(directory, flush_every=3))
+
+    angry_debugger.start_logging_run()
+    outer(1)
+    with pytest.raises(ValueError):
+        outer(None)
+    angry_debugger.end_logging_run()
+
+    logger.log(angry_debugger.LEVEL_ANGRY, 'not a call')
+    handler.flush()
+    return directory
+
+
+def test_handler_writes_npy_columns(tmp_path, attach):
+    directory = _trace(tmp_path, attach)
+    columns = _columns(directory)
+    strings = _strings(directory)
+
+    # the calls are logged when they end, inner first
+    names = [strings['callsites'][n].rsplit('.', 1)[-1] for n in columns['callsite']]
+    assert names == ['inner', 'outer', 'inner', 'outer']
+
+    assert columns['error'] == [0, 0, 1, 1]
+    assert len(set(columns['run_id'])) == 1 and columns['run_id'][0] != 0
+    assert columns['parent_id'][0] == columns['span_id'][1]
+    assert columns['parent_id'][1] == 0
+
+    for start, stop in zip(columns['start_ns'], columns['stop_ns']):
+        assert stop > start
+
+    (ident, name), = strings['threads']
+    assert columns['thread'] == [0, 0, 0, 0]
+    assert name == 'MainThread'
+
+
+def test_rows_are_readable_before_close(tmp_path):
+    directory = str(tmp_path / 'columns')
+    writer = columnar.ColumnarWriter(directory)
+
+    assert _columns(directory)['start_ns'] == []
+
+    record = _record('mod.func', 1000, 50)
+
+    writer.write(record)
+    assert len(writer) == 1
+    assert _columns(directory)['start_ns'] == []
+
+    writer.flush()
+    assert _columns(directory)['start_ns'] == [1000]
+    assert _columns(directory)['stop_ns'] == [1050]
+
+    writer.write(record)
+    writer.close()
+    assert _columns(directory)['callsite'] == [0, 0]
+    assert _strings(directory)['callsites'] == ['mod.func']
+
+
+def test_export_trace_store(tmp_path):
+    path = str(tmp_path / 'run.trace')
+    writer = TraceStoreWriter(path)
+
+    for n in range(10):
+        writer.write(_record('mod.' + 'ab'[n % 2], 1000 * n, 10 * n))
+
+    writer.close()
+
+    directory = str(tmp_path / 'columns')
+    assert columnar.export_trace_store(path, directory) == 10
+
+    columns = _columns(directory)
+    assert columns['start_ns'] == [1000 * n for n in range(10)]
+    assert columns['stop_ns'] == [1010 * n for n in range(10)]
+    assert columns['run_id'] == [3] * 10
+    assert columns['span_id'] == [0] * 10
+    assert columns['parent_id'] == [0] * 10
+    assert _strings(directory)['callsites'] == ['mod.a', 'mod.b']
+
+
+def test_loading_without_numpy(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, 'numpy', None)
+
+    with pytest.raises(RuntimeError):
+        columnar.load_columns(str(tmp_path))
+
+
+def test_load_and_helpers(tmp_path, attach):
+    numpy = pytest.importorskip('numpy')
+
+    directory = _trace(tmp_path, attach)
+    trace = columnar.load_columns(directory)
+
+    assert len(trace) == 4
+    assert list(trace.error) == [0, 0, 1, 1]
+
+    outer_name = [name for name in trace.callsites if name.endswith('.outer')][0]
+    result = columnar.percentiles_by_callsite(trace, (50, 100))
+    calls, (p50, p100) = result[outer_name]
+    assert calls == 2
+    assert p50 <= p100 == int(trace.duration_ns[trace.callsite == trace.callsite_id(outer_name)].max())
+
+    edges, counts = columnar.throughput(trace, bucket_ns=10 ** 12)
+    assert counts.sum() == 4
+
+    edges, running, peak = columnar.concurrency(trace, bucket_ns=10 ** 12)
+    assert peak.max() == 2
+
+    outer_only = trace.select(trace.parent_id == 0)
+    assert len(outer_only) == 2
+
+    path = str(tmp_path / 'outer.npz')
+    outer_only.save_npz(path)
+    loaded = columnar.load_columns(path)
+    assert numpy.array_equal(loaded.span_id, outer_only.span_id)
+    assert loaded.callsites == trace.callsites
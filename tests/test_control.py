@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import os
+import stat
+import socket
+import logging
+
+import pytest
+
+from angry_debugger import control, log_it
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def controlled(value):
+    return value
+
+
+NAME = __name__ + '.controlled'
+
+
+@pytest.fixture(autouse=True)
+def clean_rules():
+    all_rules = (control._rules, control._thresholds, control._memo_rules)
+    saved = [list(rules) for rules in all_rules]
+
+    yield
+
+    with control._lock:
+        for rules, old in zip(all_rules, saved):
+            rules[:] = old
+
+        control._replan()
+
+
+def _site():
+    return control.get_callsites()[NAME][0]
+
+
+def test_setting_a_pattern_again_replaces_its_rule():
+    rules = len(control._rules)
+
+    for _ in range(100):
+        control.set_callsite_enabled(NAME, False)
+        control.set_callsite_enabled(NAME, True)
+
+    assert len(control._rules) == rules + 1
+    assert _site().enabled
+
+    for _ in range(10):
+        control.set_callsite_threshold(NAME, 5)
+        control.set_memo_analysis(NAME, True)
+
+    assert control._thresholds.count((NAME, 5000000)) == 1
+    assert control._memo_rules.count((NAME, True)) == 1
+    assert _site().threshold_ns == 5000000
+    assert _site().memo is not None
+
+
+def test_replaced_rule_still_wins_over_older_ones():
+    assert control.set_callsite_enabled(NAME, False) == 1
+    control.set_callsite_enabled(__name__ + '.*', True)
+    assert _site().enabled
+
+    # the rule for the exact name is set again, it has to be the newest one
+    control.set_callsite_enabled(NAME, False)
+    assert not _site().enabled
+    assert control._rules[-1] == (NAME, False)
+
+
+def test_threshold_default():
+    control.set_callsite_threshold(NAME, 1)
+    assert _site().threshold_ns == 1000000
+
+    control.set_callsite_threshold(NAME, None)
+    assert _site().threshold_ns is None
+
+
+def test_redecorating_reuses_the_call_site():
+    def make():
+        @log_it
+        def closure(value):
+            return value
+
+        return closure
+
+    for _ in range(100):
+        assert make()(1) == 1
+
+    def closures():
+        sites = control.get_callsites()
+        return [sites[name] for name in sites if name.endswith('.closure')]
+
+    sites, = closures()
+    assert len(sites) == 1
+
+    def make_slow():
+        @log_it(threshold_ms=5)
+        def closure(value):
+            return value
+
+        return closure
+
+    make_slow()
+    make_slow()
+    assert sorted(len(sites) for sites in closures()) == [1, 1]
+
+
+def test_code_objects_are_not_kept_alive():
+    codes = len(control._codes)
+
+    for n in range(20):
+        namespace = {'log_it': log_it, '__name__': __name__}
+        # a different body every time, equal code objects are one key
+        source = '@log_it\ndef generated(value):\n    return value + {0}\n'
+        exec(source.format(n), namespace)
+        namespace['generated'](0)
+        del namespace
+
+    gc.collect()
+    assert len(control._codes) <= codes + 1
+
+
+def test_run_command():
+    assert 'changed' in control.run_command('disable ' + NAME)
+    assert control.run_command('sites ' + NAME).startswith('off')
+    assert control.run_command('bogus').startswith('error:')
+    assert control.run_command('threshold').startswith('error:')
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='needs Unix sockets')
+def test_socket_is_private_and_umask_untouched(tmp_path):
+    umask = os.umask(0o022)
+    os.umask(umask)
+
+    server = control.ControlServer(str(tmp_path / 'ctl.sock'))
+
+    try:
+        mode = stat.S_IMODE(os.stat(server.path).st_mode)
+        assert mode == 0o600
+
+        current = os.umask(umask)
+        assert current == umask
+
+        assert control.send_command(server.path, 'sites ' + NAME).startswith('on')
+    finally:
+        server.close()
+
+    assert not os.path.exists(server.path)
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='needs Unix sockets')
+def test_silent_client_does_not_block_the_server(tmp_path):
+    server = control.ControlServer(str(tmp_path / 'ctl.sock'), timeout=0.2)
+    silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        # connects and never sends anything or shuts down its side
+        silent.connect(server.path)
+
+        reply = control.send_command(server.path, 'sites ' + NAME, timeout=5.0)
+        assert reply.startswith('on')
+    finally:
+        silent.close()
+        server.close()
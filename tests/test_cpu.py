@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it
+from angry_debugger.records import CallRecord, off_cpu
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@log_it
+def sleep(seconds):
+    time.sleep(seconds)
+
+
+@pytest.fixture
+def cpu_level(captured):
+    logging.getLogger().setLevel(
+        angry_debugger.LEVEL_CPU | angry_debugger.LEVEL_TIME_IT
+    )
+    yield captured
+
+
+def _record(handler, name):
+    for msg in handler.messages:
+        if isinstance(msg, CallRecord) and msg.called_obj.endswith(name):
+            return msg
+
+
+def _stats(name):
+    for key, stats in angry_debugger.get_function_stats().items():
+        if key.endswith(name):
+            return stats
+
+
+def test_busy_call_is_on_cpu(cpu_level):
+    spin(0.05)
+
+    record = _record(cpu_level, '.spin')
+    assert record.cpu_ns > 0
+    assert off_cpu(record.cpu_ns, record.duration_ns) < 0.5
+    assert 'off-cpu' in str(record)
+
+
+def test_sleeping_call_is_off_cpu(cpu_level):
+    sleep(0.05)
+
+    record = _record(cpu_level, '.sleep')
+    assert record.cpu_ns < record.duration_ns / 2
+    assert off_cpu(record.cpu_ns, record.duration_ns) > 0.5
+
+    stats = _stats('.sleep')
+    assert stats.cpu_calls == 1
+    assert stats.off_cpu > 0.5
+
+
+def test_cpu_is_not_measured_without_the_level(captured):
+    spin(0.001)
+
+    record = _record(captured, '.spin')
+    assert record.cpu_ns is None
+    assert 'off-cpu' not in str(record)
+    assert _stats('.spin').cpu_calls == 0
+
+
+def test_off_cpu():
+    assert off_cpu(0, 0) == 0.0
+    assert off_cpu(25, 100) == 0.75
+    # the cpu clock can be a little ahead of the wall clock
+    assert off_cpu(110, 100) == 0.0
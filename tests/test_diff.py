@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import random
+import logging
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it
+from angry_debugger.diff import (
+    load_recording,
+    diff_recordings,
+    mann_whitney_u
+)
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def leaf(value):
+    return value
+
+
+@log_it
+def branch(value):
+    return leaf(value)
+
+
+def _record(path, level, formatter=None):
+    handler = logging.FileHandler(path)
+    handler.setFormatter(formatter or logging.Formatter('%(message)s'))
+    root = logging.getLogger()
+    old_level = root.level
+
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    try:
+        for n in range(5):
+            branch(n)
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(old_level)
+        handler.close()
+
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_not_logged_source_is_not_an_edge(tmp_path, ndjson):
+    path = str(tmp_path / 'calls.log')
+    formatter = angry_debugger.NDJSONFormatter() if ndjson else None
+    _record(path, angry_debugger.LEVEL_TIME_IT, formatter)
+
+    recording = load_recording(path)
+
+    assert sorted(recording.calls.values()) == [5, 5]
+    assert recording.edges == set()
+    assert [len(durations) for durations in recording.durations.values()] == [5, 5]
+
+
+@pytest.mark.parametrize('ndjson', [False, True])
+def test_logged_source_is_an_edge(tmp_path, ndjson):
+    path = str(tmp_path / 'calls.log')
+    formatter = angry_debugger.NDJSONFormatter() if ndjson else None
+    _record(
+        path,
+        angry_debugger.LEVEL_TIME_IT | angry_debugger.LEVEL_CALL_FROM,
+        formatter
+    )
+
+    recording = load_recording(path)
+
+    assert len(recording.edges) == 2
+    for src, dst in recording.edges:
+        assert 'NOT LOGGED' not in src
+
+
+def test_text_and_ndjson_load_the_same(tmp_path):
+    text = str(tmp_path / 'calls.log')
+    ndjson = str(tmp_path / 'calls.ndjson')
+
+    _record(text, angry_debugger.LEVEL_TIME_IT)
+    _record(ndjson, angry_debugger.LEVEL_TIME_IT, angry_debugger.NDJSONFormatter())
+
+    a = load_recording(text)
+    b = load_recording(ndjson)
+
+    assert a.calls == b.calls
+    assert a.edges == b.edges
+
+
+def test_run_duration_is_not_a_call_duration(tmp_path):
+    path = str(tmp_path / 'calls.log')
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    root = logging.getLogger()
+    old_level = root.level
+
+    root.addHandler(handler)
+    # without LEVEL_TIME_IT the calls have no duration, the run still does
+    root.setLevel(angry_debugger.LEVEL_CALL_FROM | angry_debugger.LEVEL_CALL_TO)
+
+    try:
+        angry_debugger.start_logging_run()
+        branch(1)
+        angry_debugger.end_logging_run()
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(old_level)
+        handler.close()
+
+    with open(path) as f:
+        assert 'span tree:' in f.read()
+
+    recording = load_recording(path)
+
+    assert sorted(recording.calls.values()) == [1, 1]
+    assert recording.durations == {}
+
+
+def test_regression_is_found(tmp_path):
+    rand = random.Random(3)
+    paths = []
+
+    for path, scale in (('base.ndjson', 1000), ('cand.ndjson', 2000)):
+        with open(str(tmp_path / path), 'w') as f:
+            for _ in range(200):
+                f.write(
+                    '{{"src":null,"dst":"mod.func","duration_ns":{0}}}\n'.format(
+                        int(rand.gauss(scale, 50))
+                    )
+                )
+        paths.append(str(tmp_path / path))
+
+    diff = diff_recordings(*paths)
+    result = dict((item.name, item) for item in diff.functions)
+
+    assert result['mod.func'].regression
+    assert not result['mod.func'].improvement
+
+
+def test_mann_whitney_u_direction():
+    slower = mann_whitney_u(list(range(100)), list(range(50, 150)))
+    assert slower[0] > 0.5
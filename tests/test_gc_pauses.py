@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import logging
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it, gc_pauses
+from angry_debugger.records import CallRecord
+from angry_debugger.runs import RunRecord
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def collects(generation):
+    gc.collect(generation)
+
+
+@log_it
+def nested():
+    collects(2)
+
+
+@log_it
+def quiet():
+    pass
+
+
+@pytest.fixture
+def tracked():
+    angry_debugger.reset_gc_stats()
+    angry_debugger.track_gc_pauses()
+    yield angry_debugger.get_gc_stats()
+    angry_debugger.untrack_gc_pauses()
+    angry_debugger.reset_gc_stats()
+
+
+def _stats(name):
+    for key, stats in angry_debugger.get_function_stats().items():
+        if key.endswith(name):
+            return stats
+
+
+def test_pause_is_charged_to_the_calls_on_the_stack(captured, tracked):
+    angry_debugger.start_logging_run()
+    nested()
+    quiet()
+    angry_debugger.end_logging_run()
+
+    calls = dict(
+        (msg.called_obj.rsplit('.', 1)[-1], msg)
+        for msg in captured.messages
+        if isinstance(msg, CallRecord)
+    )
+
+    inner = calls['collects']
+    assert inner.gc_count >= 1
+    assert 0 < inner.gc_ns <= inner.duration_ns
+    assert 'of which GC' in str(inner)
+
+    # the caller was waiting as well
+    assert calls['nested'].gc_ns >= inner.gc_ns
+    assert calls['quiet'].gc_count == 0
+    assert 'of which GC' not in str(calls['quiet'])
+
+    stop = [msg for msg in captured.messages if isinstance(msg, RunRecord)][-1]
+    assert stop.gc_count >= 1
+    assert 'of which GC' in str(stop)
+
+    assert _stats('.collects').gc_calls == 1
+    assert _stats('.collects').gc_share > 0
+    assert _stats('.quiet').gc_calls == 0
+
+
+def test_generations(captured, tracked):
+    collects(0)
+    collects(2)
+
+    assert tracked.generations[0][0] >= 1
+    assert tracked.generations[2][0] >= 1
+    assert tracked.collections == sum(entry[0] for entry in tracked.generations.values())
+    assert tracked.attributed_ns <= tracked.total_ns
+
+    gc.collect()
+    assert tracked.attributed_ns < tracked.total_ns
+
+    text = angry_debugger.format_gc_report()
+    assert text.startswith('garbage collector: ')
+    assert 'generation 2:' in text
+    assert '.collects: 2 of 2 calls paused' in text
+    assert angry_debugger.format_gc_report(limit=0).count('calls paused') == 0
+
+
+def test_untrack(captured, tracked):
+    angry_debugger.untrack_gc_pauses()
+    assert gc_pauses._callback not in gc.callbacks
+
+    collects(2)
+    assert tracked.collections == 0
+
+    # tracking twice only adds the callback once
+    angry_debugger.track_gc_pauses()
+    angry_debugger.track_gc_pauses()
+    assert gc.callbacks.count(gc_pauses._callback) == 1
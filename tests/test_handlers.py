@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import os
+import gzip
+import json
+import logging
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it
+from angry_debugger.handlers import get_ring_buffers
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def call(value):
+    return value
+
+
+@log_it
+def broken(value):
+    raise RuntimeError(value)
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+
+    return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+
+def test_ndjson_fields(tmp_path, attach):
+    path = str(tmp_path / 'calls.ndjson')
+    handler = attach(logging.FileHandler(path))
+    handler.setFormatter(angry_debugger.NDJSONFormatter())
+
+    call('quote " and \\ and é')
+
+    with pytest.raises(RuntimeError):
+        broken('bad')
+
+    logger.log(angry_debugger.LEVEL_ANGRY, 'plain %s', 'message')
+    handler.flush()
+
+    first, second, third = _read(path)
+
+    assert first['dst'].endswith('.call')
+    assert first['args'] == "(value='quote \" and \\\\ and é')"
+    assert first['result'] == "'quote \" and \\\\ and é'"
+    assert first['duration_ns'] > 0
+    assert first['exception'] is None
+    assert first['src_line'] is not None
+    assert first['cpu_ns'] is None
+
+    assert second['exception'] == 'RuntimeError'
+    assert second['result'] is None
+
+    assert third['msg'] == 'plain message'
+    assert third['level'] == 'ANGRY'
+
+
+def test_ndjson_handler_batches_and_compresses(tmp_path, attach):
+    path = str(tmp_path / 'calls.ndjson.gz')
+    handler = attach(angry_debugger.NDJSONHandler(path, capacity=10))
+
+    for n in range(9):
+        call(n)
+
+    # nothing is written until the buffer is full
+    assert not os.path.exists(path)
+
+    call(9)
+    assert os.path.exists(path)
+
+    call(10)
+    handler.close()
+
+    records = _read(path)
+    assert [record['result'] for record in records] == [str(n) for n in range(11)]
+
+
+def test_ndjson_handler_rotates(tmp_path, attach):
+    path = str(tmp_path / 'calls.ndjson')
+    attach(
+        angry_debugger.NDJSONHandler(
+            path,
+            max_bytes=2000,
+            backup_count=2,
+            capacity=5,
+            compress=False
+        )
+    )
+
+    for n in range(200):
+        call(n)
+
+    assert os.path.exists(path + '.1')
+    assert os.path.exists(path + '.2')
+    assert not os.path.exists(path + '.3')
+
+    for name in (path + '.1', path + '.2'):
+        assert os.path.getsize(name) >= 2000
+        assert _read(name)
+
+
+def test_ring_buffer_keeps_the_last_records(tmp_path, attach):
+    handler = attach(angry_debugger.RingBufferHandler(3))
+
+    for n in range(10):
+        call(n)
+
+    assert len(handler.buffer) == 3
+    assert handler in get_ring_buffers()
+
+    path = str(tmp_path / 'dump.log')
+    text = handler.dump(path, clear=False)
+
+    assert text.count('function called') == 3
+    assert 'call => 9' in text
+    assert 'call => 6' not in text
+    assert open(path).read() == text
+
+    handler.dump()
+    assert len(handler.buffer) == 0
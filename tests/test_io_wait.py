@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import io
+import sys
+import socket
+import select
+import logging
+import builtins
+import subprocess
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it, io_wait
+from angry_debugger.records import CallRecord
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+@log_it
+def read_file(path):
+    with open(path) as f:
+        return f.read()
+
+
+@log_it
+def copy(source, target):
+    write_file(target, read_file(source).encode('utf-8'))
+
+
+@log_it
+def talk(left, right):
+    left.sendall(b'x' * 100)
+    select.select([right], [], [], 1)
+    return right.recv(1000)
+
+
+@log_it
+def run_process():
+    subprocess.Popen([sys.executable, '-c', 'pass']).wait()
+
+
+@pytest.fixture
+def instrumented():
+    angry_debugger.reset_io_stats()
+    angry_debugger.instrument_io()
+    yield angry_debugger.get_io_stats()
+    angry_debugger.uninstrument_io()
+    angry_debugger.reset_io_stats()
+
+
+def _calls(handler):
+    return dict(
+        (msg.called_obj.rsplit('.', 1)[-1], msg)
+        for msg in handler.messages
+        if isinstance(msg, CallRecord)
+    )
+
+
+def _waits(record):
+    return dict(((wait.kind, wait.target), wait) for wait in record.io_waits.values())
+
+
+def test_file_io(tmp_path, captured, instrumented):
+    source = str(tmp_path / 'source.txt')
+    target = str(tmp_path / 'target.txt')
+
+    with io_wait._original_open(source, 'w') as f:
+        f.write('hello' * 10)
+
+    copy(source, target)
+
+    calls = _calls(captured)
+    assert _waits(calls['read_file'])[('file read', source)].bytes == 50
+    assert _waits(calls['write_file'])[('file write', target)].bytes == 50
+
+    # the caller waited as well but the operations belong to the calls
+    # that made them
+    outer = calls['copy']
+    assert outer.io_bytes == 100
+    assert outer.io_ns >= calls['read_file'].io_ns + calls['write_file'].io_ns
+    assert outer.io_waits is None
+    assert 'of which I/O' in str(outer)
+
+    assert instrumented.kinds['file write'][1] == 50
+    assert instrumented.attributed_ns == instrumented.wait_ns
+
+    stats = angry_debugger.get_function_stats()
+    name = [key for key in stats if key.endswith('.copy')][0]
+    assert stats[name].io_calls == 1
+    assert stats[name].io_bytes == 100
+
+
+def test_socket_and_select(captured, instrumented):
+    left, right = socket.socketpair()
+
+    try:
+        assert talk(left, right) == b'x' * 100
+    finally:
+        left.close()
+        right.close()
+
+    waits = _calls(captured)['talk'].io_waits.values()
+    kinds = dict((wait.kind, wait) for wait in waits)
+
+    assert kinds['socket send'].bytes == 100
+    assert kinds['socket recv'].bytes == 100
+    assert kinds['select'].count == 1
+
+
+def test_subprocess(captured, instrumented):
+    run_process()
+
+    waits = list(_calls(captured)['run_process'].io_waits.values())
+    assert [wait.kind for wait in waits] == ['subprocess wait']
+    assert waits[0].target.endswith('-c pass')
+
+
+def test_outside_of_a_call(tmp_path, captured, instrumented):
+    with open(str(tmp_path / 'plain.txt'), 'w') as f:
+        f.write('x')
+
+    assert instrumented.kinds['file write'][0] == 1
+    assert instrumented.attributed_ns == 0
+
+
+def test_targets_are_capped(tmp_path, captured, instrumented):
+    @log_it
+    def many():
+        for n in range(io_wait.MAX_TARGETS + 5):
+            with open(str(tmp_path / '{0}.txt'.format(n)), 'wb') as f:
+                f.write(b'x')
+
+    many()
+
+    waits = _calls(captured)['many'].io_waits
+    assert len(waits) == io_wait.MAX_TARGETS + 1
+    assert waits[('file write', '...')].count == 5
+
+
+def test_uninstrument_puts_everything_back(instrumented):
+    assert builtins.open is io_wait._open
+    assert hasattr(socket.socket.send, '_io_original')
+
+    angry_debugger.uninstrument_io()
+
+    assert builtins.open is io_wait._original_builtin_open
+    assert io.open is io_wait._original_open
+
+    for func in (
+        socket.socket.send,
+        socket.socket.recv,
+        select.select,
+        subprocess.Popen.wait,
+        subprocess.Popen.communicate
+    ):
+        assert not hasattr(func, '_io_original')
+
+
+def test_report(tmp_path, captured, instrumented):
+    write_file(str(tmp_path / 'out.bin'), b'x' * 10)
+
+    text = angry_debugger.format_io_report()
+    assert text.startswith('I/O: ')
+    assert '    file write: 1x, ' in text
+    assert '.write_file: 1 of 1 calls did 1 operations' in text
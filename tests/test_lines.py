@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import logging
+
+import angry_debugger
+from angry_debugger import log_it
+
+logger = logging.getLogger(__name__)
+
+
+@log_it(lines=True)
+def looped(count):
+    total = 0
+    for n in range(count):
+        total += n
+    time.sleep(0.02)
+    return total
+
+
+@log_it(lines=True)
+def recursive(n):
+    if n:
+        return recursive(n - 1) + 1
+    return 0
+
+
+def _stats(name):
+    for key, stats in angry_debugger.get_line_stats().items():
+        if key.endswith(name):
+            return stats
+
+
+def _line_no(func, text):
+    code = func.__wrapped__.__code__
+    with open(code.co_filename) as f:
+        for line_no, line in enumerate(f, 1):
+            if line_no > code.co_firstlineno and line.strip() == text:
+                return line_no
+
+
+def test_hits_and_time_per_line(captured):
+    angry_debugger.reset_line_stats()
+    looped(5)
+    looped(5)
+
+    stats = _stats('.looped')
+    assert stats.calls == 2
+
+    add = _line_no(looped, 'total += n')
+    sleep = _line_no(looped, 'time.sleep(0.02)')
+
+    assert stats.lines[add][0] == 10
+    assert stats.lines[sleep][0] == 2
+
+    # the sleep is where the time went
+    assert stats.lines[sleep][1] >= 2 * 2 * 10 ** 7 * 0.9
+    assert stats.lines[sleep][1] > stats.total_ns * 0.9
+
+    # nothing outside of the function is traced
+    assert min(stats.lines) > looped.__wrapped__.__code__.co_firstlineno
+    assert sys.gettrace() is None
+
+
+def test_format_shows_the_source(captured):
+    angry_debugger.reset_line_stats()
+    looped(3)
+
+    text = angry_debugger.format_line_stats()
+    assert '1 calls' in text
+    assert 'time.sleep(0.02)' in text
+    assert 'def looped(count):' in text
+
+    name = _stats('.looped').name
+    assert angry_debugger.format_line_stats(name) == _stats('.looped').format()
+    assert angry_debugger.format_line_stats('missing') == ''
+
+
+def test_recursion(captured):
+    angry_debugger.reset_line_stats()
+    assert recursive(3) == 3
+
+    stats = _stats('.recursive')
+    assert stats.calls == 4
+    assert stats.lines[_line_no(recursive, 'return 0')][0] == 1
+
+
+def test_not_timed_without_time_it():
+    angry_debugger.reset_line_stats()
+    looped(3)
+
+    stats = _stats('.looped')
+    assert stats is None or stats.calls == 0
+
+
+def test_trace_function_fallback(captured, monkeypatch):
+    from angry_debugger import lines
+
+    monkeypatch.setattr(lines, '_LINE', None)
+
+    @log_it(lines=True)
+    def fallback(count):
+        total = 0
+        for n in range(count):
+            total += n
+        return total
+
+    if sys.gettrace() is not None:
+        # running under a debugger or coverage, the call is not timed
+        return
+
+    assert fallback(4) == 6
+    assert sys.gettrace() is None
+
+    stats = _stats('.fallback')
+    assert stats.calls == 1
+    assert stats.lines[_line_no(fallback, 'total += n')][0] == 4
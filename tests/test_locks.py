@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import logging
+import threading
+
+import pytest
+
+import angry_debugger
+from angry_debugger import InstrumentedLock
+
+
+@pytest.fixture
+def instrumented():
+    angry_debugger.reset_lock_stats()
+    angry_debugger.instrument_locks()
+    try:
+        yield
+    finally:
+        angry_debugger.uninstrument_locks()
+        angry_debugger.reset_lock_stats()
+
+
+def test_contention_is_counted():
+    lock = InstrumentedLock(name='test_contention_is_counted')
+    held = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with lock:
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    held.wait()
+
+    waiter = threading.Thread(target=lambda: lock.acquire() and lock.release())
+    waiter.start()
+    release.set()
+    thread.join()
+    waiter.join()
+
+    stats = angry_debugger.get_lock_stats()['test_contention_is_counted']
+    assert stats.acquisitions == 2
+    assert stats.contended == 1
+
+
+def test_totals_from_many_threads_add_up():
+    stats = angry_debugger.locks.LockStats('test_totals_from_many_threads_add_up')
+    interval = sys.getswitchinterval()
+    # switch threads as often as possible so the updates interleave
+    sys.setswitchinterval(1e-6)
+
+    def worker(holder):
+        for _ in range(20000):
+            stats.add_wait(1, True)
+            stats.add_hold(1, holder)
+
+    threads = [
+        threading.Thread(target=worker, args=('holder{0}'.format(n % 2),))
+        for n in range(8)
+    ]
+
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert stats.acquisitions == stats.contended == 160000
+    assert stats.wait_total_ns == stats.hold_total_ns == 160000
+    assert sorted(stats.holders.values()) == [[80000, 80000], [80000, 80000]]
+
+
+def test_rlock_reentry():
+    lock = InstrumentedLock(threading.RLock(), 'test_rlock_reentry')
+
+    with lock:
+        with lock:
+            assert lock._count == 2
+        assert lock._is_owned()
+
+    assert not lock._is_owned()
+
+
+def test_instrument_locks_replaces_the_factories(instrumented):
+    assert isinstance(threading.Lock(), InstrumentedLock)
+    assert isinstance(threading.RLock(), InstrumentedLock)
+
+    condition = threading.Condition()
+    with condition:
+        condition.notify_all()
+
+
+def test_at_fork_reinit_resets_a_held_lock():
+    lock = InstrumentedLock(name='test_at_fork_reinit')
+    lock.acquire()
+
+    lock._at_fork_reinit()
+
+    assert lock._owner is None
+    assert lock._count == 0
+    assert lock.acquire(False)
+    lock.release()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_fork_with_instrumented_locks(instrumented):
+    # logging reinitializes the lock of every handler in the child
+    handler = logging.StreamHandler()
+    errors = []
+    hook = sys.unraisablehook
+    sys.unraisablehook = lambda unraisable: errors.append(unraisable.exc_value)
+
+    # another thread holds the lock of the handler when the fork is made,
+    # that thread does not exist in the child
+    held = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with handler.lock:
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    held.wait()
+
+    try:
+        pid = os.fork()
+
+        if pid == 0:
+            ok = not errors and handler.lock.acquire(False)
+            os._exit(0 if ok else 1)
+
+        _, status = os.waitpid(pid, 0)
+    finally:
+        sys.unraisablehook = hook
+        release.set()
+        thread.join()
+        handler.close()
+
+    assert os.WIFEXITED(status)
+    assert os.WEXITSTATUS(status) == 0
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import random
+import logging
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it, control
+from angry_debugger.memo import MemoStats, HyperLogLog, make_key, _mix
+
+logger = logging.getLogger(__name__)
+
+
+@log_it(memo=True)
+def lookup(key):
+    return key
+
+
+@log_it
+def not_analysed(key):
+    return key
+
+
+@pytest.fixture(autouse=True)
+def clean_memo():
+    angry_debugger.reset_memo_stats()
+    yield
+    angry_debugger.reset_memo_stats()
+
+
+def _memo(name):
+    for key, stats in angry_debugger.get_memo_stats().items():
+        if key.endswith(name):
+            return stats
+
+
+def test_repeated_arguments_are_counted():
+    for n in range(1000):
+        lookup(n % 50)
+
+    stats = _memo('.lookup')
+    assert stats.calls == 1000
+    assert 45 <= stats.distinct <= 55
+    assert stats.repeat_rate > 0.9
+
+    # 50 keys do not fit in 16 entries going round in order
+    assert stats.hits[16] == 0
+    assert stats.hits[128] == 950
+    assert stats.hits[1024] == 950
+    assert stats.best_size() == 128
+    assert stats.saved_ns[128] > 0
+
+
+def test_memo_works_without_a_level():
+    assert logging.getLogger().getEffectiveLevel() >= logging.WARNING
+    lookup(1)
+    assert _memo('.lookup').calls == 1
+
+
+def test_report():
+    for n in range(100):
+        lookup(n % 10)
+
+    text = angry_debugger.format_memo_report()
+    assert '.lookup: 100 calls, ~10 distinct (90.0% repeated)' in text
+    assert 'maxsize=16' in text
+    assert '<- best' in text
+    assert angry_debugger.format_memo_report(limit=0) == ''
+
+
+def test_unhashable_arguments():
+    stats = MemoStats('unhashable')
+
+    for _ in range(3):
+        stats.add(([1, 2], {'a': {3}}), {}, 10)
+
+    assert stats.unhashable == 3
+    assert stats.hits[16] == 2
+
+    assert make_key(([1],), {}) == make_key(([1],), {})
+    assert make_key((1,), {'a': 2})[1]
+    assert not make_key(([1],), {})[1]
+
+
+def test_memo_analysis_by_pattern():
+    name = __name__ + '.not_analysed'
+
+    not_analysed(1)
+    stats = _memo('.not_analysed')
+    assert stats is None or stats.calls == 0
+
+    try:
+        assert control.set_memo_analysis(name) == 1
+        not_analysed(1)
+        not_analysed(1)
+        assert _memo('.not_analysed').hits[16] == 1
+
+        control.set_memo_analysis(name, False)
+        not_analysed(1)
+        assert _memo('.not_analysed').calls == 2
+    finally:
+        with control._lock:
+            control._memo_rules[:] = [
+                rule for rule in control._memo_rules if rule[0] != name
+            ]
+            control._replan()
+
+
+def test_reset_keeps_counting():
+    lookup(1)
+    angry_debugger.reset_memo_stats()
+    lookup(1)
+
+    assert _memo('.lookup').calls == 1
+
+
+def test_hyper_log_log_estimate():
+    sketch = HyperLogLog()
+    rand = random.Random(5)
+
+    for _ in range(50000):
+        sketch.add(_mix(rand.getrandbits(64)))
+
+    assert abs(sketch.count() - 50000) < 50000 * 0.05
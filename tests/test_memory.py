@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it, memory
+from angry_debugger.records import CallRecord
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def allocate(count):
+    return [object() for _ in range(count)]
+
+
+@pytest.fixture
+def memory_level(captured):
+    logging.getLogger().setLevel(
+        angry_debugger.LEVEL_MEMORY | angry_debugger.LEVEL_TIME_IT
+    )
+
+    try:
+        yield captured
+    finally:
+        angry_debugger.set_memory_sampling(0.0)
+
+
+def _calls(handler):
+    return [msg for msg in handler.messages if isinstance(msg, CallRecord)]
+
+
+def _stats():
+    for name, stats in angry_debugger.get_function_stats().items():
+        if name.endswith('.allocate'):
+            return stats
+
+
+def test_blocks_are_counted(memory_level):
+    kept = allocate(5000)
+
+    record = _calls(memory_level)[0]
+    assert record.blocks >= 5000
+    assert record.peak_bytes is None
+    assert 'memory: +' in str(record)
+
+    stats = _stats()
+    assert stats.memory_calls == 1
+    assert stats.mean_blocks >= 5000
+    assert stats.peak_samples == 0
+    del kept
+
+
+def test_sampled_calls_get_the_peak(memory_level):
+    angry_debugger.set_memory_sampling(1.0)
+
+    allocate(10000)
+    allocate(10)
+
+    first, second = _calls(memory_level)
+    assert first.peak_bytes > second.peak_bytes > 0
+    assert 'peak' in str(first)
+
+    stats = _stats()
+    assert stats.peak_samples == 2
+    assert stats.peak_max == first.peak_bytes
+    assert not memory.tracemalloc.is_tracing()
+
+
+def test_not_set_without_the_level(captured):
+    allocate(10)
+
+    record = _calls(captured)[0]
+    assert record.blocks is None
+    assert _stats().memory_calls == 0
+
+
+def test_format_bytes():
+    assert memory.format_bytes(10) == '10 B'
+    assert memory.format_bytes(2048) == '2.0 KiB'
+    assert memory.format_bytes(-3 * 1024 * 1024) == '-3.0 MiB'
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+
+import pytest
+
+pytest_plugins = 'pytester'
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PACKAGE = '''
+import time
+import logging
+
+from angry_debugger import log_it
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def fast():
+    pass
+
+
+@log_it
+def slow():
+    time.sleep(0.02)
+'''
+
+TESTS = '''
+import pytest
+
+import timed
+
+
+@pytest.mark.latency_budget('timed.slow', 5)
+def test_slow_over_budget():
+    timed.slow()
+
+
+@pytest.mark.latency_budget('timed.slow', 500)
+def test_slow_in_budget():
+    timed.slow()
+
+
+@pytest.mark.latency_budget('timed.*', 5)
+def test_fast():
+    for _ in range(10):
+        timed.fast()
+'''
+
+
+@pytest.fixture
+def project(pytester, monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', ROOT)
+    pytester.makepyfile(timed=PACKAGE, test_timed=TESTS)
+    return pytester
+
+
+def _run(project, *args):
+    return project.runpytest_subprocess(
+        '-p', 'angry_debugger_pytest',
+        '-p', 'no:cacheprovider',
+        *args
+    )
+
+
+def test_budgets_fail_slow_tests(project):
+    result = _run(
+        project,
+        '--angry-debugger', 'timed',
+        '--angry-debugger-report', 'report.json'
+    )
+
+    result.assert_outcomes(passed=2, failed=1)
+    result.stdout.fnmatch_lines([
+        '*latency budget exceeded:*',
+        '*timed.slow: p95 * ms > 5.000 ms (marker budget *timed.slow*)*'
+    ])
+
+    with open(str(project.path / 'report.json')) as f:
+        report = json.load(f)
+
+    assert report['packages'] == ['timed']
+    assert report['functions']['timed.slow']['calls'] == 2
+    assert report['functions']['timed.fast']['calls'] == 10
+
+    tests = report['tests']
+    assert list(tests['test_timed.py::test_fast']) == ['timed.fast']
+    assert tests['test_timed.py::test_fast']['timed.fast']['calls'] == 10
+    assert tests['test_timed.py::test_slow_in_budget']['timed.slow']['p50_ns'] > 5000000
+
+
+def test_ini_budgets(project):
+    project.makeini(
+        '[pytest]\n'
+        'angry_debugger_packages = timed\n'
+        'angry_debugger_budgets =\n'
+        '    timed.slow = 1\n'
+    )
+
+    result = _run(project, '-k', 'fast or in_budget')
+    result.assert_outcomes(passed=1, failed=1)
+    result.stdout.fnmatch_lines(['*timed.slow: p95 * (ini budget *timed.slow*)*'])
+
+
+SUBMODULE = '''
+import logging
+
+from angry_debugger import log_it
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def nested():
+    pass
+'''
+
+SUBMODULE_TESTS = '''
+import logging
+
+import timedpkg.sub
+
+
+class Handler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_records_of_submodules_are_dropped():
+    handler = Handler()
+    logging.getLogger().addHandler(handler)
+
+    try:
+        timedpkg.sub.nested()
+    finally:
+        logging.getLogger().removeHandler(handler)
+
+    assert handler.records == []
+'''
+
+
+def test_submodule_records_are_dropped(project):
+    package = project.mkpydir('timedpkg')
+    package.joinpath('sub.py').write_text(SUBMODULE)
+    project.makepyfile(test_sub=SUBMODULE_TESTS)
+
+    result = _run(
+        project,
+        'test_sub.py',
+        '--angry-debugger', 'timedpkg',
+        '--angry-debugger-report', 'report.json'
+    )
+    result.assert_outcomes(passed=1)
+
+    with open(str(project.path / 'report.json')) as f:
+        report = json.load(f)
+
+    assert report['functions']['timedpkg.sub.nested']['calls'] == 1
+
+
+def test_disabled_without_packages(project):
+    result = _run(project)
+
+    # nothing is timed so no budget can be broken
+    result.assert_outcomes(passed=3)
+
+
+def test_nothing_is_imported_without_packages(project):
+    project.makepyfile(
+        test_imports=(
+            'import sys\n'
+            '\n'
+            '\n'
+            'def test_not_imported():\n'
+            '    assert "angry_debugger" not in sys.modules\n'
+            '    assert sys.excepthook is sys.__excepthook__\n'
+        )
+    )
+
+    result = _run(project, 'test_imports.py')
+    result.assert_outcomes(passed=1)
+
+
+def test_bad_ini_budget(project):
+    project.makeini(
+        '[pytest]\n'
+        'angry_debugger_packages = timed\n'
+        'angry_debugger_budgets =\n'
+        '    timed.slow\n'
+    )
+
+    result = _run(project)
+    assert result.ret != 0
+    result.stderr.fnmatch_lines(['*expected "function = milliseconds"*'])
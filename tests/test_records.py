@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it
+from angry_debugger.records import CallRecord
+
+logger = logging.getLogger(__name__)
+
+
+class Counted(object):
+    reprs = 0
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        Counted.reprs += 1
+        return 'Counted({0})'.format(self.name)
+
+
+@log_it
+def echo(value):
+    return Counted(value.name + '!')
+
+
+@pytest.fixture
+def args_level(captured):
+    root = logging.getLogger()
+    root.setLevel(
+        angry_debugger.LEVEL_TIME_IT |
+        angry_debugger.LEVEL_ARGS |
+        angry_debugger.LEVEL_RETURN
+    )
+    Counted.reprs = 0
+    yield captured
+
+
+def _calls(handler):
+    return [msg for msg in handler.messages if isinstance(msg, CallRecord)]
+
+
+def test_args_and_result_formatted_when_written(args_level):
+    echo(Counted('a'))
+
+    record = _calls(args_level)[0]
+    text = str(record)
+
+    assert 'echo(value=Counted(a))' in text
+    assert 'echo => Counted(a!)' in text
+    assert Counted.reprs == 2
+
+    # formatted once, the objects are let go of after that
+    assert record.arg_string == '(value=Counted(a))'
+    assert record.result == 'Counted(a!)'
+    assert record._args is None
+    assert Counted.reprs == 2
+
+
+def test_dropped_run_never_formats(args_level):
+    retention = angry_debugger.set_run_retention(
+        min_duration_ms=60000,
+        keep_errors=False
+    )
+
+    try:
+        angry_debugger.start_logging_run()
+        echo(Counted('b'))
+        echo(Counted('c'))
+        angry_debugger.end_logging_run()
+    finally:
+        angry_debugger.clear_run_retention()
+
+    assert retention.dropped == 1
+    assert _calls(args_level) == []
+    assert Counted.reprs == 0
+
+
+def test_result_none_and_assignment():
+    record = CallRecord(
+        10,
+        threading.current_thread(),
+        'a',
+        'a.py',
+        1,
+        'b',
+        'b.py',
+        2,
+        'b',
+        '',
+        0,
+        True
+    )
+
+    assert record.result is None
+    record.set_result(None)
+    assert record.result == 'None'
+
+    record.set_args(len, ([1, 2],), {})
+    record.arg_string = '(given)'
+    assert record.arg_string == '(given)'
+
+
+@log_it
+def fails(value):
+    raise KeyError(value)
+
+
+def test_failed_call_is_logged_and_counted(captured):
+    with pytest.raises(KeyError):
+        fails('x')
+
+    record = _calls(captured)[0]
+    assert record.exception == 'KeyError'
+    assert record.duration_ns is not None
+
+    text = str(record)
+    assert 'raised KeyError' in text
+    assert 'in fails' in text
+    assert 'angry_debugger' not in record.format_traceback()
+
+    # once formatted the frames are let go of
+    assert record.exc_info[2] is None
+
+    stats = [
+        item for name, item in angry_debugger.get_function_stats().items()
+        if name.endswith('.fails')
+    ][0]
+    assert stats.calls == 1
+    assert stats.errors == 1
+    assert stats.error_rate == 1.0
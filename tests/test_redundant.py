@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it
+from angry_debugger.runs import RunRecord, format_redundant_calls
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def get_config(key):
+    return key
+
+
+@log_it
+def query(item_id, deep=False):
+    return item_id
+
+
+@pytest.fixture
+def detect():
+    angry_debugger.set_redundant_call_detection(True, min_count=2)
+    yield
+    angry_debugger.set_redundant_call_detection(False)
+
+
+def _stop(handler):
+    stop, = [
+        msg for msg in handler.messages
+        if isinstance(msg, RunRecord) and msg.kind == 'stop'
+    ]
+    return stop
+
+
+def _run():
+    angry_debugger.start_logging_run()
+
+    for n in range(5):
+        get_config('db')
+        query(n)
+
+    query(1, deep=True)
+    query(1, deep=True)
+    query(1, deep=True)
+
+    angry_debugger.end_logging_run()
+
+
+def test_repeated_calls_are_listed(captured, detect):
+    _run()
+
+    stop = _stop(captured)
+    redundant = dict(
+        (call.description.split('.')[-1], call) for call in stop.redundant
+    )
+
+    assert sorted(redundant) == ["get_config('db')", 'query(1, deep=True)']
+    assert redundant["get_config('db')"].count == 5
+    assert redundant['query(1, deep=True)'].count == 3
+
+    call = redundant["get_config('db')"]
+    assert call.wasted_ns == call.total_ns - call.total_ns // 5
+
+    # the ones that wasted the most time come first
+    wasted = [call.wasted_ns for call in stop.redundant]
+    assert wasted == sorted(wasted, reverse=True)
+
+    assert 'redundant calls:' in str(stop)
+    assert "get_config('db')" in str(stop)
+
+
+def test_min_count(captured):
+    angry_debugger.set_redundant_call_detection(True, min_count=4)
+
+    try:
+        _run()
+    finally:
+        angry_debugger.set_redundant_call_detection(False)
+
+    assert [call.count for call in _stop(captured).redundant] == [5]
+
+
+def test_off_by_default(captured):
+    _run()
+
+    stop = _stop(captured)
+    assert not stop.redundant
+    assert 'redundant calls:' not in str(stop)
+
+
+def test_calls_outside_of_a_run(captured, detect):
+    for _ in range(3):
+        get_config('db')
+
+    assert [msg for msg in captured.messages if isinstance(msg, RunRecord)] == []
+
+
+def test_format_limit(captured, detect):
+    _run()
+
+    calls = _stop(captured).redundant
+    text = format_redundant_calls(calls, limit=1)
+    assert text.count('get_config') + text.count('query(') == 1
+    assert text.rstrip().endswith('1 more')
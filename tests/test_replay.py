@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import logging
+import argparse
+import subprocess
+
+import angry_debugger
+from angry_debugger import log_it, replay
+from angry_debugger.records import CallRecord
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@log_it
+def inner(value):
+    return value * 2
+
+
+@log_it
+def outer(value):
+    return inner(value) + 1
+
+
+def _capture(path, values):
+    writer = replay.CaptureWriter(path, __name__ + '.outer')
+
+    for value in values:
+        call_id = writer.before((value,), {})
+        writer.after(call_id, outer.__wrapped__(value))
+
+    writer.close()
+
+
+def test_replay_capture(tmp_path):
+    path = str(tmp_path / 'outer.capture')
+    _capture(path, [1, 2, 3])
+
+    result = replay.replay_capture(path, outer.__wrapped__, repeat=2, check=True)
+    assert result.calls == 6
+    assert result.mismatches == 0
+
+
+def test_captures_are_closed_at_exit(tmp_path):
+    path = str(tmp_path / 'double.capture')
+    script = (
+        'import atexit\n'
+        'import angry_debugger\n'
+        # runs after the captures are closed, it must not truncate the file
+        'atexit.register(lambda: double(1))\n'
+        '@angry_debugger.log_it(capture={0!r})\n'
+        'def double(value):\n'
+        '    return value * 2\n'
+        'for n in range(100):\n'
+        '    double(n)\n'.format(path)
+    )
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    subprocess.check_call([sys.executable, '-c', script], env=env)
+
+    reader = replay.CaptureReader(path)
+    try:
+        calls = reader.calls()
+    finally:
+        reader.close()
+
+    assert len(calls) == 100
+    assert [call.value for call in calls] == [n * 2 for n in range(100)]
+
+
+def test_closed_writer_captures_nothing(tmp_path):
+    path = str(tmp_path / 'outer.capture')
+    _capture(path, [1, 2, 3])
+
+    writer = replay.CaptureWriter(path, __name__ + '.outer')
+    writer.close()
+    assert writer.before((4,), {}) is None
+
+    reader = replay.CaptureReader(path)
+    try:
+        assert len(reader.calls()) == 3
+    finally:
+        reader.close()
+
+
+def test_replay_command_silences_every_level(tmp_path, captured, capsys):
+    path = str(tmp_path / 'outer.capture')
+    _capture(path, [1, 2, 3])
+
+    captured.records[:] = []
+    logging.getLogger().setLevel(angry_debugger.LEVEL_ANGRY | angry_debugger.LEVEL_CPU)
+    previous = logging.root.manager.disable
+
+    args = argparse.Namespace(
+        path=path,
+        func='{0}:outer'.format(__name__),
+        repeat=3,
+        warmup=0,
+        check=True
+    )
+
+    assert replay.replay_command(args) == 0
+    assert [msg for msg in captured.messages if isinstance(msg, CallRecord)] == []
+
+    # the state logging was in is put back
+    assert logging.root.manager.disable == previous
+
+    inner(1)
+    assert len(captured.records) == 1
+
+
+def test_get_level_honours_logging_disable():
+    from angry_debugger.levels import get_level, HIGHEST_LEVEL
+
+    logger.setLevel(angry_debugger.LEVEL_CPU)
+
+    try:
+        assert get_level(logger) == angry_debugger.LEVEL_CPU
+
+        logging.disable(logging.CRITICAL)
+        # CRITICAL is below every angry_debugger level
+        assert get_level(logger) == angry_debugger.LEVEL_CPU
+
+        logging.disable(HIGHEST_LEVEL)
+        assert get_level(logger) == 0
+    finally:
+        logging.disable(logging.NOTSET)
+        logger.setLevel(logging.NOTSET)
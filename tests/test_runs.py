@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import threading
+
+import angry_debugger
+from angry_debugger import log_it
+from angry_debugger.records import CallRecord
+from angry_debugger.runs import RunRecord, current_run
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def step(name):
+    return name
+
+
+def _runs(handler):
+    # run id -> names of the calls logged in it, in order
+    res = {}
+
+    for msg in handler.messages:
+        if isinstance(msg, CallRecord):
+            res.setdefault(msg.run_id, []).append(msg.arg_string or msg.called_obj)
+
+    return res
+
+
+def test_run_collects_calls(captured):
+    angry_debugger.start_logging_run()
+    step('a')
+    step('b')
+    tree = angry_debugger.end_logging_run()
+
+    assert len(tree) == 2
+    kinds = [msg.kind for msg in captured.messages if isinstance(msg, RunRecord)]
+    assert kinds == ['start', 'stop']
+
+    calls = [msg for msg in captured.messages if isinstance(msg, CallRecord)]
+    assert len(calls) == 2
+    assert calls[0].run_id == calls[1].run_id != 0
+
+
+def test_end_without_run_returns_none(captured):
+    assert angry_debugger.end_logging_run() is None
+
+
+def test_threads_get_their_own_runs(captured):
+    trees = {}
+
+    def work(name):
+        angry_debugger.start_logging_run()
+        step(name)
+        step(name)
+        trees[name] = angry_debugger.end_logging_run()
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in 'xyz']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(trees) == ['x', 'y', 'z']
+    assert all(len(tree) == 2 for tree in trees.values())
+
+
+def test_child_task_runs_do_not_end_the_parent_run(captured):
+    results = {}
+
+    async def child(name):
+        # inherits the run of the parent until it starts its own
+        angry_debugger.start_logging_run()
+        step(name)
+        await asyncio.sleep(0)
+        step(name)
+        results[name] = angry_debugger.end_logging_run()
+
+        # back in the parent run
+        results[name + ' after'] = current_run()
+
+    async def parent():
+        angry_debugger.start_logging_run()
+        parent_run = current_run()
+        step('parent 1')
+
+        await asyncio.gather(child('c1'), child('c2'))
+
+        step('parent 2')
+        assert current_run() is parent_run
+        results['parent'] = angry_debugger.end_logging_run()
+        results['parent run'] = parent_run
+
+    asyncio.run(parent())
+
+    assert len(results['parent']) == 2
+    assert len(results['c1']) == 2
+    assert len(results['c2']) == 2
+    assert results['c1 after'] is results['parent run']
+    assert results['c2 after'] is results['parent run']
+
+    parent_id = results['parent run'].run_id
+    calls = [msg for msg in captured.messages if isinstance(msg, CallRecord)]
+    parent_calls = [msg for msg in calls if msg.run_id == parent_id]
+    assert len(parent_calls) == 2
+    # nothing was logged outside of a run
+    assert all(msg.run_id for msg in calls)
+
+
+def test_child_end_does_not_end_inherited_run(captured):
+    async def child():
+        # never started a run of its own
+        return angry_debugger.end_logging_run()
+
+    async def parent():
+        angry_debugger.start_logging_run()
+        step('a')
+        child_result = await asyncio.ensure_future(child())
+        step('b')
+        return child_result, angry_debugger.end_logging_run()
+
+    child_result, tree = asyncio.run(parent())
+
+    assert child_result is None
+    assert len(tree) == 2
+
+
+def test_tasks_on_one_thread_have_their_own_call_stacks(captured):
+    async def handle(name, delay):
+        with angry_debugger.span(name):
+            await asyncio.sleep(delay)
+            step(name)
+
+    async def main():
+        # blk2 starts after blk1 and finishes before it
+        first = asyncio.ensure_future(handle('blk1', 0.03))
+        await asyncio.sleep(0)
+        await handle('blk2', 0.01)
+        await first
+
+    asyncio.run(main())
+
+    records = [msg for msg in captured.messages if isinstance(msg, CallRecord)]
+    spans = [msg for msg in records if msg.called_obj.endswith('(span)')]
+    steps = [msg for msg in records if msg not in spans]
+
+    assert sorted(span.called_obj for span in spans) == ['blk1 (span)', 'blk2 (span)']
+
+    for span in spans:
+        # neither span is a part of the other one
+        assert span.parent_id == 0
+        assert span.depth == 0
+
+        step_record, = [msg for msg in steps if msg.parent_id == span.span_id]
+        assert step_record.depth == 1
+        assert span.self_ns == span.duration_ns - step_record.duration_ns
+
+    assert angry_debugger.runs.call_stack() == ()
+
+
+def test_restarting_a_run_ends_the_previous_one(captured):
+    angry_debugger.start_logging_run()
+    step('a')
+    angry_debugger.start_logging_run()
+    step('b')
+    tree = angry_debugger.end_logging_run()
+
+    assert len(tree) == 1
+    kinds = [msg.kind for msg in captured.messages if isinstance(msg, RunRecord)]
+    assert kinds == ['start', 'stop', 'start', 'stop']
+    assert current_run() is None
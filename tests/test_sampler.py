@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+import threading
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it
+from angry_debugger.sampler import Sampler, get_ident
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def blocked(event):
+    event.wait(10)
+
+
+@log_it
+def outer(event):
+    blocked(event)
+
+
+def plain(event):
+    event.wait(10)
+
+
+@pytest.fixture
+def worker():
+    event = threading.Event()
+    threads = []
+
+    def start(func):
+        thread = threading.Thread(target=func, args=(event,))
+        thread.start()
+        threads.append(thread)
+
+        # wait for the thread to get to the wait
+        time.sleep(0.05)
+        return thread
+
+    yield start
+
+    event.set()
+    for thread in threads:
+        thread.join()
+
+
+def _stats(name):
+    for key, stats in angry_debugger.get_function_stats().items():
+        if key.endswith(name):
+            return stats
+
+
+def _worker_stacks(sampler, name):
+    # other tests may have left threads running
+    return [path for path in sampler.stacks if name in path]
+
+
+def test_innermost_decorated_function_gets_the_sample(worker):
+    worker(outer)
+    sampler = Sampler()
+
+    sampler.sample(1000, get_ident())
+    sampler.sample(3000, get_ident())
+
+    inner = _stats('.blocked')
+    assert inner.self_samples == 2
+    assert inner.self_sampled_ns == 4000
+    assert inner.samples == 2
+
+    caller = _stats('.outer')
+    assert caller.self_samples == 0
+    assert caller.samples == 2
+    assert caller.sampled_ns == 4000
+
+    path, = _worker_stacks(sampler, '.blocked')
+    names = [name.rsplit('.', 1)[-1] for name in path.split(';')]
+    assert names[-1] == 'wait'
+    assert names.index('outer') < names.index('blocked')
+    assert not [name for name in path.split(';') if name.startswith('angry_debugger')]
+    assert sampler.stacks[path] == 2
+
+    text = sampler.format_folded()
+    assert '{0} 2\n'.format(path) in text
+
+
+def test_package_gets_the_sample(worker):
+    worker(plain)
+    sampler = Sampler(packages=[__name__])
+
+    sampler.sample(1000, get_ident())
+
+    stats = angry_debugger.get_function_stats()[__name__ + ' (package)']
+    assert stats.self_samples == 1
+    assert stats.self_sampled_ns == 1000
+
+
+def test_background_sampling(worker):
+    worker(outer)
+
+    sampler = angry_debugger.start_sampling(interval_ms=1)
+    assert angry_debugger.get_sampler() is sampler
+    time.sleep(0.1)
+    assert angry_debugger.stop_sampling() is sampler
+    assert angry_debugger.get_sampler() is None
+    assert not sampler.is_alive()
+
+    assert sampler.samples > 0
+    assert _stats('.blocked').self_samples > 0
+
+    # the sampler leaves its own thread out
+    assert not [path for path in sampler.stacks if 'Sampler.run' in path]
+
+    text = angry_debugger.format_sample_report()
+    assert text.startswith('   self  self time   total total time  function\n')
+    assert '.blocked' in text
+
+
+def test_write_folded(tmp_path, worker):
+    worker(outer)
+    sampler = Sampler()
+    sampler.sample(1000, get_ident())
+
+    path = str(tmp_path / 'out.folded')
+    sampler.write_folded(path)
+    assert open(path).read() == sampler.format_folded()
+
+    sampler.reset()
+    assert sampler.samples == 0
+    assert sampler.format_folded() == ''
+
+
+def test_report_without_samples():
+    assert angry_debugger.format_sample_report() == ''
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it, span
+from angry_debugger.records import SpanRecord
+
+from conftest import ListHandler
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def parse(data):
+    with span('tokenize'):
+        tokens = data.split()
+
+    with span('build'):
+        return len(tokens)
+
+
+@span('decorated')
+def decorated(value):
+    if value is None:
+        raise ValueError('no value')
+    return value
+
+
+def _spans(handler):
+    return [msg for msg in handler.messages if isinstance(msg, SpanRecord)]
+
+
+def test_spans_nest_under_the_call(attach):
+    handler = attach(ListHandler())
+    angry_debugger.start_logging_run()
+    assert parse('a b c') == 3
+    tree = angry_debugger.end_logging_run()
+
+    tokenize, build = _spans(handler)
+    assert tokenize.called_obj == 'tokenize (span)'
+    assert build.called_obj == 'build (span)'
+    assert tokenize.calling_obj.endswith('.parse')
+
+    call = tree.roots[0]
+    assert call.name.endswith('.parse')
+    assert [child.name for child in call.children] == [
+        'tokenize (span)',
+        'build (span)'
+    ]
+    assert tokenize.parent_id == call.span_id
+
+    stats = angry_debugger.get_function_stats()
+    assert stats['tokenize (span)'].calls == 1
+    assert stats['build (span)'].calls == 1
+
+
+def test_span_without_a_level_does_nothing(attach):
+    handler = attach(ListHandler(), logging.WARNING)
+
+    for _ in range(3):
+        parse('a b')
+
+    assert handler.records == []
+    assert 'tokenize (span)' not in angry_debugger.get_function_stats()
+
+
+def test_span_decorator(attach):
+    handler = attach(ListHandler())
+
+    assert decorated(5) == 5
+    with pytest.raises(ValueError):
+        decorated(None)
+
+    ok, failed = _spans(handler)
+    assert ok.called_obj == 'decorated (span)'
+    assert ok.calling_obj.endswith('test_span_decorator')
+    assert ok.exception is None
+    assert failed.exception == 'ValueError'
+
+    stats = angry_debugger.get_function_stats()['decorated (span)']
+    assert stats.calls == 2
+    assert stats.errors == 1
+
+
+def test_span_logger_argument(captured):
+    other = logging.getLogger('angry_debugger_tests.span')
+    other.setLevel(angry_debugger.LEVEL_ANGRY)
+
+    try:
+        with span('custom', logger=other):
+            pass
+    finally:
+        other.setLevel(logging.NOTSET)
+
+    record, = [
+        record for record in captured.records
+        if isinstance(record.msg, SpanRecord)
+    ]
+    assert record.name == 'angry_debugger_tests.span'
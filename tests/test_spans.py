@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+
+import angry_debugger
+from angry_debugger import log_it
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def leaf(seconds):
+    time.sleep(seconds)
+
+
+@log_it
+def middle():
+    leaf(0.01)
+    leaf(0.01)
+
+
+@log_it
+def top():
+    time.sleep(0.01)
+    middle()
+
+
+@log_it
+def recurse(n):
+    if n:
+        recurse(n - 1)
+
+
+def _short(name):
+    return name.rsplit('.', 1)[-1]
+
+
+def test_tree_nests_the_calls(captured):
+    angry_debugger.start_logging_run()
+    top()
+    tree = angry_debugger.end_logging_run()
+
+    assert len(tree) == 4
+    assert [(_short(span.name), span.depth) for span in tree] == [
+        ('top', 0),
+        ('middle', 1),
+        ('leaf', 2),
+        ('leaf', 2)
+    ]
+
+    root = tree.roots[0]
+    middle_span = root.children[0]
+
+    # the time spent in the children is not self time
+    assert root.total_ns == middle_span.total_ns + root.self_ns
+    assert root.self_ns >= 10 ** 7 * 0.9
+    assert middle_span.self_ns < middle_span.total_ns / 2
+    assert tree.total_ns == root.total_ns
+
+    by_name = dict((_short(entry[0]), entry) for entry in tree.self_time())
+    assert by_name['leaf'][1] == 2
+    assert by_name['leaf'][2] >= 2 * 10 ** 7 * 0.9
+
+    text = tree.format()
+    assert text.startswith('span tree:')
+    assert text.count('leaf') == 2
+
+    folded = tree.format_folded().splitlines()
+    assert any(line.count(';') == 2 and 'leaf' in line for line in folded)
+
+
+def test_recursion_counts_total_once(captured):
+    angry_debugger.start_logging_run()
+    recurse(3)
+    tree = angry_debugger.end_logging_run()
+
+    assert [span.depth for span in tree] == [0, 1, 2, 3]
+
+    (name, calls, self_ns, total_ns), = tree.self_time()
+    assert calls == 4
+    assert total_ns == tree.roots[0].total_ns
+
+
+def test_exception_is_shown(captured):
+    @log_it
+    def boom():
+        raise KeyError('x')
+
+    angry_debugger.start_logging_run()
+    try:
+        boom()
+    except KeyError:
+        pass
+    tree = angry_debugger.end_logging_run()
+
+    assert tree.roots[0].exception == 'KeyError'
+    assert 'raised KeyError' in tree.format()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+import argparse
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it
+from angry_debugger import top as _top
+from angry_debugger.stats import (
+    FunctionStats,
+    histogram_bucket,
+    bucket_bounds,
+    get_stats
+)
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def quiet(value):
+    return value
+
+
+@log_it
+def quiet_error():
+    raise ValueError('nope')
+
+
+@pytest.fixture
+def silent_logger():
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+
+    try:
+        yield
+    finally:
+        logger.setLevel(level)
+
+
+def _stats_for(suffix):
+    for name, stats in angry_debugger.get_function_stats().items():
+        if name.endswith(suffix):
+            return stats
+
+    return None
+
+
+def test_buckets_hold_their_durations():
+    for duration_ns in (0, 1, 3, 4, 7, 100, 12345, 10 ** 9, 2 ** 40 + 3):
+        low, high = bucket_bounds(histogram_bucket(duration_ns))
+        assert low <= duration_ns <= high
+
+
+def test_percentile():
+    stats = FunctionStats('x')
+
+    for _ in range(99):
+        stats.add(1000)
+
+    stats.add(10 ** 9, error=True)
+
+    assert stats.calls == 100
+    assert stats.errors == 1
+    assert 750 <= stats.percentile(50) <= 1250
+    assert stats.percentile(100) > 10 ** 8
+
+
+def test_nothing_is_counted_with_logging_off(silent_logger, captured):
+    quiet(1)
+
+    with angry_debugger.span('quiet block'):
+        pass
+
+    assert captured.records == []
+    assert angry_debugger.get_function_stats() == {}
+
+
+@pytest.fixture
+def published():
+    if _top.shared_memory is None:
+        pytest.skip('needs shared_memory')
+
+    _top.publish_stats()
+
+    try:
+        yield
+    finally:
+        _top.unpublish_stats()
+
+
+def test_calls_are_counted_while_publishing(silent_logger, captured, published):
+    quiet(1)
+    quiet(2)
+
+    with pytest.raises(ValueError):
+        quiet_error()
+
+    assert captured.records == []
+
+    stats = _stats_for('.quiet')
+    assert stats is not None
+    assert stats.calls == 2
+    assert stats.errors == 0
+    assert stats.total_ns > 0
+
+    stats = _stats_for('.quiet_error')
+    assert stats.calls == 1
+    assert stats.errors == 1
+
+
+def test_spans_are_counted_while_publishing(silent_logger, published):
+    with angry_debugger.span('quiet block'):
+        pass
+
+    with pytest.raises(KeyError):
+        with angry_debugger.span('quiet block'):
+            raise KeyError('x')
+
+    @angry_debugger.span('quiet decorated')
+    def decorated():
+        return 5
+
+    assert decorated() == 5
+
+    stats = angry_debugger.get_function_stats()
+    assert stats['quiet block (span)'].calls == 2
+    assert stats['quiet block (span)'].errors == 1
+    assert stats['quiet decorated (span)'].calls == 1
+
+
+@pytest.mark.skipif(_top.shared_memory is None, reason='needs shared_memory')
+def test_reset_frees_published_slots():
+    _top.publish_stats(max_functions=4)
+
+    try:
+        publisher = _top._publisher
+
+        for n in range(4):
+            get_stats('slot.func{0}'.format(n)).add(100)
+
+        assert publisher.used == 4
+        old = get_stats('slot.func0')
+
+        angry_debugger.reset_function_stats()
+        assert publisher.used == 0
+        assert old.slot is None
+
+        # a call that still had the old stats does not write into the slot
+        # that gets handed out next
+        get_stats('slot.new').add(100)
+        old.add(999)
+
+        reader = _top.StatsReader(os.getpid())
+        try:
+            published = reader.read()
+        finally:
+            reader.close()
+
+        assert list(published) == ['slot.new']
+        assert published['slot.new'][:3] == (1, 0, 100)
+    finally:
+        _top.unpublish_stats()
+
+
+@pytest.mark.skipif(_top.shared_memory is None, reason='needs shared_memory')
+def test_top_reads_published_calls(silent_logger, capsys):
+    _top.publish_stats()
+
+    try:
+        for n in range(10):
+            quiet(n)
+
+        with pytest.raises(ValueError):
+            quiet_error()
+
+        reader = _top.StatsReader(os.getpid())
+        try:
+            published = reader.read()
+        finally:
+            reader.close()
+
+        name = _stats_for('.quiet').name
+        calls, errors, total_ns, histogram = published[name]
+        assert (calls, errors) == (10, 0)
+        assert sum(histogram) == 10
+        assert published[_stats_for('.quiet_error').name][:2] == (1, 1)
+
+        rows = dict(
+            (row[0], row) for row in _top._rows(published, {name: published[name]}, 2.0)
+        )
+        # nothing happened since the previous refresh
+        assert rows[name][1] == 0.0
+        assert rows[_stats_for('.quiet_error').name][1] == 0.5
+
+        args = argparse.Namespace(
+            pid=os.getpid(),
+            sort='calls',
+            limit=10,
+            iterations=1,
+            interval=0
+        )
+        assert _top.top_command(args) == 0
+        assert name in capsys.readouterr().out
+    finally:
+        _top.unpublish_stats()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+
+import pytest
+
+import angry_debugger
+from angry_debugger import log_it
+from angry_debugger.records import CallRecord
+
+logger = logging.getLogger(__name__)
+
+
+@log_it(threshold_ms=20)
+def maybe_slow(seconds, items):
+    time.sleep(seconds)
+    items.append('done')
+    return len(items)
+
+
+@log_it
+def plain(seconds):
+    time.sleep(seconds)
+
+
+@pytest.fixture
+def angry(captured):
+    logging.getLogger().setLevel(angry_debugger.LEVEL_ANGRY)
+    yield captured
+    angry_debugger.set_slow_call_threshold(None)
+
+
+def _calls(handler):
+    return [msg for msg in handler.messages if isinstance(msg, CallRecord)]
+
+
+def _stats(name):
+    for key, stats in angry_debugger.get_function_stats().items():
+        if key.endswith(name):
+            return stats
+
+
+def test_only_slow_calls_are_logged(angry):
+    for _ in range(3):
+        maybe_slow(0, [])
+
+    maybe_slow(0.03, ['a'])
+
+    calls = _calls(angry)
+    assert len(calls) == 1
+
+    record = calls[0]
+    assert record.duration_ns >= 20 * 1000000
+    assert 'test_only_slow_calls_are_logged' in record.calling_obj
+    # the arguments are the way they are when the call returned
+    assert record.arg_string == "(seconds=0.03, items=['a', 'done'])"
+    assert record.result == '2'
+
+    # every call is counted
+    assert _stats('.maybe_slow').calls == 4
+
+
+def test_slow_exception_is_logged(angry):
+    @log_it(threshold_ms=10)
+    def slow_error():
+        time.sleep(0.02)
+        raise KeyError('x')
+
+    @log_it(threshold_ms=10)
+    def fast_error():
+        raise KeyError('x')
+
+    for func in (slow_error, fast_error):
+        with pytest.raises(KeyError):
+            func()
+
+    calls = _calls(angry)
+    assert [record.exception for record in calls] == ['KeyError']
+    assert calls[0].called_obj.endswith('slow_error')
+    assert _stats('.fast_error').errors == 1
+
+
+def test_global_threshold(angry):
+    angry_debugger.set_slow_call_threshold(20)
+
+    plain(0)
+    plain(0.03)
+    assert len(_calls(angry)) == 1
+
+    angry_debugger.set_slow_call_threshold(None)
+    plain(0)
+    assert len(_calls(angry)) == 2
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import logging
+import threading
+
+import pytest
+
+from angry_debugger.records import CallRecord
+from angry_debugger.trace_store import (
+    TraceStore,
+    TraceStoreWriter,
+    TraceStoreHandler,
+    _INDEX_ENTRY
+)
+
+FUNCS = ['mod.alpha', 'mod.beta', 'other.gamma', 'other.delta']
+
+
+def _record(func, thread_id, run_id, timestamp_ns, duration_ns):
+    record = CallRecord(
+        10,
+        threading.current_thread(),
+        'caller',
+        'caller.py',
+        1,
+        func,
+        'callee.py',
+        2,
+        func.split('.')[-1],
+        'n={0}'.format(timestamp_ns),
+        timestamp_ns,
+        True,
+        run_id=run_id
+    )
+    record.thread_id = thread_id
+    record.duration_ns = duration_ns
+    return record
+
+
+def _write(path, count, flush_every, seed=1):
+    rand = random.Random(seed)
+    writer = TraceStoreWriter(path)
+    written = []
+
+    for n in range(count):
+        record = _record(
+            rand.choice(FUNCS),
+            rand.choice((11, 22, 33)),
+            n // 100 + 1,
+            1000 * n,
+            rand.choice((10, 1000, 100000, 10000000))
+        )
+        writer.write(record)
+        written.append(record)
+
+        if (n + 1) % flush_every == 0:
+            writer.flush()
+
+    return writer, written
+
+
+def _expected(written, func=None, thread_id=None, run_id=None,
+              since_ns=None, until_ns=None, min_duration_ns=None):
+    res = []
+
+    for record in written:
+        if func is not None and not (
+            record.called_obj == func or
+            (func.endswith('*') and record.called_obj.startswith(func[:-1]))
+        ):
+            continue
+        if thread_id is not None and record.thread_id != thread_id:
+            continue
+        if run_id is not None and record.run_id != run_id:
+            continue
+        if since_ns is not None and record.timestamp_ns < since_ns:
+            continue
+        if until_ns is not None and record.timestamp_ns > until_ns:
+            continue
+        if min_duration_ns is not None and record.duration_ns < min_duration_ns:
+            continue
+
+        res.append(record.timestamp_ns)
+
+    return res
+
+
+FILTERS = [
+    {},
+    {'func': 'mod.alpha'},
+    {'func': 'other.*'},
+    {'thread_id': 22},
+    {'run_id': 4},
+    {'func': 'mod.beta', 'thread_id': 33, 'run_id': 2},
+    {'since_ns': 250000, 'until_ns': 420000},
+    {'min_duration_ns': 100000},
+    {'min_duration_ns': 10000000, 'func': 'other.gamma'},
+    {'func': 'missing.func'},
+    {'thread_id': 99},
+]
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_query_matches_brute_force(tmp_path, filters):
+    path = str(tmp_path / 'run.trace')
+    writer, written = _write(path, 1000, 128)
+    writer.close()
+
+    with TraceStore(path) as store:
+        assert len(store) == 1000
+        assert sum(segment.count for segment in store._segments) == 1000
+
+        found = [entry.timestamp_ns for entry in store.query(**filters)]
+        assert found == _expected(written, **filters)
+
+        for entry in store.query(**filters):
+            assert store.load(entry)['timestamp_ns'] == entry.timestamp_ns
+
+
+def test_query_only_touches_postings(tmp_path, monkeypatch):
+    path = str(tmp_path / 'run.trace')
+    writer, written = _write(path, 1000, 100)
+    writer.close()
+
+    touched = []
+    entry = TraceStore._entry
+
+    def counting_entry(self, number):
+        touched.append(number)
+        return entry(self, number)
+
+    monkeypatch.setattr(TraceStore, '_entry', counting_entry)
+
+    with TraceStore(path) as store:
+        found = list(store.query(run_id=3))
+        assert len(found) == 100
+        # run 3 is a single segment and the postings hold all of it
+        assert len(touched) == 100
+
+        del touched[:]
+        found = list(store.query(func='mod.alpha', thread_id=11))
+        assert len(found) == len(_expected(written, func='mod.alpha', thread_id=11))
+        assert len(touched) == len(found)
+
+        del touched[:]
+        assert list(store.query(since_ns=10 ** 12)) == []
+        assert touched == []
+
+
+def test_entries_not_in_a_segment_are_found(tmp_path):
+    path = str(tmp_path / 'run.trace')
+    writer, written = _write(path, 250, 100)
+
+    # flush the data and index but not the postings, like a writer that was
+    # stopped in the middle of a flush
+    writer._name_file.flush()
+    writer._data.flush()
+    writer._index.flush()
+
+    with TraceStore(path) as store:
+        assert len(store) == 250
+        assert sum(segment.count for segment in store._segments) == 200
+
+        found = [entry.timestamp_ns for entry in store.query(thread_id=22)]
+        assert found == _expected(written, thread_id=22)
+
+    writer.close()
+
+
+def test_reopen_writes_missing_segment(tmp_path):
+    path = str(tmp_path / 'run.trace')
+    writer, written = _write(path, 250, 100)
+    writer._name_file.flush()
+    writer._data.flush()
+    writer._index.flush()
+
+    # half a segment at the end of the postings file
+    with open(path + '.post', 'ab') as f:
+        f.write(b'\x10\x00\x00')
+
+    writer = TraceStoreWriter(path)
+    writer.write(_record('mod.alpha', 11, 9, 10 ** 9, 5))
+    written.append(_record('mod.alpha', 11, 9, 10 ** 9, 5))
+    writer.close()
+
+    with TraceStore(path) as store:
+        assert sum(segment.count for segment in store._segments) == 251
+
+        for filters in FILTERS:
+            found = [entry.timestamp_ns for entry in store.query(**filters)]
+            assert found == _expected(written, **filters)
+
+
+def test_store_without_postings(tmp_path):
+    path = str(tmp_path / 'run.trace')
+    writer, written = _write(path, 300, 50)
+    writer.close()
+    os.remove(path + '.post')
+
+    with TraceStore(path) as store:
+        assert store._segments == []
+        found = [entry.timestamp_ns for entry in store.query(func='mod.*')]
+        assert found == _expected(written, func='mod.*')
+
+    # a writer opened on it indexes what is already there
+    TraceStoreWriter(path).close()
+
+    with TraceStore(path) as store:
+        assert sum(segment.count for segment in store._segments) == 300
+
+
+def test_truncated_data_stops_query(tmp_path):
+    path = str(tmp_path / 'run.trace')
+    writer, written = _write(path, 100, 100)
+    writer.close()
+
+    with TraceStore(path) as store:
+        last = list(store.entries())[-1]
+
+    with open(path, 'r+b') as f:
+        f.truncate(last.offset)
+
+    with TraceStore(path) as store:
+        assert len(list(store.query())) == 99
+
+
+def test_handler_top_and_histogram(tmp_path):
+    path = str(tmp_path / 'run.trace')
+    handler = TraceStoreHandler(path, flush_every=10)
+    rand = random.Random(5)
+
+    for n in range(55):
+        handler.handle(
+            logging.LogRecord(
+                'x',
+                10,
+                'f',
+                1,
+                _record('mod.alpha', 1, 1, n, rand.randint(1, 10 ** 6)),
+                (),
+                None
+            )
+        )
+
+    handler.close()
+
+    with TraceStore(path) as store:
+        assert len(store) == 55
+        assert len(store._segments) == 6
+        durations = sorted((e.duration_ns for e in store.query()), reverse=True)
+        assert [e.duration_ns for e in store.top(5)] == durations[:5]
+        assert sum(store.histogram().values()) == 55
+        assert _INDEX_ENTRY.size == 48
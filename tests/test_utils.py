@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import logging
+import linecache
+
+from angry_debugger import log_it
+from angry_debugger.utils import (
+    PACKAGE_PATH,
+    format_exception,
+    func_arg_string,
+    format_ns
+)
+
+logger = logging.getLogger(__name__)
+
+
+@log_it
+def explode(value):
+    raise ValueError(value)
+
+
+def _exc_info(func, *args):
+    try:
+        func(*args)
+    except BaseException:
+        return sys.exc_info()
+
+    raise AssertionError('nothing was raised')
+
+
+def test_package_frames_are_dropped(captured):
+    text = ''.join(format_exception(*_exc_info(explode, 'boom')))
+
+    assert PACKAGE_PATH not in text
+    assert 'in explode' in text
+    assert 'in _exc_info' in text
+    assert text.endswith('ValueError: boom\n')
+
+
+def test_package_sources_are_never_read(captured, monkeypatch):
+    exc_info = _exc_info(explode, 'boom')
+    read = []
+    getline = linecache.getline
+
+    def recording_getline(filename, *args, **kwargs):
+        read.append(filename)
+        return getline(filename, *args, **kwargs)
+
+    monkeypatch.setattr(linecache, 'getline', recording_getline)
+    format_exception(*exc_info)
+
+    assert read
+    assert not [filename for filename in read if PACKAGE_PATH in filename]
+
+
+def test_cause_and_context():
+    def cause():
+        try:
+            raise KeyError('inner')
+        except KeyError as err:
+            raise ValueError('outer') from err
+
+    def context():
+        try:
+            raise KeyError('inner')
+        except KeyError:
+            raise ValueError('outer')
+
+    text = ''.join(format_exception(*_exc_info(cause)))
+    assert 'direct cause' in text
+    assert text.index('KeyError') < text.index('ValueError: outer')
+
+    text = ''.join(format_exception(*_exc_info(context)))
+    assert 'During handling' in text
+
+
+def test_exception_chain_with_a_cycle():
+    first = ValueError('first')
+    second = KeyError('second')
+    first.__context__ = second
+    second.__context__ = first
+
+    text = ''.join(format_exception(ValueError, first, None))
+    assert text.count('ValueError') == 1
+    assert text.count('KeyError') == 1
+
+    first.__cause__ = first
+    text = ''.join(format_exception(ValueError, first, None))
+    assert text.count('ValueError') == 1
+
+
+def test_func_arg_string():
+    def func(self, a, b=2):
+        pass
+
+    assert func_arg_string(func, (object(), 1), {'b': 'x'}) == "(a=1, b='x')"
+
+
+def test_format_ns():
+    assert format_ns(500) == '500ns'
+    assert format_ns(2500) == '2.50us'
+    assert format_ns(2500000) == '2.50ms'
+    assert format_ns(3 * 10 ** 9) == '3.00s'
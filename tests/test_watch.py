@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import pickle
+import logging
+import threading
+
+import pytest
+
+import angry_debugger
+
+from conftest import ListHandler
+
+logger = logging.getLogger(__name__)
+
+
+class Holder(object):
+    counter = angry_debugger.watch(0)
+    items = angry_debugger.watch(factory=list, mutations=True)
+    mapping = angry_debugger.watch(factory=dict, mutations=True)
+    tags = angry_debugger.watch(factory=set, mutations=True)
+
+
+class Slotted(object):
+    __slots__ = ('_items',)
+    items = angry_debugger.watch(factory=list, mutations=True)
+
+
+@pytest.fixture(autouse=True)
+def clean_watch_stats():
+    angry_debugger.reset_watch_stats()
+    yield
+    angry_debugger.reset_watch_stats()
+
+
+def _stats(name):
+    return angry_debugger.get_watch_stats()[__name__ + '.' + name]
+
+
+def _messages(handler):
+    return [msg for msg in handler.messages if isinstance(msg, str)]
+
+
+def test_values_are_kept_per_instance():
+    a = Holder()
+    b = Holder()
+
+    a.counter = 5
+    assert a.counter == 5
+    assert b.counter == 0
+
+    a.items.append(1)
+    assert a.items == [1]
+    assert b.items == []
+
+
+def test_counts_without_logging():
+    holder = Holder()
+    holder.counter = 1
+    holder.counter += 1
+
+    stats = _stats('Holder.counter')
+    assert stats.sets == 2
+    assert stats.gets == 1
+    assert not stats.shared
+
+    thread = threading.Thread(target=lambda: holder.counter)
+    thread.start()
+    thread.join()
+    assert stats.shared
+
+
+def test_mutations_are_logged(attach):
+    handler = attach(
+        ListHandler(),
+        angry_debugger.LEVEL_CALL_FROM | angry_debugger.LEVEL_CALL_TO
+    )
+    holder = Holder()
+
+    holder.items = [1, 2]
+    holder.items.append(3)
+    holder.items[0] = 9
+    del holder.items[1]
+    holder.mapping['a'] = 1
+    holder.mapping.update(b=2)
+    holder.tags.add('x')
+    holder.tags |= {'y'}
+
+    assert holder.items == [9, 3]
+    assert holder.mapping == {'a': 1, 'b': 2}
+    assert holder.tags == {'x', 'y'}
+
+    text = '\n'.join(_messages(handler))
+    assert 'attribute set: {0}.Holder.items = [1, 2]'.format(__name__) in text
+    assert 'Holder.items.append(3)' in text
+    assert 'Holder.items.__setitem__(0, 9)' in text
+    assert 'Holder.items.__delitem__(1)' in text
+    assert "Holder.mapping.__setitem__('a', 1)" in text
+    assert "Holder.tags.add('x')" in text
+    assert 'Holder.tags.__ior__' in text
+    assert 'test_mutations_are_logged' in text
+
+    assert _stats('Holder.items').mutations == 3
+    assert _stats('Holder.mapping').mutations == 2
+    assert _stats('Holder.tags').mutations == 2
+
+
+def test_assigned_container_is_copied():
+    holder = Holder()
+    original = [1]
+    holder.items = original
+    holder.items.append(2)
+
+    assert original == [1]
+    assert type(holder.items) is not list
+    assert isinstance(holder.items, list)
+
+
+def test_proxies_copy_and_pickle_as_builtins():
+    holder = Holder()
+    holder.items.append(1)
+    holder.mapping['a'] = 1
+    holder.tags.add(1)
+
+    for value, kind in (
+        (holder.items, list),
+        (holder.mapping, dict),
+        (holder.tags, set)
+    ):
+        assert type(copy.copy(value)) is kind
+        assert type(pickle.loads(pickle.dumps(value))) is kind
+        assert pickle.loads(pickle.dumps(value)) == value
+
+
+def test_slots():
+    slotted = Slotted()
+    slotted.items.append(1)
+
+    assert slotted._items == [1]
+    assert not hasattr(slotted, '__dict__')
+    assert _stats('Slotted.items').mutations == 1